@@ -0,0 +1,274 @@
+import fnmatch
+import gc
+import os
+import time
+import tracemalloc
+from collections import defaultdict, deque
+
+import numpy as np
+
+
+class AllocationMonitor:
+    # 按帧统计内存分配和垃圾回收，默认关闭，两个游戏的主循环和 bench.py 共用
+    # 用法与 FrameProfiler 相同：每帧开头 begin_frame()，每个阶段结束时 lap("阶段名")，帧末 end_frame()
+    # 也可以挂到 FrameProfiler.monitor 上，跟着性能分析的阶段一起统计
+    #
+    # 每个阶段的分配量是 tracemalloc 在这个阶段里的内存高水位增量，即阶段内临时对象最多占用的内存；
+    # 一帧的分配量是各阶段之和。分配一个对象马上释放、反复多次只按一个对象计，所以这是下限，
+    # 但热循环里完全不分配时一定是 0
+    #
+    # 分配来自哪里只能抽样看：每隔 snapshot_every 帧，在帧首和每次 lap() 时各拍一次快照，
+    # 相邻两次快照按调用栈（depth 层）比较，增加的内存记到这个阶段的这个调用位置上，减少的记为释放。
+    # 快照只看得到两个时刻之间的净变化，阶段内分配又释放的临时对象看不到，需要时把阶段拆细；
+    # 拍快照很慢，抽样帧的耗时不能参考，但快照本身不计入分配量。
+    # 帧首和帧末快照的差就是这一帧结束时多留下的内存（对象增长、泄漏）
+    # 垃圾回收通过 gc.callbacks 统计次数、各代和停顿时间；回调发生时还不知道阶段名，
+    # 先记下来，到下一次 lap() 时记到这个阶段上，最近的 gc_log 条记录保存在 gc_events 里
+    def __init__(self, budget=None, capacity=4096, snapshot_every=60, warmup=0, depth=1, gc_log=256):
+        self.budget = budget  # 每帧分配预算（字节），None 表示不检查
+        self.capacity = capacity
+        self.snapshot_every = snapshot_every  # 0 表示不拍快照
+        self.warmup = warmup  # 开头这么多帧（加载字体、缓存等）不计入统计
+        self.depth = depth  # 快照里每次分配保留的调用栈层数
+        self.enabled = False
+        self.allocated = np.zeros(capacity, dtype=np.int64)  # 每帧分配量（字节）
+        self.retained = np.zeros(capacity, dtype=np.int64)  # 每帧结束时比开始时多占用的内存
+        self.collections = np.zeros(capacity, dtype=np.int32)  # 每帧垃圾回收次数
+        self.pauses = np.zeros(capacity)  # 每帧垃圾回收停顿（秒）
+        self.count = 0  # 已统计的帧数（不含预热帧，可能超过 capacity）
+        self.frames = 0  # 经过的帧数（含预热帧）
+        self.over_budget = 0  # 分配量超出预算的帧数
+        self.worst = (0, -1)  # (最大单帧分配量, 帧号)
+        self.phase_bytes = defaultdict(int)  # 阶段 -> 累计分配量
+        self.phase_peak = defaultdict(int)  # 阶段 -> 最大单帧分配量
+        self.phase_collections = defaultdict(int)  # 阶段 -> 垃圾回收次数
+        self.phase_pause = defaultdict(float)  # 阶段 -> 垃圾回收停顿（秒）
+        self.generations = [0, 0, 0]  # 各代垃圾回收次数
+        self.gc_events = deque(maxlen=gc_log)  # (帧号, 阶段, 代, 停顿秒数)
+        self.sites = defaultdict(lambda: [0, 0])  # 调用位置 -> [帧末多留下的字节, 多留下的对象数]
+        # (阶段, 调用位置) -> [阶段内增加的字节, 增加的对象数, 阶段内释放的字节]，只统计抽样帧
+        self.phase_sites = defaultdict(lambda: [0, 0, 0])
+        self.sampled = 0  # 拍过快照的帧数
+        self._filters = (tracemalloc.Filter(False, tracemalloc.__file__),
+                         tracemalloc.Filter(False, __file__))
+        self._started_tracing = False
+        self._in_frame = False
+        self._mark = 0
+        self._frame_start = 0
+        self._frame_allocated = 0
+        self._frame_phases = defaultdict(int)
+        self._frame_collections = 0
+        self._frame_pause = 0.0
+        self._pending_gc = []  # 上次 lap() 以来的 (代, 停顿秒数)
+        self._gc_start = 0.0
+        self._snapshot = None  # 抽样帧帧首的快照
+        self._lap_snapshot = None  # 抽样帧上一次 lap() 的快照
+
+    def start(self):
+        if self.enabled:
+            return
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.depth)
+            self._started_tracing = True
+        # 过滤器第一次匹配时会编译通配符，先编译好，免得编译结果被算成第一帧多留下的内存
+        for trace_filter in self._filters:
+            fnmatch.fnmatch(trace_filter.filename_pattern, trace_filter.filename_pattern)
+        gc.callbacks.append(self._on_gc)
+        self.enabled = True
+
+    def _reset_mark(self):
+        # 重设高水位，作为下一个阶段的起点
+        # get_traced_memory() 返回的元组和整数会抬高高水位，所以起点取第二次读到的高水位，
+        # 它已经包含第一次调用的临时对象，空转的阶段因此正好是 0
+        tracemalloc.reset_peak()
+        tracemalloc.get_traced_memory()
+        self._mark = tracemalloc.get_traced_memory()[1]
+
+    def stop(self):
+        if not self.enabled:
+            return
+        gc.callbacks.remove(self._on_gc)
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        self.enabled = False
+        self._in_frame = False
+        self._snapshot = self._lap_snapshot = None
+
+    def _on_gc(self, phase, info):
+        if phase == "start":
+            self._gc_start = time.perf_counter()
+            return
+        pause = time.perf_counter() - self._gc_start
+        if self._in_frame and self.frames >= self.warmup:
+            self._frame_pause += pause
+            self._frame_collections += 1
+            self._pending_gc.append((info["generation"], pause))
+            self.generations[info["generation"]] += 1
+
+    def _take_snapshot(self):
+        return tracemalloc.take_snapshot().filter_traces(self._filters)
+
+    @staticmethod
+    def _site(traceback):
+        # 最内层的调用在前："文件:行 <- 调用者文件:行 ..."
+        # 不用 os.path.basename()：它在 posixpath 里分配的字符串会被当成下一个阶段的分配，本文件的分配已被过滤
+        return " <- ".join(f"{frame.filename.rsplit(os.sep, 1)[-1]}:{frame.lineno}"
+                           for frame in reversed(traceback))
+
+    def begin_frame(self):
+        if not self.enabled:
+            return
+        counting = self.frames >= self.warmup
+        if counting and self.snapshot_every and self.count % self.snapshot_every == 0:
+            # 先拍快照再记起点，快照本身占用的内存不算进这一帧
+            self._snapshot = self._lap_snapshot = self._take_snapshot()
+        self._frame_allocated = 0
+        self._frame_phases.clear()
+        self._frame_collections = 0
+        self._frame_pause = 0.0
+        self._pending_gc.clear()
+        self._in_frame = True
+        self._reset_mark()
+        self._frame_start = self._mark
+
+    def lap(self, phase):
+        # 把上一次 lap 以来的分配高水位和垃圾回收记到 phase 上；抽样帧还按调用位置记下这段的内存变化
+        if not self._in_frame:
+            return
+        allocated = max(0, tracemalloc.get_traced_memory()[1] - self._mark)
+        self._frame_allocated += allocated
+        self._frame_phases[phase] += allocated
+        if self._pending_gc:
+            for generation, pause in self._pending_gc:
+                self.phase_collections[phase] += 1
+                self.phase_pause[phase] += pause
+                self.gc_events.append((self.frames, phase, generation, pause))
+            self._pending_gc.clear()
+        if self._lap_snapshot is not None:
+            snapshot = self._take_snapshot()
+            for stat in snapshot.compare_to(self._lap_snapshot, "traceback"):
+                if stat.size_diff > 0:
+                    site = self.phase_sites[(phase, self._site(stat.traceback))]
+                    site[0] += stat.size_diff
+                    site[1] += stat.count_diff
+                elif stat.size_diff < 0:
+                    self.phase_sites[(phase, self._site(stat.traceback))][2] -= stat.size_diff
+            self._lap_snapshot = snapshot
+        # 快照和上面的统计占用的内存不算进下一个阶段
+        self._reset_mark()
+
+    def end_frame(self):
+        if not self._in_frame:
+            return
+        self.lap("other")
+        current, _ = tracemalloc.get_traced_memory()
+        self._in_frame = False
+        self.frames += 1
+        if self.frames <= self.warmup:
+            self._snapshot = self._lap_snapshot = None
+            return
+        allocated = self._frame_allocated
+        # 同一阶段在一帧里可以 lap 多次，按帧累加后再统计
+        for phase, phase_allocated in self._frame_phases.items():
+            self.phase_bytes[phase] += phase_allocated
+            self.phase_peak[phase] = max(self.phase_peak[phase], phase_allocated)
+        row = self.count % self.capacity
+        self.allocated[row] = allocated
+        self.retained[row] = current - self._frame_start
+        self.collections[row] = self._frame_collections
+        self.pauses[row] = self._frame_pause
+        if self.budget is not None and allocated > self.budget:
+            self.over_budget += 1
+        if allocated > self.worst[0]:
+            self.worst = (allocated, self.count)
+        self.count += 1
+        if self._snapshot is not None:
+            # 帧末的快照已经在 lap("other") 里拍好
+            for stat in self._lap_snapshot.compare_to(self._snapshot, "traceback"):
+                if stat.size_diff > 0:
+                    site = self.sites[self._site(stat.traceback)]
+                    site[0] += stat.size_diff
+                    site[1] += stat.count_diff
+            self._snapshot = self._lap_snapshot = None
+            self.sampled += 1
+
+    def _rows(self):
+        return np.arange(min(self.count, self.capacity))
+
+    def report(self, top=10):
+        # 汇总成可以写进 JSON 的字典；分配量单位为字节
+        rows = self._rows()
+        if len(rows) == 0:
+            return {"frames": 0}
+        allocated = self.allocated[rows]
+        p50, p95 = np.percentile(allocated, (50, 95)).tolist()
+        frames = len(rows)
+        phases = sorted(self.phase_bytes, key=self.phase_bytes.get, reverse=True)
+        sites = sorted(self.sites.items(), key=lambda item: item[1][0], reverse=True)[:top]
+        phase_sites = defaultdict(list)
+        for (phase, site), (size, objects, freed) in sorted(self.phase_sites.items(),
+                                                          key=lambda item: item[1][0], reverse=True):
+            if size and len(phase_sites[phase]) < top:
+                phase_sites[phase].append({"site": site, "bytes": size, "objects": objects,
+                                           "freed_bytes": freed})
+        return {
+            "frames": self.count,
+            "budget": self.budget,
+            "over_budget": self.over_budget,
+            "alloc_bytes_p50": p50,
+            "alloc_bytes_p95": p95,
+            "alloc_bytes_max": self.worst[0],
+            "worst_frame": self.worst[1] + self.warmup,
+            "retained_bytes_total": int(self.retained[rows].sum()),
+            "gc_collections": int(self.collections[rows].sum()),
+            "gc_per_1000_frames": float(self.collections[rows].sum() * 1000 / frames),
+            "gc_generations": list(self.generations),
+            "gc_pause_ms_max": float(self.pauses[rows].max() * 1000),
+            "gc_pause_ms_total": float(self.pauses[rows].sum() * 1000),
+            "phases": {phase: {"bytes_per_frame": self.phase_bytes[phase] / self.count,
+                               "bytes_max": self.phase_peak[phase],
+                               "gc_collections": self.phase_collections[phase],
+                               "gc_pause_ms": self.phase_pause[phase] * 1000,
+                               "sites": phase_sites[phase]}
+                       for phase in phases},
+            "gc_events": [{"frame": frame, "phase": phase, "generation": generation,
+                           "pause_ms": pause * 1000}
+                          for frame, phase, generation, pause in self.gc_events],
+            "sampled_frames": self.sampled,
+            "retained_by_site": [{"site": site, "bytes": size, "objects": objects}
+                                 for site, (size, objects) in sites],
+        }
+
+    def format_report(self, top=10):
+        report = self.report(top)
+        if not report["frames"]:
+            return "allocation monitor: no frames recorded"
+        budget = ""
+        if self.budget is not None:
+            budget = f", {report['over_budget']} over the {self.budget / 1024:.1f} KB budget"
+        lines = [
+            f"allocation per frame over {report['frames']} frames: "
+            f"p50 {report['alloc_bytes_p50'] / 1024:.1f} KB, p95 {report['alloc_bytes_p95'] / 1024:.1f} KB, "
+            f"max {report['alloc_bytes_max'] / 1024:.1f} KB (frame {report['worst_frame']}){budget}",
+            f"gc: {report['gc_collections']} collections ({report['gc_per_1000_frames']:.1f} per 1000 frames, "
+            f"gen0/1/2 {'/'.join(map(str, report['gc_generations']))}), "
+            f"max pause {report['gc_pause_ms_max']:.2f} ms, total {report['gc_pause_ms_total']:.1f} ms",
+            f"{'phase':<12}{'KB/frame':>10}{'max KB':>10}{'gc':>6}{'gc ms':>8}",
+        ]
+        for phase, stats in report["phases"].items():
+            lines.append(f"{phase:<12}{stats['bytes_per_frame'] / 1024:>10.2f}"
+                         f"{stats['bytes_max'] / 1024:>10.1f}{stats['gc_collections']:>6}"
+                         f"{stats['gc_pause_ms']:>8.2f}")
+        if any(stats["sites"] for stats in report["phases"].values()):
+            lines.append(f"allocated by phase and call site, {report['sampled_frames']} sampled frames "
+                         f"(net change between laps):")
+            for phase, stats in report["phases"].items():
+                for site in stats["sites"][:3]:
+                    lines.append(f"  {phase:<10}{site['site']:<40}{site['bytes'] / 1024:>10.1f} KB "
+                                 f"{site['objects']:>8} objects {site['freed_bytes'] / 1024:>8.1f} KB freed")
+        if report["retained_by_site"]:
+            lines.append(f"retained at frame end, {report['sampled_frames']} sampled frames:")
+            for site in report["retained_by_site"]:
+                lines.append(f"  {site['site']:<32}{site['bytes'] / 1024:>10.1f} KB {site['objects']:>8} objects")
+        return "\n".join(lines)
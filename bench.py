@@ -0,0 +1,413 @@
+import os
+
+# 基准测试在 SDL 的虚拟驱动下运行，不开窗口也不出声
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import argparse
+import json
+import math
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pygame
+
+import ddg
+import te
+from alloc_monitor import AllocationMonitor
+from san_effect import SAN_THRESHOLD, SanEffect
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(ROOT, "bench_baseline.json")
+STARTUP_MODULES = ("ddg", "te")
+
+
+def ddg_enemy_at_edge(game):
+    # 在屏幕边缘补充一个敌人，保证压力场景里的敌人数量不变
+    rng = game.rng
+    if rng.random() < 0.5:
+        x, y = rng.choice((0, ddg.SCREEN_WIDTH)), rng.randint(0, ddg.SCREEN_HEIGHT)
+    else:
+        x, y = rng.randint(0, ddg.SCREEN_WIDTH), rng.choice((0, ddg.SCREEN_HEIGHT))
+    return ddg.Enemy(x, y, game.get_ticks)
+
+
+def run_ddg(enemies, frames, seed, storm=0, world_size=None, turn_every=30, san_sweep=False, monitor=None):
+    # 脚本输入：每 turn_every 帧换一个移动方向，每10帧朝最近的敌人开一枪，弹夹空了立即装满
+    # storm > 0 时每帧再从玩家位置朝四周扇形发射 storm 颗子弹
+    # world_size 为大地图模式，敌人分布在整张地图上，不再补充
+    # san_sweep 时玩家的 san 值从阈值逐帧降到0，每帧绘制后做 san 值后处理，经过每一档各一次
+    # 游戏时间按 FPS 逐帧推进，与机器快慢无关
+    # monitor 为 AllocationMonitor 时按帧和阶段统计内存分配
+    screen = ddg.init_pygame()
+    game = ddg.Game(enemies, seed, 0, world_size)
+    game.profiler = monitor
+    player = game.player
+    bullet_types = list(ddg.Bullet.DAMAGE_TABLE)
+    directions = [(1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1), (0, -1), (1, -1)]
+    san_effect = SanEffect() if san_sweep else None
+    frame_times = []
+    for frame in range(frames):
+        start = time.perf_counter()
+        if monitor is not None:
+            monitor.begin_frame()
+        if san_effect is not None:
+            player.san = SAN_THRESHOLD - 1 - frame * SAN_THRESHOLD // frames
+        dx, dy = directions[frame // turn_every % len(directions)]
+        game.update(dx, dy, frame * 1000 // ddg.FPS)
+        if frame % 10 == 0:
+            if not player.bullets:
+                player.reload()
+            if game.enemies:
+                target = min(game.enemies, key=lambda e: (e.x - player.x) ** 2 + (e.y - player.y) ** 2)
+                game.shoot_at(target.x, target.y)
+        for k in range(storm):
+            angle = 2 * math.pi * k / storm + frame * 0.1
+            game.active_bullets.append(ddg.Bullet.create_active(
+                player.x, player.y, player.x + math.cos(angle), player.y + math.sin(angle),
+                bullet_types[k % len(bullet_types)]))
+        while world_size is None and len(game.enemies) < enemies:
+            game.enemies.append(ddg_enemy_at_edge(game))
+        if monitor is not None:
+            monitor.lap("input")
+        game.draw(screen, (ddg.SCREEN_WIDTH // 2, ddg.SCREEN_HEIGHT // 2))
+        if monitor is not None:
+            monitor.lap("draw")
+        if san_effect is not None:
+            san_effect.apply(screen, player.san, game.time)
+            if monitor is not None:
+                monitor.lap("post")
+        if monitor is not None:
+            monitor.end_frame()
+        frame_times.append(time.perf_counter() - start)
+    extra = {"bullets": len(game.active_bullets), "near_enemies": len(game.enemies)}
+    if san_effect is not None:
+        extra["san_band_builds"] = san_effect.builds
+    return frames, frame_times, extra
+
+
+def te_roster(warriors):
+    return (te.DEFAULT_ROSTER * math.ceil(warriors / len(te.DEFAULT_ROSTER)))[:warriors]
+
+
+def run_te(warriors, frames, seed, speed=8, monitor=None):
+    # 按倍速逐显示帧推进并绘制；Boss 血量设得很高，保证整段测试都在对局中
+    # 脚本输入：每60帧朝旋转的方向发射一轮飞弹
+    te.DEBUG_LOG = False
+    screen = te.init_pygame()
+    world = te.World(roster=te_roster(warriors), seed=seed)
+    world.boss.health = 10 ** 9
+    world.profiler = monitor
+    scheduler = te.SimScheduler(speed)
+    renderer = te.ArenaRenderer(world.geometry)
+    frame_times = []
+    for frame in range(frames):
+        start = time.perf_counter()
+        if monitor is not None:
+            monitor.begin_frame()
+        if frame % 60 == 0:
+            world.boss.energy += world.boss.volley_size * world.boss.missile_cost
+            world.fire_volley(frame * 0.37)
+        scheduler.run_frame(world)
+        renderer.draw(screen, world)
+        world.events.clear()
+        if monitor is not None:
+            monitor.lap("draw")
+            monitor.end_frame()
+        frame_times.append(time.perf_counter() - start)
+    return world.tick, frame_times, {"melody_waves": world.melody_wave_count}
+
+
+def run_te_long(ticks, seed, chunk=1000, monitor=None):
+    # 长时间无头对局：一名保守型战士很少收集音符，场上音符持续累积
+    # 每 chunk 个逻辑帧记为一"帧"，观察耗时是否随音符数量增长
+    # 不设 gunner：飞弹会打掉唯一的战士，对局提前结束；飞弹的开销由 run_te 的脚本齐射覆盖
+    te.DEBUG_LOG = False
+    world = te.World(roster=("conservative",), seed=seed)
+    world.boss.health = 10 ** 9
+    world.profiler = monitor
+    frame_times = []
+    while world.tick < ticks and not world.game_over:
+        start = time.perf_counter()
+        if monitor is not None:
+            monitor.begin_frame()
+        for _ in range(chunk):
+            world.step()
+        if monitor is not None:
+            monitor.end_frame()
+        frame_times.append(time.perf_counter() - start)
+    notes = sum(1 for note in world.wave.note_energies if not note.collected)
+    return world.tick, frame_times, {"notes": notes}
+
+
+# 场景名 -> (运行函数, 参数)
+SCENARIOS = {
+    "ddg-10": (run_ddg, {"enemies": 10, "frames": 600}),
+    "ddg-100": (run_ddg, {"enemies": 100, "frames": 200}),
+    "ddg-1000": (run_ddg, {"enemies": 1000, "frames": 20}),
+    "ddg-bullet-storm": (run_ddg, {"enemies": 50, "frames": 300, "storm": 32}),
+    # 250 屏大小的地图，敌人密度与一屏3个相同；每帧耗时应与 ddg-10 同一量级
+    "ddg-large-world": (run_ddg, {"enemies": 7500, "frames": 600, "world_size": (40000, 30000),
+                                  "turn_every": 240}),
+    # 与 ddg-10 相同，另加 san 值后处理；两者每帧耗时之差就是后处理的开销
+    "ddg-low-san": (run_ddg, {"enemies": 10, "frames": 600, "san_sweep": True}),
+    "te-x8-4": (run_te, {"warriors": 4, "frames": 600}),
+    "te-x8-100": (run_te, {"warriors": 100, "frames": 200}),
+    "te-x8-1000": (run_te, {"warriors": 1000, "frames": 40}),
+    "te-long-session": (run_te_long, {"ticks": 200000}),
+}
+
+
+def scenario_kwargs(name, scale):
+    run, kwargs = SCENARIOS[name]
+    kwargs = dict(kwargs)
+    for key in ("frames", "ticks"):
+        if key in kwargs:
+            kwargs[key] = max(1, int(kwargs[key] * scale))
+    return run, kwargs
+
+
+def run_scenario(job):
+    # 在独立进程里跑一个场景，峰值内存只包含这个场景
+    name, scale, seed = job
+    run, kwargs = scenario_kwargs(name, scale)
+    start = time.perf_counter()
+    ticks, frame_times, extra = run(seed=seed, **kwargs)
+    elapsed = time.perf_counter() - start
+    frame_ms = np.array(frame_times) * 1000
+    p50, p95, p99 = np.percentile(frame_ms, (50, 95, 99)).tolist()
+    return {
+        "name": name,
+        "ticks": ticks,
+        "seconds": elapsed,
+        "ticks_per_s": ticks / elapsed,
+        "frame_ms_p50": p50,
+        "frame_ms_p95": p95,
+        "frame_ms_p99": p99,
+        # Linux 上 ru_maxrss 的单位是 KB
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "extra": extra,
+    }
+
+
+def run_alloc(job):
+    # 在独立进程里开着 AllocationMonitor 再跑一遍场景，只看分配不看耗时（tracemalloc 会拖慢运行）
+    # 开头几帧要加载字体、建立缓存，不计入统计
+    name, scale, seed, budget = job
+    run, kwargs = scenario_kwargs(name, scale)
+    frames = kwargs.get("frames", kwargs.get("ticks", 0) // 1000)
+    monitor = AllocationMonitor(budget, snapshot_every=10, warmup=min(10, frames // 4))
+    monitor.start()
+    try:
+        run(seed=seed, monitor=monitor, **kwargs)
+    finally:
+        monitor.stop()
+    return monitor.report(top=5)
+
+
+def measure_startup(module, repeat):
+    # 在新的解释器里导入模块，返回 (导入耗时, 整个进程耗时) 的中位数（毫秒）
+    # 子进程不带 SDL 虚拟驱动，导入时如果去打开窗口或声音设备会直接反映在耗时上
+    env = {key: value for key, value in os.environ.items()
+           if key not in ("SDL_VIDEODRIVER", "SDL_AUDIODRIVER")}
+    code = f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+    imports, processes = [], []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, check=True,
+                                capture_output=True, text=True).stdout
+        processes.append(time.perf_counter() - start)
+        imports.append(float(output.split()[-1]))
+    return float(np.median(imports)) * 1000, float(np.median(processes)) * 1000
+
+
+# 参与回退判断的指标 -> 数值变大是否代表变差；p99 波动太大，只显示不判断
+METRICS = {
+    "ticks_per_s": False,
+    "frame_ms_p50": True,
+    "frame_ms_p95": True,
+    "peak_rss_mb": True,
+    "import_ms": True,
+}
+
+
+def median_result(runs):
+    # 同一场景重复运行多次，每个指标取中位数，减小机器抖动的影响
+    result = dict(runs[0])
+    for key in ("seconds", "ticks_per_s", "frame_ms_p50", "frame_ms_p95", "frame_ms_p99", "peak_rss_mb"):
+        result[key] = float(np.median([run[key] for run in runs]))
+    result["runs"] = len(runs)
+    return result
+
+
+def compare(results, baseline, tolerance):
+    # 返回 [(场景, 指标, 基线值, 当前值, 变化比例)]，只包含超出容差、变差的指标
+    regressions = []
+    for result in results:
+        base = baseline.get("scenarios", {}).get(result["name"])
+        if base is None:
+            continue
+        for metric, higher_is_worse in METRICS.items():
+            old, new = base.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if (change if higher_is_worse else -change) > tolerance:
+                regressions.append((result["name"], metric, old, new, change))
+    return regressions
+
+
+def machine_info():
+    return {"python": platform.python_version(), "platform": platform.platform(),
+            "processor": platform.processor(), "cpus": os.cpu_count(),
+            "pygame": pygame.version.ver, "numpy": np.__version__}
+
+
+def print_results(results, baseline):
+    scenarios = baseline.get("scenarios", {}) if baseline else {}
+    frames = [result for result in results if "ticks_per_s" in result]
+    startups = [result for result in results if "import_ms" in result]
+    if frames:
+        print(f"{'scenario':<18} {'ticks/s':>10} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+              f"{'peak MB':>8} {'vs base':>8}")
+    for result in frames:
+        base = scenarios.get(result["name"])
+        delta = ""
+        if base and base.get("ticks_per_s"):
+            delta = f"{(result['ticks_per_s'] / base['ticks_per_s'] - 1) * 100:+.0f}%"
+        print(f"{result['name']:<18} {result['ticks_per_s']:>10.0f} {result['frame_ms_p50']:>8.2f} "
+              f"{result['frame_ms_p95']:>8.2f} {result['frame_ms_p99']:>8.2f} "
+              f"{result['peak_rss_mb']:>8.1f} {delta:>8}")
+    if startups:
+        print(f"{'startup':<18} {'import ms':>10} {'process ms':>11} {'vs base':>8}")
+    for result in startups:
+        base = scenarios.get(result["name"])
+        delta = ""
+        if base and base.get("import_ms"):
+            delta = f"{(result['import_ms'] / base['import_ms'] - 1) * 100:+.0f}%"
+        print(f"{result['name']:<18} {result['import_ms']:>10.1f} {result['process_ms']:>11.1f} {delta:>8}")
+
+
+def print_alloc(results):
+    print(f"{'scenario':<18} {'p50 KB':>8} {'p95 KB':>8} {'max KB':>8} {'over':>6} "
+          f"{'gc/1kf':>7} {'gc max ms':>10}  top phase")
+    for result in results:
+        alloc = result["alloc"]
+        if not alloc["frames"]:
+            print(f"{result['name']:<18} (no frames)")
+            continue
+        phase = next(iter(alloc["phases"]), "")
+        over = alloc["over_budget"] if alloc["budget"] is not None else "-"
+        print(f"{result['name']:<18} {alloc['alloc_bytes_p50'] / 1024:>8.1f} "
+              f"{alloc['alloc_bytes_p95'] / 1024:>8.1f} {alloc['alloc_bytes_max'] / 1024:>8.1f} "
+              f"{over:>6} {alloc['gc_per_1000_frames']:>7.1f} {alloc['gc_pause_ms_max']:>10.2f}  {phase}")
+        for site in alloc["retained_by_site"][:3]:
+            print(f"{'':<20}retained {site['bytes'] / 1024:.1f} KB at {site['site']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="两个游戏的无头基准测试")
+    parser.add_argument("scenarios", nargs="*",
+                        help=f"要运行的场景，默认全部：{', '.join(SCENARIOS)}, startup（导入耗时）")
+    parser.add_argument("--scale", type=float, default=1.0, help="按比例缩放每个场景的帧数")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    parser.add_argument("--repeat", type=int, default=3, help="每个场景运行几次，指标取中位数")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="用于比较的基线 JSON")
+    parser.add_argument("--save-baseline", action="store_true", help="把本次结果写入基线文件")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="指标变差超过这个比例时判为性能回退")
+    parser.add_argument("--out", default=None, help="把本次结果写入该 JSON 文件")
+    parser.add_argument("--alloc", action="store_true",
+                        help="每个场景再开着 tracemalloc 跑一遍，报告每帧内存分配和垃圾回收")
+    parser.add_argument("--alloc-budget", type=int, default=None,
+                        help="每帧内存分配预算（字节），任何一帧超出时以退出码 1 结束；隐含 --alloc")
+    args = parser.parse_args()
+    alloc = args.alloc or args.alloc_budget is not None
+
+    names = args.scenarios or list(SCENARIOS) + ["startup"]
+    unknown = [name for name in names if name not in SCENARIOS and name != "startup"]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+
+    baseline = None
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("scale", 1.0) != args.scale:
+            print(f"warning: baseline was recorded with --scale {baseline.get('scale', 1.0)}")
+        if baseline.get("machine") != machine_info():
+            print("warning: baseline was recorded on a different machine or environment")
+
+    # 每次运行都用一个新的进程（spawn），避免互相影响内存峰值和缓存
+    results = []
+    with te.worker_pool(1, "spawn", maxtasksperchild=1) as pool:
+        for name in names:
+            if name == "startup":
+                continue
+            runs = [pool.apply(run_scenario, ((name, args.scale, args.seed),))
+                    for _ in range(max(1, args.repeat))]
+            result = median_result(runs)
+            if alloc:
+                result["alloc"] = pool.apply(run_alloc, ((name, args.scale, args.seed, args.alloc_budget),))
+            results.append(result)
+            print(f"  {name}: {result['ticks_per_s']:.0f} ticks/s in {result['seconds']:.1f}s",
+                  flush=True)
+    if "startup" in names:
+        for module in STARTUP_MODULES:
+            import_ms, process_ms = measure_startup(module, max(1, args.repeat))
+            results.append({"name": f"startup-{module}", "import_ms": import_ms, "process_ms": process_ms})
+            print(f"  startup-{module}: import {import_ms:.1f}ms", flush=True)
+
+    print()
+    print_results(results, baseline)
+    if alloc:
+        print()
+        print_alloc([result for result in results if "alloc" in result])
+    report = {"machine": machine_info(), "scale": args.scale, "seed": args.seed, "repeat": args.repeat,
+              "scenarios": {result["name"]: result for result in results}}
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        if baseline is None and os.path.exists(args.baseline):
+            with open(args.baseline, encoding="utf-8") as f:
+                # 只更新本次运行的场景，保留其余场景的基线
+                old = json.load(f)
+            old_scenarios = old.get("scenarios", {}) if old.get("scale", 1.0) == args.scale else {}
+            report["scenarios"] = {**old_scenarios, **report["scenarios"]}
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+        return
+
+    failed = False
+    if args.alloc_budget is not None:
+        print()
+        over = [result for result in results if result.get("alloc", {}).get("over_budget")]
+        for result in over:
+            alloc = result["alloc"]
+            print(f"OVER BUDGET {result['name']}: {alloc['over_budget']} of {alloc['frames']} frames "
+                  f"allocated more than {args.alloc_budget} bytes (max {alloc['alloc_bytes_max']})")
+        if not over:
+            print(f"All frames within the {args.alloc_budget} byte allocation budget")
+        failed = bool(over)
+    if baseline is not None:
+        regressions = compare(results, baseline, args.tolerance)
+        print()
+        if regressions:
+            for name, metric, old, new, change in regressions:
+                print(f"REGRESSION {name} {metric}: {old:.2f} -> {new:.2f} ({change * 100:+.0f}%)")
+            failed = True
+        else:
+            print(f"No regressions beyond {args.tolerance * 100:.0f}% against {args.baseline}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,20 +2,29 @@ import pygame
 import math
 import random
 import os
-
-# 初始化Pygame
-pygame.init()
+import time
+import hashlib
+from alloc_monitor import AllocationMonitor
+from frame_profiler import FrameProfiler
+from replay import Replay, dump_state, load_state, numbered_path
+from san_effect import SanEffect
+from telemetry import Telemetry
 
 # 常量定义
 SCREEN_WIDTH = 800
 SCREEN_HEIGHT = 600
-FPS = 144
+FPS = 72  # 主循环每帧推进一次逻辑，游戏速度按每秒72帧设计
 PLAYER_SIZE = 40
 ENEMY_SIZE = 30
 CROSSHAIR_SIZE = 20
 TITLE_FONT_SIZE = 64
 BUTTON_FONT_SIZE = 36
 TUTORIAL_FONT_SIZE = 24
+# 大地图模式（--world-size）按区块划分，只有玩家附近的区块完整模拟
+CHUNK_SIZE = 400
+ACTIVE_RADIUS = 2  # 玩家所在区块周围几圈区块完整模拟，要盖住整个屏幕
+COARSE_RADIUS = 4  # 再往外到这一圈的区块粗略模拟，更远的区块冻结
+COARSE_INTERVAL = 30  # 粗略模拟的区块每隔多少帧更新一次
 
 # 加载资源
 GAME_DIR = os.path.dirname(__file__)
@@ -44,6 +53,7 @@ BULLET_INFO = {
 }
 
 class Bullet:
+    bounds = (SCREEN_WIDTH, SCREEN_HEIGHT)  # 飞出这个范围就消失；大地图模式下为地图大小
     DAMAGE_TABLE = {
         "normal": {"enemy": -10, "player_health": -10, "player_san": 0},
         "holy": {"enemy": 40, "player_health": 10, "player_san": 20},
@@ -59,8 +69,10 @@ class Bullet:
         }[bullet_type]
 
     @classmethod
-    def create_active(cls, x, y, target_x, target_y, bullet_type):  # 用于发射的子弹
+    def create_active(cls, x, y, target_x, target_y, bullet_type, bounds=None):  # 用于发射的子弹
         bullet = cls(bullet_type)
+        if bounds is not None:
+            bullet.bounds = bounds
         bullet.x = x
         bullet.y = y
         dx = target_x - x
@@ -76,18 +88,24 @@ class Bullet:
     def update(self):
         self.x += self.dx
         self.y += self.dy
-        if (self.x < 0 or self.x > SCREEN_WIDTH or 
-            self.y < 0 or self.y > SCREEN_HEIGHT):
+        width, height = self.bounds
+        if (self.x < 0 or self.x > width or 
+            self.y < 0 or self.y > height):
             self.alive = False
 
-    def draw(self, screen):
-        pygame.draw.circle(screen, self.color, (int(self.x), int(self.y)), self.radius)
+    def draw(self, screen, offset=(0, 0)):
+        pygame.draw.circle(screen, self.color, (int(self.x - offset[0]), int(self.y - offset[1])), self.radius)
 
     def get_damage(self, target_type):
         return self.DAMAGE_TABLE[self.type][target_type]
 
 class Player:
-    def __init__(self):
+    # clock 返回当前毫秒数，Game 传入自己的时钟，使所有计时都可以复现；rng 用于生成弹夹里的子弹
+    bounds = (SCREEN_WIDTH, SCREEN_HEIGHT)  # 活动范围；大地图模式下为地图大小
+
+    def __init__(self, clock=pygame.time.get_ticks, rng=None):
+        self.clock = clock
+        self.rng = rng if rng is not None else random.Random()
         self.x = SCREEN_WIDTH // 2
         self.y = SCREEN_HEIGHT // 2
         self.health = 100
@@ -99,7 +117,7 @@ class Player:
                               PLAYER_SIZE, PLAYER_SIZE)
         self.speed = 5
         self.alive = True
-        self.last_san_decay = pygame.time.get_ticks()
+        self.last_san_decay = self.clock()
         self.san_decay_rate = 1000  # 每秒减少1点san值
         self.last_collision_time = 0
         self.collision_cooldown = 500  # 碰撞伤害冷却时间（毫秒）
@@ -118,14 +136,14 @@ class Player:
         self.bullets = []
         bullet_types = ["normal", "holy", "evil"]
         for _ in range(self.max_bullets):
-            self.bullets.append(Bullet(random.choice(bullet_types)))
+            self.bullets.append(Bullet(self.rng.choice(bullet_types)))
 
     def shoot(self, target_is_self):
         if self.reloading:  # 装填时不能射击
             return None
         if not self.bullets:
             # 记录提示显示时间
-            self.empty_mag_hint_time = pygame.time.get_ticks()
+            self.empty_mag_hint_time = self.clock()
             return None
         bullet = self.bullets.pop(0)
         if target_is_self:
@@ -133,13 +151,14 @@ class Player:
         return bullet
 
     def move(self, dx, dy):
-        self.x = max(PLAYER_SIZE//2, min(SCREEN_WIDTH - PLAYER_SIZE//2, self.x + dx))
-        self.y = max(PLAYER_SIZE//2, min(SCREEN_HEIGHT - PLAYER_SIZE//2, self.y + dy))
+        width, height = self.bounds
+        self.x = max(PLAYER_SIZE//2, min(width - PLAYER_SIZE//2, self.x + dx))
+        self.y = max(PLAYER_SIZE//2, min(height - PLAYER_SIZE//2, self.y + dy))
         self.rect.center = (self.x, self.y)
 
     def update(self):
         # 处理san值衰减
-        current_time = pygame.time.get_ticks()
+        current_time = self.clock()
         if current_time - self.last_san_decay >= self.san_decay_rate:
             self.san -= 1
             self.last_san_decay = current_time
@@ -156,7 +175,7 @@ class Player:
         self.san = min(100, max(0, self.san))
 
     def take_collision_damage(self):
-        current_time = pygame.time.get_ticks()
+        current_time = self.clock()
         if current_time - self.last_collision_time >= self.collision_cooldown:
             self.health -= 10
             self.last_collision_time = current_time
@@ -169,26 +188,27 @@ class Player:
         if dist != 0:
             self.x += (dx/dist) * self.knockback_speed
             self.y += (dy/dist) * self.knockback_speed
-        # 确保不会移出屏幕
-        self.x = max(PLAYER_SIZE//2, min(SCREEN_WIDTH - PLAYER_SIZE//2, self.x))
-        self.y = max(PLAYER_SIZE//2, min(SCREEN_HEIGHT - PLAYER_SIZE//2, self.y))
+        # 确保不会移出活动范围
+        width, height = self.bounds
+        self.x = max(PLAYER_SIZE//2, min(width - PLAYER_SIZE//2, self.x))
+        self.y = max(PLAYER_SIZE//2, min(height - PLAYER_SIZE//2, self.y))
         self.rect.center = (self.x, self.y)
 
     def start_reload(self):
         if not self.reloading:
             self.reloading = True
-            self.reload_start_time = pygame.time.get_ticks()
+            self.reload_start_time = self.clock()
             self.reload_bullets = []
             bullet_types = ["normal", "holy", "evil"]
             # 预生成所有要装填的子弹
-            self.bullets_to_reload = [Bullet(random.choice(bullet_types)) 
+            self.bullets_to_reload = [Bullet(self.rng.choice(bullet_types)) 
                                     for _ in range(self.max_bullets)]
 
     def update_reload(self):
         if not self.reloading:
             return
             
-        current_time = pygame.time.get_ticks()
+        current_time = self.clock()
         
         # 如果已经装填完所有子弹
         if len(self.reload_bullets) >= self.max_bullets:
@@ -210,13 +230,13 @@ class Player:
         while len(self.reload_bullets) < bullets_to_load and len(self.reload_bullets) < self.max_bullets:
             self.reload_bullets.append(self.bullets_to_reload[len(self.reload_bullets)])
 
-    def draw_reload_animation(self, screen):
+    def draw_reload_animation(self, screen, offset=(0, 0)):
         if not self.reloading:
             return
             
         # 计算第一颗子弹的位置
-        start_x = self.x - (self.max_bullets * 20) // 2  # 修改为总是显示最大数量的位置
-        y = self.y - self.reload_height
+        start_x = self.x - offset[0] - (self.max_bullets * 20) // 2  # 修改为总是显示最大数量的位置
+        y = self.y - offset[1] - self.reload_height
         
         # 先绘制未装填的位置（灰色）
         for i in range(self.max_bullets):
@@ -235,14 +255,17 @@ class Player:
         screen.blit(ammo_text, (10, 90))  # y坐标在san值(50)下方
 
         # 如果最近尝试空弹射击，显示提示
-        current_time = pygame.time.get_ticks()
+        current_time = self.clock()
         if current_time - self.empty_mag_hint_time < self.hint_duration:
             hint_text = font.render("Press R to reload", True, WHITE)
             text_width = hint_text.get_width()
             screen.blit(hint_text, (SCREEN_WIDTH//2 - text_width//2, SCREEN_HEIGHT - 100))
 
 class Enemy:
-    def __init__(self, x, y):
+    bounds = (SCREEN_WIDTH, SCREEN_HEIGHT)  # 活动范围；大地图模式下为地图大小
+
+    def __init__(self, x, y, clock=pygame.time.get_ticks):
+        self.clock = clock
         self.x = x
         self.y = y
         self.rect = pygame.Rect(x - ENEMY_SIZE//2, 
@@ -294,19 +317,46 @@ class Enemy:
         if dist != 0:
             self.x += (dx/dist) * self.knockback_speed
             self.y += (dy/dist) * self.knockback_speed
-        # 确保不会移出屏幕
-        self.x = max(ENEMY_SIZE//2, min(SCREEN_WIDTH - ENEMY_SIZE//2, self.x))
-        self.y = max(ENEMY_SIZE//2, min(SCREEN_HEIGHT - ENEMY_SIZE//2, self.y))
+        # 确保不会移出活动范围
+        width, height = self.bounds
+        self.x = max(ENEMY_SIZE//2, min(width - ENEMY_SIZE//2, self.x))
+        self.y = max(ENEMY_SIZE//2, min(height - ENEMY_SIZE//2, self.y))
         self.rect.center = (self.x, self.y)
 
-    def draw(self, screen):
+    def move_coarse(self, player_x, player_y, frames):
+        # 粗略模拟：一次走完 frames 帧的路程，不检查碰撞，不越过玩家
+        dx = player_x - self.x
+        dy = player_y - self.y
+        dist = math.sqrt(dx * dx + dy * dy)
+        step = min(dist, self.speed * frames)
+        if dist != 0:
+            self.x += dx / dist * step
+            self.y += dy / dist * step
+            self.rect.center = (self.x, self.y)
+
+    def freeze(self):
+        # 冻结区块里只保存恢复敌人所需的数据
+        return (self.x, self.y, self.health, self.last_collision_time)
+
+    @classmethod
+    def thaw(cls, record, clock, bounds):
+        x, y, health, last_collision_time = record
+        enemy = cls(x, y, clock)
+        enemy.bounds = bounds
+        enemy.health = health
+        enemy.last_collision_time = last_collision_time
+        return enemy
+
+    def draw(self, screen, offset=(0, 0)):
+        x = self.x - offset[0]
+        y = self.y - offset[1]
         # 绘制敌人
-        pygame.draw.circle(screen, BLUE, (self.x, self.y), ENEMY_SIZE//2)
+        pygame.draw.circle(screen, BLUE, (x, y), ENEMY_SIZE//2)
         
         # 绘制血量条
         bar_width = 40
         bar_height = 5
-        bar_pos = (self.x - bar_width//2, self.y - ENEMY_SIZE//2 - 10)
+        bar_pos = (x - bar_width//2, y - ENEMY_SIZE//2 - 10)
         # 血条背景
         pygame.draw.rect(screen, (60, 60, 60), 
                         (bar_pos[0], bar_pos[1], bar_width, bar_height))
@@ -322,7 +372,7 @@ class Enemy:
         return self.health <= 0
 
     def take_collision_damage(self):
-        current_time = pygame.time.get_ticks()
+        current_time = self.clock()
         if current_time - self.last_collision_time >= self.collision_cooldown:
             self.health -= 10
             self.last_collision_time = current_time
@@ -330,6 +380,15 @@ class Enemy:
             return self.health <= 0
         return False
 
+_FONTS = {}
+
+def get_font(size):
+    # 按字号缓存字体；游戏状态里不保存字体对象，关键帧可以直接序列化
+    font = _FONTS.get(size)
+    if font is None:
+        font = _FONTS[size] = pygame.font.Font(None, size)
+    return font
+
 class DamageNumber:
     def __init__(self, x, y, value, color):
         self.x = x
@@ -338,23 +397,22 @@ class DamageNumber:
         self.color = color
         self.life = 30  # 持续帧数
         self.speed = 2  # 向上飘动速度
-        self.font = pygame.font.Font(None, 24)
 
     def update(self):
         self.y -= self.speed
         self.life -= 1
         return self.life > 0
 
-    def draw(self, screen):
+    def draw(self, screen, offset=(0, 0)):
         # 根据生命值计算透明度
         alpha = int(255 * (self.life / 30))
-        text = self.font.render(f"{'+' if self.value > 0 else ''}{self.value}", True, self.color)
+        text = get_font(24).render(f"{'+' if self.value > 0 else ''}{self.value}", True, self.color)
         # 创建一个临时surface来支持透明度
         temp = pygame.Surface(text.get_size()).convert_alpha()
         temp.fill((0, 0, 0, 0))
         temp.blit(text, (0, 0))
         temp.set_alpha(alpha)
-        screen.blit(temp, (self.x, self.y))
+        screen.blit(temp, (self.x - offset[0], self.y - offset[1]))
 
 class Button:
     def __init__(self, x, y, width, height, text, font_size=BUTTON_FONT_SIZE):
@@ -498,9 +556,584 @@ def draw_bullet_info(screen):
         screen.blit(text, (x + 25, y))
         y += 25  # 每行之间的间距
 
-def main():
+class ChunkMap:
+    # 大地图按 CHUNK_SIZE 划分区块，按离玩家所在区块的圈数分三档模拟：
+    # active_radius 圈以内的敌人在 Game.enemies 里，和原来一样逐帧完整模拟；
+    # coarse_radius 圈以内的敌人按区块存在 coarse 里，每 coarse_interval 帧一次性走完这段路程，不检查碰撞；
+    # 更远区块的敌人冻结成压缩后的数据存在 frozen 里，玩家走近时再恢复
+    # 每帧的开销只和玩家附近的敌人数量有关，与地图大小和敌人总数无关
+    def __init__(self, width, height, chunk_size=CHUNK_SIZE, active_radius=ACTIVE_RADIUS,
+                 coarse_radius=COARSE_RADIUS, coarse_interval=COARSE_INTERVAL):
+        self.width = width
+        self.height = height
+        self.chunk_size = chunk_size
+        self.columns = max(1, math.ceil(width / chunk_size))
+        self.rows = max(1, math.ceil(height / chunk_size))
+        self.active_radius = active_radius
+        self.coarse_radius = coarse_radius
+        self.coarse_interval = coarse_interval
+        self.coarse = {}  # 区块 -> [Enemy, ...]
+        self.frozen = {}  # 区块 -> (敌人数, [dump_state() 压缩的一批 [Enemy.freeze(), ...], ...])
+        self.pending = {}  # 区块 -> 本次 stream() 里新冻结、还没压缩的 [Enemy.freeze(), ...]
+        self.frozen_count = 0  # 冻结的敌人总数
+        self.center = None  # 玩家所在区块
+
+    def chunk_of(self, x, y):
+        size = self.chunk_size
+        return (min(max(int(x // size), 0), self.columns - 1),
+                min(max(int(y // size), 0), self.rows - 1))
+
+    def distance(self, chunk):
+        # 与玩家所在区块相隔的圈数
+        return max(abs(chunk[0] - self.center[0]), abs(chunk[1] - self.center[1]))
+
+    def chunks_within(self, radius):
+        cx, cy = self.center
+        for x in range(max(0, cx - radius), min(self.columns, cx + radius + 1)):
+            for y in range(max(0, cy - radius), min(self.rows, cy + radius + 1)):
+                yield (x, y)
+
+    def populate(self, records):
+        # 开局时所有敌人先冻结，第一次 stream() 时恢复玩家附近的区块
+        chunks = {}
+        for record in records:
+            chunks.setdefault(self.chunk_of(record[0], record[1]), []).append(record)
+        for chunk, chunk_records in chunks.items():
+            self.frozen[chunk] = (len(chunk_records), [dump_state(chunk_records)])
+        self.frozen_count += len(records)
+
+    def freeze(self, chunk, enemies):
+        # 先攒在 pending 里，stream() 结束时 flush() 把每个区块压缩成一批追加上去，
+        # 已经冻结的批次不用解压重写
+        records = [enemy.freeze() for enemy in enemies]
+        self.pending.setdefault(chunk, []).extend(records)
+        self.frozen_count += len(records)
+
+    def flush(self):
+        for chunk, records in self.pending.items():
+            count, batches = self.frozen.get(chunk, (0, []))
+            self.frozen[chunk] = (count + len(records), batches + [dump_state(records)])
+        self.pending.clear()
+
+    def thaw(self, chunk, game):
+        _, batches = self.frozen.pop(chunk, (0, []))
+        records = [record for batch in batches for record in load_state(batch)]
+        records.extend(self.pending.pop(chunk, ()))
+        self.frozen_count -= len(records)
+        bounds = (self.width, self.height)
+        return [Enemy.thaw(record, game.get_ticks, bounds) for record in records]
+
+    def place(self, enemy, game):
+        # 按敌人所在区块放进对应的档位
+        chunk = self.chunk_of(enemy.x, enemy.y)
+        distance = self.distance(chunk)
+        if distance <= self.active_radius:
+            game.enemies.append(enemy)
+        elif distance <= self.coarse_radius:
+            self.coarse.setdefault(chunk, []).append(enemy)
+        else:
+            self.freeze(chunk, [enemy])
+
+    def stream(self, game):
+        # 每帧在敌人移动前调用：玩家换了区块时调整各区块的档位，到时间时推进粗略模拟的区块
+        player = game.player
+        chunk = self.chunk_of(player.x, player.y)
+        if chunk != self.center:
+            self.center = chunk
+            self.recenter(game)
+        elif game.frame % self.coarse_interval == 0:
+            self.update_coarse(game)
+        # 子弹离开完整模拟的区块就消失
+        active_bullets = game.active_bullets
+        if active_bullets:
+            limit = self.active_radius
+            cx, cy = self.center
+            size = self.chunk_size
+            active_bullets[:] = [bullet for bullet in active_bullets
+                                 if abs(int(bullet.x // size) - cx) <= limit
+                                 and abs(int(bullet.y // size) - cy) <= limit]
+        if self.pending:
+            self.flush()
+
+    def recenter(self, game):
+        # 远离玩家的粗略区块冻结，走近的冻结区块恢复成粗略区块，进入完整模拟范围的敌人交给 Game
+        for chunk in [chunk for chunk in self.coarse if self.distance(chunk) > self.coarse_radius]:
+            self.freeze(chunk, self.coarse.pop(chunk))
+        for chunk in self.chunks_within(self.coarse_radius):
+            if chunk in self.frozen or chunk in self.pending:
+                self.coarse.setdefault(chunk, []).extend(self.thaw(chunk, game))
+        for chunk in self.chunks_within(self.active_radius):
+            enemies = self.coarse.pop(chunk, None)
+            if enemies:
+                game.enemies.extend(enemies)
+        self.demote(game)
+
+    def demote(self, game):
+        # 被击退出完整模拟范围、或玩家走远后留下的敌人降为粗略模拟
+        limit = self.active_radius
+        leaving = [enemy for enemy in game.enemies
+                   if self.distance(self.chunk_of(enemy.x, enemy.y)) > limit]
+        if leaving:
+            game.enemies[:] = [enemy for enemy in game.enemies
+                               if self.distance(self.chunk_of(enemy.x, enemy.y)) <= limit]
+            for enemy in leaving:
+                self.place(enemy, game)
+
+    def update_coarse(self, game):
+        player = game.player
+        frames = self.coarse_interval
+        coarse = self.coarse
+        self.coarse = {}
+        for enemies in coarse.values():
+            for enemy in enemies:
+                enemy.move_coarse(player.x, player.y, frames)
+                self.place(enemy, game)
+        self.demote(game)
+
+    def enemy_count(self, game):
+        return len(game.enemies) + sum(map(len, self.coarse.values())) + self.frozen_count
+
+    def digest_data(self):
+        # 回放校验用：粗略区块里每个敌人的状态和冻结区块的数据
+        return ([(chunk, [enemy.freeze() for enemy in enemies]) for chunk, enemies in self.coarse.items()],
+                sorted(self.frozen.items()), self.center)
+
+class Camera:
+    # 大地图模式下视野跟随玩家，到地图边缘时停住；屏幕坐标 = 世界坐标 - offset
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+
+    def offset(self, x, y):
+        return (int(min(max(x - SCREEN_WIDTH // 2, 0), max(0, self.width - SCREEN_WIDTH))),
+                int(min(max(y - SCREEN_HEIGHT // 2, 0), max(0, self.height - SCREEN_HEIGHT))))
+
+class Game:
+    # 一局游戏的全部状态：update() 推进一帧，draw() 只负责绘制
+    # 输入（移动方向、射击、装填）由调用方传入，主循环和无头基准测试共用
+    # 每帧依次调用 update()、处理射击和装填、update_player()；
+    # 游戏时间 time（毫秒）只在 update() 和 update_player() 时由调用方传入，
+    # 随机数来自按 seed 初始化的 rng，相同的种子和输入总是得到相同的对局
+    # world_size=(宽, 高) 时为大地图模式：敌人分布在整张地图上，按区块流式模拟（ChunkMap），
+    # 视野跟随玩家（Camera）；None 时地图就是一个屏幕
+    def __init__(self, enemy_count=3, seed=None, start_time=0, world_size=None):
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.time = start_time
+        self.frame = 0
+        self.player = Player(self.get_ticks, self.rng)
+        self.chunks = None
+        self.camera = None
+        if world_size is None:
+            self.enemies = [Enemy(self.rng.randint(0, SCREEN_WIDTH), 
+                                  self.rng.randint(0, SCREEN_HEIGHT), self.get_ticks) 
+                            for _ in range(enemy_count)]
+        else:
+            width, height = world_size
+            self.player.bounds = world_size
+            self.player.x, self.player.y = width // 2, height // 2
+            self.player.rect.center = (self.player.x, self.player.y)
+            self.enemies = []
+            self.chunks = ChunkMap(width, height)
+            self.chunks.populate([(self.rng.randint(0, width), self.rng.randint(0, height), 100, 0)
+                                  for _ in range(enemy_count)])
+            self.camera = Camera(width, height)
+        self.active_bullets = []
+        self.damage_numbers = []
+        self.profiler = None  # 设置后 update() 按阶段把耗时记到 FrameProfiler 上
+        self.recorder = None  # 设置后把输入和关键帧录进这个 Replay
+        self.telemetry = None  # 设置后把射击、击杀等事件发给这个 Telemetry
+
+    def get_ticks(self):
+        # 玩家和敌人的计时都读这个时钟
+        return self.time
+
+    def camera_offset(self):
+        if self.camera is None:
+            return (0, 0)
+        return self.camera.offset(self.player.x, self.player.y)
+
+    def screen_to_world(self, pos):
+        ox, oy = self.camera_offset()
+        return (pos[0] + ox, pos[1] + oy)
+
+    def world_to_screen(self, pos):
+        ox, oy = self.camera_offset()
+        return (pos[0] - ox, pos[1] - oy)
+
+    def enemy_count(self):
+        # 包括粗略模拟和冻结区块里的敌人
+        if self.chunks is None:
+            return len(self.enemies)
+        return self.chunks.enemy_count(self)
+
+    def __getstate__(self):
+        # 关键帧里不保存表现层和录制相关的对象
+        state = self.__dict__.copy()
+        state['profiler'] = None
+        state['recorder'] = None
+        state['telemetry'] = None
+        return state
+
+    def save_state(self):
+        return dump_state(self)
+
+    @staticmethod
+    def restore_state(data):
+        return load_state(data)
+
+    def start_recording(self, replay):
+        # 从当前帧开始录制，立即保存第一个关键帧
+        self.recorder = replay
+        replay.add_keyframe(self.frame, self.save_state())
+
+    def finish_recording(self):
+        replay = self.recorder
+        replay.add_keyframe(self.frame, self.save_state())
+        self.recorder = None
+        return replay
+
+    def _record(self, item):
+        if self.recorder is not None:
+            self.recorder.record_input(self.frame, item)
+
+    def _emit(self, event, **fields):
+        if self.telemetry is not None:
+            self.telemetry.emit(event, frame=self.frame, **fields)
+
+    def state_digest(self):
+        # 回放校验用的状态摘要
+        player = self.player
+        data = (
+            self.frame, self.time, player.x, player.y, player.health, player.san,
+            [b.type for b in player.bullets], player.reloading,
+            [b.type for b in player.reload_bullets], player.last_san_decay,
+            [(e.x, e.y, e.health) for e in self.enemies],
+            [(b.x, b.y, b.type) for b in self.active_bullets],
+            len(self.damage_numbers), self.rng.getstate(),
+            self.chunks.digest_data() if self.chunks is not None else None,
+        )
+        return hashlib.sha1(repr(data).encode("utf-8")).hexdigest()
+
+    def _lap(self, phase):
+        if self.profiler is not None:
+            self.profiler.lap(phase)
+
+    def update(self, dx, dy, now=None):
+        # dx, dy 为本帧的移动方向（-1、0 或 1），now 为本帧的游戏时间（毫秒）
+        recorder = self.recorder
+        if recorder is not None and recorder.wants_keyframe(self.frame):
+            recorder.add_keyframe(self.frame, self.save_state())
+        if now is not None:
+            self.time = now
+        self._record(('update', self.time, dx, dy))
+        player = self.player
+        enemies = self.enemies
+        active_bullets = self.active_bullets
+        player.move(dx * player.speed, dy * player.speed)
+        self._lap("input")
+        
+        # 大地图模式下先按玩家位置调整各区块的模拟档位
+        if self.chunks is not None:
+            self.chunks.stream(self)
+        
+        # 更新敌人
+        for enemy in enemies:
+            enemy.move_towards_player(player.x, player.y, enemies)
+        self._lap("ai")
+        
+        # 更新子弹
+        for bullet in active_bullets[:]:
+            bullet.update()
+            if not bullet.alive:
+                active_bullets.remove(bullet)
+        
+        # 更新伤害数字
+        self.damage_numbers = [num for num in self.damage_numbers if num.update()]
+        self._lap("bullets")
+        
+        # 子弹碰撞检测
+        for bullet in active_bullets[:]:
+            bullet_rect = pygame.Rect(bullet.x - bullet.radius, 
+                                    bullet.y - bullet.radius,
+                                    bullet.radius * 2, 
+                                    bullet.radius * 2)
+            
+            for enemy in enemies[:]:
+                if enemy.rect.colliderect(bullet_rect):
+                    # 获取伤害值
+                    damage = bullet.get_damage("enemy")
+                    # 造成伤害并显示伤害数字
+                    if enemy.take_damage(bullet.type):
+                        enemies.remove(enemy)
+                        self._emit("kill", cause="bullet", bullet_type=bullet.type)
+                    self.damage_numbers.append(DamageNumber(
+                        enemy.x, enemy.y - 20, damage, RED))
+                    active_bullets.remove(bullet)
+                    break
+        
+        # 处理玩家和敌人的碰撞
+        for enemy in enemies[:]:
+            if player.rect.colliderect(enemy.rect):
+                # 造成伤害
+                player.take_collision_damage()
+                if enemy.take_collision_damage():
+                    enemies.remove(enemy)
+                    self._emit("kill", cause="collision")
+                    continue
+                
+                # 击退效果
+                player.apply_knockback(enemy.x, enemy.y)
+                enemy.apply_knockback(player.x, player.y)
+        self._lap("collision")
+        
+        # 更新装填动画
+        player.update_reload()
+        self._lap("player")
+
+    def shoot_at(self, target_x, target_y):
+        # 朝目标发射弹夹里的下一颗子弹
+        self._record(('shoot', target_x, target_y))
+        player = self.player
+        bullet = player.shoot(False)
+        if bullet:
+            self._emit("shot", bullet_type=bullet.type, target="enemy")
+            self.active_bullets.append(
+                Bullet.create_active(player.x, player.y, 
+                                     target_x, target_y, 
+                                     bullet.type, player.bounds))
+        return bullet
+
+    def shoot_self(self):
+        self._record(('shoot_self',))
+        player = self.player
+        health, san = player.health, player.san
+        bullet = player.shoot(True)
+        if bullet:
+            # 记录实际变化（血量和san值有上下限）
+            self._emit("shot", bullet_type=bullet.type, target="self",
+                       health_change=player.health - health, san_change=player.san - san)
+            health_change = bullet.get_damage("player_health")
+            san_change = bullet.get_damage("player_san")
+            # 显示血量变化
+            if health_change != 0:
+                self.damage_numbers.append(DamageNumber(
+                    player.x + 20, player.y - 20, 
+                    health_change, RED if health_change < 0 else GREEN))
+            # 显示san值变化
+            if san_change != 0:
+                self.damage_numbers.append(DamageNumber(
+                    player.x - 20, player.y - 20, 
+                    san_change, BLUE))
+        return bullet
+
+    def reload(self):
+        self._record(('reload',))
+        self.player.start_reload()
+
+    def update_player(self, now=None):
+        # 帧末更新玩家状态（san值衰减、死亡判定），本帧结束
+        if now is not None:
+            self.time = now
+        self._record(('player', self.time))
+        self.player.update()
+        self.frame += 1
+
+    def draw(self, screen, mouse_pos):
+        # mouse_pos 为屏幕坐标；游戏对象按镜头偏移画到屏幕上
+        player = self.player
+        offset = ox, oy = self.camera_offset()
+        screen.fill((50, 50, 50))  # 深灰色背景
+        
+        # 绘制网格（跟着地图滚动）
+        for x in range(-(ox % 50), SCREEN_WIDTH, 50):
+            pygame.draw.line(screen, (70, 70, 70), (x, 0), (x, SCREEN_HEIGHT))
+        for y in range(-(oy % 50), SCREEN_HEIGHT, 50):
+            pygame.draw.line(screen, (70, 70, 70), (0, y), (SCREEN_WIDTH, y))
+        
+        # 绘制玩家
+        pygame.draw.circle(screen, RED, (player.x - ox, player.y - oy), PLAYER_SIZE//2)
+        
+        # 绘制敌人
+        for enemy in self.enemies:
+            enemy.draw(screen, offset)
+        
+        # 绘制准星
+        mouse_x, mouse_y = mouse_pos
+        pygame.draw.circle(screen, WHITE, (mouse_x, mouse_y), CROSSHAIR_SIZE//2, 2)
+        pygame.draw.line(screen, WHITE, 
+                        (mouse_x - CROSSHAIR_SIZE//2, mouse_y),
+                        (mouse_x + CROSSHAIR_SIZE//2, mouse_y), 2)
+        pygame.draw.line(screen, WHITE,
+                        (mouse_x, mouse_y - CROSSHAIR_SIZE//2),
+                        (mouse_x, mouse_y + CROSSHAIR_SIZE//2), 2)
+        
+        # 绘制玩家状态
+        font = pygame.font.Font(None, 36)
+        health_text = font.render(f"Health: {player.health}", True, WHITE)
+        san_text = font.render(f"San: {player.san}", True, WHITE)
+        screen.blit(health_text, (10, 10))
+        screen.blit(san_text, (10, 50))
+        
+        # 大地图模式下显示各档区块里的敌人数量
+        if self.chunks is not None:
+            chunks = self.chunks
+            coarse = sum(map(len, chunks.coarse.values()))
+            world_text = get_font(24).render(
+                f"Chunk {chunks.center}  enemies: {len(self.enemies)} near, {coarse} coarse, "
+                f"{chunks.frozen_count} frozen", True, WHITE)
+            screen.blit(world_text, (10, 130))
+        
+        # 绘制装填动画
+        player.draw_reload_animation(screen, offset)
+        
+        # 显示弹药数量
+        player.draw_ammo_count(screen)
+        
+        # 绘制子弹
+        for bullet in self.active_bullets:
+            bullet.draw(screen, offset)
+        
+        # 绘制伤害数字
+        for num in self.damage_numbers:
+            num.draw(screen, offset)
+        
+        # 绘制子弹信息
+        draw_bullet_info(screen)
+
+PROFILE_PHASES = ("input", "ai", "bullets", "collision", "player", "events", "draw", "post", "flip", "wait")
+
+def init_pygame():
+    # 只初始化游戏用到的显示和字体，导入本模块不会打开窗口；游戏没有声音和手柄
+    # pygame.time.get_ticks() 在计时器启动前总是返回0，第一次 Clock.tick() 会启动计时器
+    pygame.display.init()
+    pygame.font.init()
+    pygame.time.Clock().tick()
     screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
     pygame.display.set_caption("Destiny Demon Gun")
+    return screen
+
+def apply_replay_input(game, item):
+    kind = item[0]
+    if kind == 'update':
+        game.update(item[2], item[3], item[1])
+    elif kind == 'shoot':
+        game.shoot_at(item[1], item[2])
+    elif kind == 'shoot_self':
+        game.shoot_self()
+    elif kind == 'reload':
+        game.reload()
+    elif kind == 'player':
+        game.update_player(item[1])
+
+def replay_advance(game, replay, frames):
+    # 按录下的输入推进 frames 帧，录像中最后一帧不完整时停在那一帧
+    target = game.frame + frames
+    while game.frame < target:
+        frame = game.frame
+        for item in replay.inputs_at(frame):
+            apply_replay_input(game, item)
+        if game.frame == frame:
+            break
+    return game
+
+def replay_seek(replay, frame):
+    # 从 frame 之前最近的关键帧恢复，再补上之后的输入，返回位于 frame 的新游戏
+    _, state = replay.keyframe_before(frame)
+    game = Game.restore_state(state)
+    return replay_advance(game, replay, frame - game.frame)
+
+def verify_replay(replay):
+    # 从头重放到结尾，与最后一个关键帧比较，返回 (是否一致, 帧数, 每秒帧数)
+    start = time.perf_counter()
+    game = replay_seek(replay, 0)
+    replay_advance(game, replay, replay.length - game.frame)
+    # 录像可能停在一帧的中间（暂停菜单退出等），补上这一帧已经录下的输入
+    for item in replay.inputs_at(game.frame):
+        apply_replay_input(game, item)
+    elapsed = time.perf_counter() - start
+    _, state = replay.final_keyframe
+    matched = game.state_digest() == Game.restore_state(state).state_digest()
+    return matched, game.frame, (game.frame / elapsed if elapsed > 0 else 0.0)
+
+def save_recording(game, path):
+    replay = game.finish_recording()
+    replay.save(path)
+    print(f"Saved replay ({replay.length} frames) to {path}")
+
+def view_replay(path):
+    # 回放查看器：空格暂停，左右方向键后退/前进10秒，Home/End 跳到开头/结尾
+    # 跳转时从最近的关键帧恢复再补上输入，不需要从头重放
+    replay = Replay.load(path, 'ddg')
+    screen = init_pygame()
+    clock = pygame.time.Clock()
+    game = replay_seek(replay, 0)
+    seek_frames = FPS * 10
+    san_effect = SanEffect()
+    target = (game.player.x, game.player.y)  # 准星画在最近一次射击的位置（世界坐标）
+    paused = False
+    running = True
+    while running:
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+            elif event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_SPACE:
+                    paused = not paused
+                elif event.key == pygame.K_LEFT:
+                    game = replay_seek(replay, max(0, game.frame - seek_frames))
+                elif event.key == pygame.K_RIGHT:
+                    game = replay_seek(replay, min(replay.length, game.frame + seek_frames))
+                elif event.key == pygame.K_HOME:
+                    game = replay_seek(replay, 0)
+                elif event.key == pygame.K_END:
+                    game = replay_seek(replay, replay.length)
+        
+        if not paused and game.frame < replay.length:
+            for item in replay.inputs_at(game.frame):
+                if item[0] == 'shoot':
+                    target = item[1:]
+            replay_advance(game, replay, 1)
+        
+        game.draw(screen, game.world_to_screen(target))
+        san_effect.apply(screen, game.player.san, game.time)
+        status = f"Replay {game.frame}/{replay.length}"
+        if paused:
+            status += "  PAUSED"
+        screen.blit(get_font(24).render(status, True, WHITE), (10, SCREEN_HEIGHT - 30))
+        pygame.display.flip()
+        clock.tick(FPS)
+    pygame.quit()
+
+def default_enemy_count(world_size):
+    # 原来的一屏3个敌人；大地图按同样的密度分布
+    if world_size is None:
+        return 3
+    return max(3, round(3 * world_size[0] * world_size[1] / (SCREEN_WIDTH * SCREEN_HEIGHT)))
+
+def parse_world_size(value):
+    width, height = (int(part) for part in value.lower().split("x"))
+    if width < SCREEN_WIDTH or height < SCREEN_HEIGHT:
+        raise ValueError(f"world must be at least {SCREEN_WIDTH}x{SCREEN_HEIGHT}")
+    return (width, height)
+
+def main(profile=False, profile_out=None, seed=None, record=None, telemetry_path=None,
+         alloc=False, alloc_budget=None, world_size=None, enemy_count=None, san_effect=True):
+    screen = init_pygame()
+    # F3 开关分阶段耗时统计和叠加层，F4 导出 CSV 和 Chrome trace
+    profiler = FrameProfiler(PROFILE_PHASES, enabled=profile)
+    # alloc 时按同样的阶段统计每帧内存分配和垃圾回收，退出时打印报告
+    monitor = None
+    if alloc or alloc_budget is not None:
+        monitor = profiler.monitor = AllocationMonitor(alloc_budget, warmup=FPS)
+        monitor.start()
+    # 设置了 record 时每局录一个回放，一局结束时保存
+    recordings = 0
+    telemetry = Telemetry(telemetry_path) if telemetry_path else None
+    if enemy_count is None:
+        enemy_count = default_enemy_count(world_size)
+    # san 值低时整个画面褪色、四角变暗、波动
+    post_effect = SanEffect() if san_effect else None
     
     running = True
     while running:
@@ -510,76 +1143,37 @@ def main():
             
         # 游戏主循环
         clock = pygame.time.Clock()
-        player = Player()
+        game = Game(enemy_count, seed, pygame.time.get_ticks(), world_size)
+        game.profiler = profiler
+        if record:
+            game.start_recording(Replay('ddg', {"seed": seed, "enemy_count": enemy_count,
+                                                "world_size": world_size}))
+        if telemetry is not None:
+            game.telemetry = telemetry
+            telemetry.begin_match("ddg", seed=seed, enemy_count=enemy_count, world_size=world_size)
+        player = game.player
         pygame.mouse.set_visible(False)
-        enemies = [Enemy(random.randint(0, SCREEN_WIDTH), 
-                        random.randint(0, SCREEN_HEIGHT)) 
-                  for _ in range(3)]
-        active_bullets = []
-        damage_numbers = []
         
         game_running = True
         while game_running:
+            profiler.begin_frame()
             # 处理输入
             keys = pygame.key.get_pressed()
-            dx = (keys[pygame.K_d] - keys[pygame.K_a]) * player.speed
-            dy = (keys[pygame.K_s] - keys[pygame.K_w]) * player.speed
-            player.move(dx, dy)
-            
-            # 更新敌人
-            for enemy in enemies:
-                enemy.move_towards_player(player.x, player.y, enemies)
-            
-            # 更新子弹
-            for bullet in active_bullets[:]:
-                bullet.update()
-                if not bullet.alive:
-                    active_bullets.remove(bullet)
-            
-            # 更新伤害数字
-            damage_numbers = [num for num in damage_numbers if num.update()]
-            
-            # 子弹碰撞检测
-            for bullet in active_bullets[:]:
-                bullet_rect = pygame.Rect(bullet.x - bullet.radius, 
-                                        bullet.y - bullet.radius,
-                                        bullet.radius * 2, 
-                                        bullet.radius * 2)
-                
-                for enemy in enemies[:]:
-                    if enemy.rect.colliderect(bullet_rect):
-                        # 获取伤害值
-                        damage = bullet.get_damage("enemy")
-                        # 造成伤害并显示伤害数字
-                        if enemy.take_damage(bullet.type):
-                            enemies.remove(enemy)
-                        damage_numbers.append(DamageNumber(
-                            enemy.x, enemy.y - 20, damage, RED))
-                        active_bullets.remove(bullet)
-                        break
-            
-            # 处理玩家和敌人的碰撞
-            for enemy in enemies[:]:
-                if player.rect.colliderect(enemy.rect):
-                    # 造成伤害
-                    player.take_collision_damage()
-                    if enemy.take_collision_damage():
-                        enemies.remove(enemy)
-                        continue
-                    
-                    # 击退效果
-                    player.apply_knockback(enemy.x, enemy.y)
-                    enemy.apply_knockback(player.x, player.y)
-            
-            # 更新装填动画
-            player.update_reload()
+            game.update(keys[pygame.K_d] - keys[pygame.K_a],
+                        keys[pygame.K_s] - keys[pygame.K_w], pygame.time.get_ticks())
             
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
                     game_running = False
                     running = False
                 elif event.type == pygame.KEYDOWN:
-                    if event.key == pygame.K_p:  # P键暂停
+                    if event.key == pygame.K_F3:  # F3键开关耗时统计
+                        profiler.toggle()
+                    elif event.key == pygame.K_F4:  # F4键导出耗时统计
+                        paths = profiler.export(
+                            profile_out or time.strftime("ddg-profile-%Y%m%d-%H%M%S"))
+                        print(f"Exported frame profile to {', '.join(paths)}")
+                    elif event.key == pygame.K_p:  # P键暂停
                         pygame.mouse.set_visible(True)
                         pause_result = show_pause_menu(screen)
                         if pause_result == "quit":
@@ -590,97 +1184,90 @@ def main():
                         elif pause_result == "resume":
                             pygame.mouse.set_visible(False)
                     elif event.key == pygame.K_r:  # R键装填
-                        player.start_reload()
+                        game.reload()
                 elif event.type == pygame.MOUSEBUTTONDOWN:
-                    mouse_x, mouse_y = pygame.mouse.get_pos()
+                    mouse_x, mouse_y = game.screen_to_world(pygame.mouse.get_pos())
                     if event.button == 1:  # 左键射击敌人
-                        bullet = player.shoot(False)
-                        if bullet:
-                            active_bullets.append(
-                                Bullet.create_active(player.x, player.y, 
-                                                  mouse_x, mouse_y, 
-                                                  bullet.type))
+                        game.shoot_at(mouse_x, mouse_y)
                     elif event.button == 3:  # 右键射击自己
-                        bullet = player.shoot(True)
-                        if bullet:
-                            health_change = bullet.get_damage("player_health")
-                            san_change = bullet.get_damage("player_san")
-                            # 显示血量变化
-                            if health_change != 0:
-                                damage_numbers.append(DamageNumber(
-                                    player.x + 20, player.y - 20, 
-                                    health_change, RED if health_change < 0 else GREEN))
-                            # 显示san值变化
-                            if san_change != 0:
-                                damage_numbers.append(DamageNumber(
-                                    player.x - 20, player.y - 20, 
-                                    san_change, BLUE))
+                        game.shoot_self()
+            profiler.lap("events")
             
             # 绘制
-            screen.fill((50, 50, 50))  # 深灰色背景
-            
-            # 绘制网格
-            for x in range(0, SCREEN_WIDTH, 50):
-                pygame.draw.line(screen, (70, 70, 70), (x, 0), (x, SCREEN_HEIGHT))
-            for y in range(0, SCREEN_HEIGHT, 50):
-                pygame.draw.line(screen, (70, 70, 70), (0, y), (SCREEN_WIDTH, y))
-            
-            # 绘制玩家
-            pygame.draw.circle(screen, RED, (player.x, player.y), PLAYER_SIZE//2)
-            
-            # 绘制敌人
-            for enemy in enemies:
-                enemy.draw(screen)
-            
-            # 绘制准星
-            mouse_x, mouse_y = pygame.mouse.get_pos()
-            pygame.draw.circle(screen, WHITE, (mouse_x, mouse_y), CROSSHAIR_SIZE//2, 2)
-            pygame.draw.line(screen, WHITE, 
-                            (mouse_x - CROSSHAIR_SIZE//2, mouse_y),
-                            (mouse_x + CROSSHAIR_SIZE//2, mouse_y), 2)
-            pygame.draw.line(screen, WHITE,
-                            (mouse_x, mouse_y - CROSSHAIR_SIZE//2),
-                            (mouse_x, mouse_y + CROSSHAIR_SIZE//2), 2)
-            
-            # 绘制玩家状态
-            font = pygame.font.Font(None, 36)
-            health_text = font.render(f"Health: {player.health}", True, WHITE)
-            san_text = font.render(f"San: {player.san}", True, WHITE)
-            screen.blit(health_text, (10, 10))
-            screen.blit(san_text, (10, 50))
-            
-            # 绘制装填动画
-            player.draw_reload_animation(screen)
-            
-            # 显示弹药数量
-            player.draw_ammo_count(screen)
-            
-            # 绘制子弹
-            for bullet in active_bullets:
-                bullet.draw(screen)
-            
-            # 绘制伤害数字
-            for num in damage_numbers:
-                num.draw(screen)
-            
-            # 绘制子弹信息
-            draw_bullet_info(screen)
-            
+            game.draw(screen, pygame.mouse.get_pos())
+            profiler.lap("draw")
+            if post_effect is not None:
+                post_effect.apply(screen, player.san, game.time)
+            profiler.lap("post")
+            profiler.draw_overlay(screen, (10, SCREEN_HEIGHT - 240))
+            profiler.lap("draw")
             pygame.display.flip()
+            profiler.lap("flip")
             clock.tick(FPS)
+            profiler.lap("wait")
 
             # 更新玩家状态
-            player.update()
+            game.update_player(pygame.time.get_ticks())
+            profiler.lap("player")
             if not player.alive:
                 pygame.mouse.set_visible(True)
                 if not show_game_over(screen):
                     game_running = False
                 break
-                
-            pygame.display.flip()
-            clock.tick(FPS)
+            profiler.end_frame()
+        
+        if record:
+            save_recording(game, numbered_path(record, recordings))
+            recordings += 1
+        if telemetry is not None:
+            player = game.player
+            telemetry.end_match(frame=game.frame, alive=player.alive, health=player.health,
+                                san=player.san, enemies_left=game.enemy_count())
     
+    if profile_out and profiler.count:
+        paths = profiler.export(profile_out)
+        print(f"Exported frame profile to {', '.join(paths)}")
+    if monitor is not None:
+        monitor.stop()
+        print(monitor.format_report())
+    if telemetry is not None:
+        telemetry.close()
     pygame.quit()
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser(description="Destiny Demon Gun")
+    parser.add_argument("--profile", action="store_true",
+                        help="启动时就打开分阶段耗时统计（游戏中按F3开关、F4导出）")
+    parser.add_argument("--profile-out", default=None,
+                        help="耗时统计导出文件名前缀，设置后退出时自动导出")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="随机种子，相同的种子和输入得到相同的对局")
+    parser.add_argument("--record", default=None,
+                        help="把每局游戏录成回放文件（多局时依次编号）")
+    parser.add_argument("--replay", default=None,
+                        help="播放回放文件")
+    parser.add_argument("--headless", action="store_true",
+                        help="与 --replay 一起使用：不开窗口，从头重放并校验结果")
+    parser.add_argument("--alloc", action="store_true",
+                        help="统计每帧的内存分配和垃圾回收（按性能分析的阶段），退出时打印报告")
+    parser.add_argument("--alloc-budget", type=int, default=None,
+                        help="每帧内存分配预算（字节），报告里统计超出预算的帧数；隐含 --alloc")
+    parser.add_argument("--telemetry", default=None,
+                        help="把射击、击杀等对局事件写入该文件（.jsonl 或 .db）")
+    parser.add_argument("--world-size", type=parse_world_size, default=None,
+                        help="大地图模式，地图大小如 16000x12000；只完整模拟玩家附近的区块")
+    parser.add_argument("--enemies", type=int, default=None,
+                        help="敌人数量，默认一屏3个，大地图按同样的密度分布")
+    parser.add_argument("--no-san-effect", action="store_true",
+                        help="关闭 san 值低时的画面褪色、暗角和波动")
+    args = parser.parse_args()
+    if args.replay:
+        if args.headless:
+            matched, frames, fps = verify_replay(Replay.load(args.replay, 'ddg'))
+            print(f"{'MATCHED' if matched else 'DIVERGED'} after {frames} frames ({fps:.0f} frames/s)")
+            raise SystemExit(0 if matched else 1)
+        view_replay(args.replay)
+    else:
+        main(args.profile, args.profile_out, args.seed, args.record, args.telemetry,
+             args.alloc, args.alloc_budget, args.world_size, args.enemies, not args.no_san_effect)
@@ -0,0 +1,1001 @@
+import argparse
+import math
+import multiprocessing
+import pickle
+import random
+import selectors
+import socket
+import struct
+import time
+import zlib
+from collections import deque
+
+import pygame
+
+import ddg
+from ddg import Bullet, Enemy, Player
+from san_effect import SanEffect
+
+# 服务端按游戏帧率推进，每 SNAPSHOT_EVERY 帧给每个客户端发一次状态快照
+TICK_RATE = ddg.FPS
+SNAPSHOT_EVERY = 2
+HISTORY = 256  # 服务端和客户端各保留最近多少个快照，用作增量的基准
+INPUT_REDUNDANCY = 8  # 每个输入包重复携带最近几条指令，丢包时服务端也能收到
+MAX_QUEUED = 4  # 服务端积压的指令超过这个数时一帧多执行几条，追上客户端
+IDLE_TIMEOUT = 5.0  # 客户端这么多秒没有消息就视为断开
+PROTOCOL_VERSION = 2
+DEFAULT_PORT = 5400
+
+# 消息类型（每个 UDP 包的第一个字节）
+# HELLO 带客户端的协议版本，版本不同时服务端回 VERSION 和自己的版本，不让它加入
+HELLO, WELCOME, FULL, INPUT, SNAPSHOT, BYE, VERSION = b"H", b"W", b"F", b"I", b"S", b"B", b"V"
+
+# 位置量化为 1/4 像素，16 位无符号整数，最大 16383.75 像素
+POSITION_SCALE = 4
+POSITION_BITS = 16
+SMALL_DIFF_BITS = 8  # 位置变化在 ±127 个量化单位以内时只发差值
+BULLET_CODES = {"normal": 0, "holy": 1, "evil": 2}
+BULLET_TYPES = {code: name for name, code in BULLET_CODES.items()}
+
+# 快照里的三类实体，每个字段为 (位宽, 是否为位置)；实体编号 16 位
+PLAYER_FIELDS = ((POSITION_BITS, True), (POSITION_BITS, True),
+                 (8, False), (8, False),  # 血量、san值
+                 (1, False), (1, False),  # 存活、正在装填
+                 (3, False), (12, False),  # 弹夹子弹数、弹夹里子弹类型（每颗2位）
+                 (3, False))  # 装填动画里已装好的子弹数
+ENEMY_FIELDS = ((POSITION_BITS, True), (POSITION_BITS, True), (8, False))  # 位置、血量
+BULLET_FIELDS = ((POSITION_BITS, True), (POSITION_BITS, True), (2, False), (1, False))  # 位置、类型、发射者
+SECTIONS = (("players", PLAYER_FIELDS), ("enemies", ENEMY_FIELDS), ("bullets", BULLET_FIELDS))
+
+# 输入指令：序号、移动方向、按键、瞄准点（世界坐标）
+COMMAND = struct.Struct("<IbbBhh")
+SHOOT, SHOOT_SELF, RELOAD = 1, 2, 4
+INPUT_HEADER = struct.Struct("<cIB")  # 类型、确认收到的快照、指令数
+# 快照头：类型、逻辑帧、基准帧在本帧之前多少帧（0 为完整快照）、状态校验、已执行的指令序号的低 16 位
+SNAPSHOT_HEADER = struct.Struct("<cIHIH")
+
+
+class BitWriter:
+    # 按位写入，低位在前
+    def __init__(self):
+        self.buffer = bytearray()
+        self.acc = 0
+        self.bits = 0
+
+    def write(self, value, width):
+        self.acc |= (value & ((1 << width) - 1)) << self.bits
+        self.bits += width
+        while self.bits >= 8:
+            self.buffer.append(self.acc & 0xFF)
+            self.acc >>= 8
+            self.bits -= 8
+
+    def getvalue(self):
+        if self.bits:
+            return bytes(self.buffer) + bytes((self.acc,))
+        return bytes(self.buffer)
+
+
+class BitReader:
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+        self.acc = 0
+        self.bits = 0
+
+    def read(self, width):
+        while self.bits < width:
+            self.acc |= self.data[self.pos] << self.bits
+            self.pos += 1
+            self.bits += 8
+        value = self.acc & ((1 << width) - 1)
+        self.acc >>= width
+        self.bits -= width
+        return value
+
+    def read_signed(self, width):
+        value = self.read(width)
+        return value - (1 << width) if value >= 1 << (width - 1) else value
+
+
+def quantize(value):
+    return min(max(int(round(value * POSITION_SCALE)), 0), (1 << POSITION_BITS) - 1)
+
+
+def dequantize(value):
+    return value / POSITION_SCALE
+
+
+def magazine_bits(bullets):
+    bits = 0
+    for i, bullet in enumerate(bullets):
+        bits |= BULLET_CODES[bullet.type] << (2 * i)
+    return bits
+
+
+def magazine_types(bits, count):
+    return [BULLET_TYPES[(bits >> (2 * i)) & 3] for i in range(count)]
+
+
+def snapshot_state(game):
+    # 把服务端的游戏状态量化成 {类别: {编号: (字段, ...)}}，增量编码和校验都基于这份数据
+    players = {}
+    for index, player in enumerate(game.players):
+        players[index] = (quantize(player.x), quantize(player.y),
+                          min(max(player.health, 0), 255), min(max(player.san, 0), 255),
+                          int(player.alive), int(player.reloading), len(player.bullets),
+                          magazine_bits(player.bullets), len(player.reload_bullets))
+    enemies = {enemy.id: (quantize(enemy.x), quantize(enemy.y), min(max(enemy.health, 0), 255))
+               for enemy in game.enemies}
+    bullets = {bullet.id: (quantize(bullet.x), quantize(bullet.y), BULLET_CODES[bullet.type], bullet.owner)
+               for bullet in game.active_bullets}
+    return {"players": players, "enemies": enemies, "bullets": bullets}
+
+
+def state_crc(state):
+    return zlib.crc32(repr([sorted(state[name].items()) for name, _ in SECTIONS]).encode("ascii"))
+
+
+def write_count(writer, count):
+    # 实体数量：小于 15 时只用 4 位，否则 4 位全 1 之后再写 16 位
+    if count < 15:
+        writer.write(count, 4)
+    else:
+        writer.write(15, 4)
+        writer.write(count, 16)
+
+
+def read_count(reader):
+    count = reader.read(4)
+    return reader.read(16) if count == 15 else count
+
+
+def encode_snapshot(tick, state, base_tick=0, base=None, input_seq=0, crc=None):
+    # base 为客户端已确认收到的快照时发送增量：按编号顺序给基准里的每个实体写 1 位是否变化，
+    # 变化了的再写 1 位是否已删除，没删除的只发变化的字段，位置变化小时只发 8 位差值；
+    # 之后是基准里没有的新实体，带编号和全部字段。没变化的实体只占 1 位，不发编号。
+    # base 为 None 时所有实体都是新实体，即完整快照
+    writer = BitWriter()
+    for name, fields in SECTIONS:
+        current = state[name]
+        previous = base[name] if base is not None else {}
+        for key in sorted(previous):
+            old = previous[key]
+            record = current.get(key)
+            if record == old:
+                writer.write(0, 1)
+                continue
+            writer.write(1, 1)
+            if record is None:
+                writer.write(1, 1)
+                continue
+            writer.write(0, 1)
+            for value, old_value, (width, is_position) in zip(record, old, fields):
+                if value == old_value:
+                    writer.write(0, 1)
+                    continue
+                writer.write(1, 1)
+                if is_position:
+                    diff = value - old_value
+                    if -(1 << (SMALL_DIFF_BITS - 1)) <= diff < 1 << (SMALL_DIFF_BITS - 1):
+                        writer.write(1, 1)
+                        writer.write(diff, SMALL_DIFF_BITS)
+                        continue
+                    writer.write(0, 1)
+                writer.write(value, width)
+        added = [key for key in current if key not in previous]
+        write_count(writer, len(added))
+        for key in added:
+            writer.write(key, 16)
+            for value, (width, _) in zip(current[key], fields):
+                writer.write(value, width)
+    if crc is None:
+        crc = state_crc(state)
+    offset = tick - base_tick if base is not None else 0
+    return SNAPSHOT_HEADER.pack(SNAPSHOT, tick, offset, crc, input_seq & 0xFFFF) + writer.getvalue()
+
+
+def decode_snapshot(data, bases):
+    # 返回 (逻辑帧, 基准帧, 状态, 校验是否一致, 已执行的指令序号的低 16 位)；
+    # 基准快照不在 bases 里时状态为 None。截断或格式不对的包抛出 ValueError
+    if len(data) < SNAPSHOT_HEADER.size:
+        raise ValueError("short snapshot packet")
+    _, tick, offset, crc, input_seq = SNAPSHOT_HEADER.unpack_from(data)
+    base_tick = tick - offset if offset else 0
+    base = None
+    if offset:
+        base = bases.get(base_tick)
+        if base is None:
+            return tick, base_tick, None, False, input_seq
+    try:
+        state = read_sections(BitReader(data[SNAPSHOT_HEADER.size:]), base)
+    except IndexError as error:
+        raise ValueError("truncated snapshot packet") from error
+    return tick, base_tick, state, state_crc(state) == crc, input_seq
+
+
+def read_sections(reader, base):
+    state = {}
+    for name, fields in SECTIONS:
+        previous = base[name] if base is not None else {}
+        current = {}
+        for key in sorted(previous):
+            old = previous[key]
+            if not reader.read(1):
+                current[key] = old
+                continue
+            if reader.read(1):
+                continue
+            record = []
+            for old_value, (width, is_position) in zip(old, fields):
+                if not reader.read(1):
+                    record.append(old_value)
+                elif is_position and reader.read(1):
+                    record.append(old_value + reader.read_signed(SMALL_DIFF_BITS))
+                else:
+                    record.append(reader.read(width))
+            current[key] = tuple(record)
+        for _ in range(read_count(reader)):
+            key = reader.read(16)
+            current[key] = tuple(reader.read(width) for width, _ in fields)
+        state[name] = current
+    return state
+
+
+class Command:
+    # 客户端每帧一条输入指令，服务端每个逻辑帧执行一条
+    __slots__ = ("seq", "dx", "dy", "buttons", "aim_x", "aim_y")
+
+    def __init__(self, seq, dx=0, dy=0, buttons=0, aim_x=0, aim_y=0):
+        self.seq = seq
+        self.dx = dx
+        self.dy = dy
+        self.buttons = buttons
+        self.aim_x = aim_x
+        self.aim_y = aim_y
+
+    def pack(self):
+        return COMMAND.pack(self.seq, self.dx, self.dy, self.buttons, self.aim_x, self.aim_y)
+
+
+def encode_input(ack_tick, commands):
+    return INPUT_HEADER.pack(INPUT, ack_tick, len(commands)) + b"".join(c.pack() for c in commands)
+
+
+def decode_input(data):
+    # 截断或指令数对不上的包抛出 ValueError
+    if len(data) < INPUT_HEADER.size:
+        raise ValueError("short input packet")
+    _, ack_tick, count = INPUT_HEADER.unpack_from(data)
+    if len(data) != INPUT_HEADER.size + count * COMMAND.size:
+        raise ValueError(f"input packet of {len(data)} bytes does not hold {count} commands")
+    offset = INPUT_HEADER.size
+    commands = []
+    for _ in range(count):
+        commands.append(Command(*COMMAND.unpack_from(data, offset)))
+        offset += COMMAND.size
+    return ack_tick, commands
+
+
+class Link:
+    # 发送 UDP 包；可以模拟丢包和单向延迟，用来在本机测试增量确认和客户端预测
+    def __init__(self, sock, loss=0.0, latency=0.0, seed=None):
+        self.sock = sock
+        self.loss = loss
+        self.latency = latency
+        self.rng = random.Random(seed)
+        self.queue = deque()  # (发送时间, 数据, 地址)
+        self.bytes_sent = 0
+        self.packets_sent = 0
+
+    def send(self, data, addr):
+        self.bytes_sent += len(data)
+        self.packets_sent += 1
+        if self.loss and self.rng.random() < self.loss:
+            return
+        if not self.latency:
+            self._send(data, addr)
+            return
+        self.queue.append((time.perf_counter() + self.latency, data, addr))
+
+    def flush(self):
+        now = time.perf_counter()
+        queue = self.queue
+        while queue and queue[0][0] <= now:
+            _, data, addr = queue.popleft()
+            self._send(data, addr)
+
+    def _send(self, data, addr):
+        try:
+            self.sock.sendto(data, addr)
+        except OSError:
+            # 对方已经关闭（ICMP 端口不可达）时忽略，由超时处理断开
+            pass
+
+
+class CoopGame(ddg.Game):
+    # 两人合作：多个 Player 共享同一批敌人，敌人追最近的存活玩家；敌人清空后刷下一波
+    # 只在服务端运行，每个逻辑帧由 step() 执行各玩家的输入指令
+    # 敌人和子弹带编号，快照按编号做增量
+    def __init__(self, player_count=2, enemy_count=3, seed=None):
+        super().__init__(enemy_count, seed)
+        self.players = [self.player] + [Player(self.get_ticks, self.rng) for _ in range(player_count - 1)]
+        for i, player in enumerate(self.players):
+            player.x = ddg.SCREEN_WIDTH * (i + 1) // (player_count + 1)
+            player.rect.center = (player.x, player.y)
+        self.next_id = 1
+        for enemy in self.enemies:
+            self._assign_id(enemy)
+        self.wave = 1
+
+    def _assign_id(self, entity):
+        # 编号只有 16 位，用完一圈后跳过还在场上的实体，同一时刻不会有两个同类实体同号；
+        # 已经消失的实体的编号可以复用，增量总是相对双方共有的基准编码
+        live = {getattr(enemy, "id", None) for enemy in self.enemies}
+        live.update(bullet.id for bullet in self.active_bullets)
+        while self.next_id in live:
+            self.next_id = self.next_id % 0xFFFF + 1
+        entity.id = self.next_id
+        self.next_id = self.next_id % 0xFFFF + 1
+
+    def spawn_wave(self):
+        # 新一波敌人从屏幕边缘出现，每波多一个
+        self.wave += 1
+        rng = self.rng
+        for _ in range(self.wave + 2):
+            if rng.random() < 0.5:
+                x, y = rng.choice((0, ddg.SCREEN_WIDTH)), rng.randint(0, ddg.SCREEN_HEIGHT)
+            else:
+                x, y = rng.randint(0, ddg.SCREEN_WIDTH), rng.choice((0, ddg.SCREEN_HEIGHT))
+            enemy = Enemy(x, y, self.get_ticks)
+            self._assign_id(enemy)
+            self.enemies.append(enemy)
+
+    def apply_command(self, index, command):
+        # 移动与客户端预测用的是同一个 Player.move
+        player = self.players[index]
+        if not player.alive:
+            return
+        player.move(command.dx * player.speed, command.dy * player.speed)
+        if command.buttons & RELOAD:
+            player.start_reload()
+        if command.buttons & SHOOT_SELF:
+            player.shoot(True)
+        elif command.buttons & SHOOT:
+            bullet = player.shoot(False)
+            if bullet:
+                active = Bullet.create_active(player.x, player.y, command.aim_x, command.aim_y, bullet.type)
+                active.owner = index
+                self._assign_id(active)
+                self.active_bullets.append(active)
+
+    def step(self, commands):
+        # commands[i] 为玩家 i 本帧要执行的指令列表（可以为空）
+        self.time = self.frame * 1000 // TICK_RATE
+        for index, player_commands in enumerate(commands):
+            for command in player_commands:
+                self.apply_command(index, command)
+        players = [player for player in self.players if player.alive]
+        enemies = self.enemies
+        active_bullets = self.active_bullets
+
+        # 敌人追最近的存活玩家
+        if players:
+            for enemy in enemies:
+                target = min(players, key=lambda p: (p.x - enemy.x) ** 2 + (p.y - enemy.y) ** 2)
+                enemy.move_towards_player(target.x, target.y, enemies)
+
+        for bullet in active_bullets[:]:
+            bullet.update()
+            if not bullet.alive:
+                active_bullets.remove(bullet)
+
+        # 子弹碰撞检测
+        for bullet in active_bullets[:]:
+            bullet_rect = pygame.Rect(bullet.x - bullet.radius, bullet.y - bullet.radius,
+                                      bullet.radius * 2, bullet.radius * 2)
+            for enemy in enemies:
+                if enemy.rect.colliderect(bullet_rect):
+                    if enemy.take_damage(bullet.type):
+                        enemies.remove(enemy)
+                    active_bullets.remove(bullet)
+                    break
+
+        # 玩家和敌人的碰撞
+        for player in players:
+            for enemy in enemies[:]:
+                if player.rect.colliderect(enemy.rect):
+                    player.take_collision_damage()
+                    if enemy.take_collision_damage():
+                        enemies.remove(enemy)
+                        continue
+                    player.apply_knockback(enemy.x, enemy.y)
+                    enemy.apply_knockback(player.x, player.y)
+
+        for player in self.players:
+            player.update_reload()
+            if player.alive:
+                player.update()
+        if not enemies and players:
+            self.spawn_wave()
+        self.frame += 1
+
+    @property
+    def game_over(self):
+        return not any(player.alive for player in self.players)
+
+
+class ClientSlot:
+    # 服务端记录的一个客户端
+    def __init__(self, index, addr):
+        self.index = index
+        self.addr = addr
+        self.commands = deque()  # 收到还没执行的指令
+        self.last_received = 0  # 收到的最大指令序号
+        self.last_applied = 0  # 已执行的最大指令序号
+        self.acked_tick = 0  # 客户端确认收到的最新快照
+        self.last_heard = time.perf_counter()
+
+
+class CoopServer:
+    # 权威服务端：运行 CoopGame，按客户端确认的快照发送增量
+    def __init__(self, host="127.0.0.1", port=DEFAULT_PORT, seed=None, players=2, enemies=3,
+                 snapshot_every=SNAPSHOT_EVERY, loss=0.0, latency=0.0):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((host, port))
+        self.sock.setblocking(False)
+        self.port = self.sock.getsockname()[1]
+        self.link = Link(self.sock, loss, latency, seed)
+        self.game = CoopGame(players, enemies, seed)
+        self.snapshot_every = snapshot_every
+        self.clients = {}  # 地址 -> ClientSlot
+        self.history = {}  # 逻辑帧 -> snapshot_state()
+        self.had_clients = False
+        self.snapshots_sent = 0
+        self.full_snapshots = 0
+        self.snapshot_bytes = 0
+        self.full_bytes = 0  # 同样这些快照全部按完整快照发送时的字节数，用来衡量增量的效果
+
+    def free_index(self):
+        used = {slot.index for slot in self.clients.values()}
+        for index in range(len(self.game.players)):
+            if index not in used:
+                return index
+        return None
+
+    def poll(self):
+        while True:
+            try:
+                data, addr = self.sock.recvfrom(65536)
+            except (BlockingIOError, ConnectionResetError):
+                return
+            try:
+                self.handle(data, addr)
+            except ValueError:
+                # 截断、伪造的包直接丢弃，不影响其他客户端
+                continue
+
+    def handle(self, data, addr):
+        if not data:
+            return
+        kind = data[:1]
+        slot = self.clients.get(addr)
+        if kind == HELLO:
+            if data[1:2] != bytes((PROTOCOL_VERSION,)):
+                # 快照是按位打包的，版本不同的客户端无法解读
+                self.link.send(VERSION + bytes((PROTOCOL_VERSION,)), addr)
+                return
+            if slot is None:
+                index = self.free_index()
+                if index is None:
+                    self.link.send(FULL, addr)
+                    return
+                slot = self.clients[addr] = ClientSlot(index, addr)
+                self.had_clients = True
+            # 重复的 HELLO（WELCOME 丢失）再回一次
+            self.link.send(WELCOME + struct.pack("<BHB", slot.index, TICK_RATE, self.snapshot_every), addr)
+        elif slot is None:
+            return
+        elif kind == INPUT:
+            ack_tick, commands = decode_input(data)
+            slot.last_heard = time.perf_counter()
+            if ack_tick > slot.acked_tick:
+                slot.acked_tick = ack_tick
+            for command in commands:
+                if command.seq > slot.last_received:
+                    slot.commands.append(command)
+                    slot.last_received = command.seq
+        elif kind == BYE:
+            del self.clients[addr]
+
+    def tick(self):
+        game = self.game
+        commands = [[] for _ in game.players]
+        for slot in self.clients.values():
+            queue = slot.commands
+            count = 1 + max(0, len(queue) - MAX_QUEUED)
+            for _ in range(min(count, len(queue))):
+                command = queue.popleft()
+                commands[slot.index].append(command)
+                slot.last_applied = command.seq
+        game.step(commands)
+        if game.frame % self.snapshot_every == 0:
+            self.send_snapshots()
+
+    def send_snapshots(self):
+        tick = self.game.frame
+        state = snapshot_state(self.game)
+        self.history[tick] = state
+        self.history.pop(tick - HISTORY * self.snapshot_every, None)
+        crc = state_crc(state)
+        full = len(encode_snapshot(tick, state, crc=crc))
+        for slot in self.clients.values():
+            base = self.history.get(slot.acked_tick) if slot.acked_tick else None
+            data = encode_snapshot(tick, state, slot.acked_tick, base, slot.last_applied, crc)
+            self.link.send(data, slot.addr)
+            self.snapshots_sent += 1
+            self.snapshot_bytes += len(data)
+            self.full_bytes += full
+            if base is None:
+                self.full_snapshots += 1
+
+    def drop_idle_clients(self):
+        now = time.perf_counter()
+        for addr in [addr for addr, slot in self.clients.items() if now - slot.last_heard > IDLE_TIMEOUT]:
+            del self.clients[addr]
+
+    def run(self, max_ticks=None):
+        # 按 TICK_RATE 固定步长运行；所有客户端离开（或都超时）后结束
+        selector = selectors.DefaultSelector()
+        selector.register(self.sock, selectors.EVENT_READ)
+        interval = 1 / TICK_RATE
+        next_tick = time.perf_counter()
+        try:
+            while max_ticks is None or self.game.frame < max_ticks:
+                timeout = next_tick - time.perf_counter()
+                if timeout > 0:
+                    selector.select(min(timeout, 0.001) if self.link.queue else timeout)
+                self.poll()
+                self.link.flush()
+                if time.perf_counter() < next_tick:
+                    continue
+                next_tick += interval
+                if time.perf_counter() - next_tick > 0.25:
+                    # 落后太多（调试器暂停等）时不追赶
+                    next_tick = time.perf_counter()
+                self.drop_idle_clients()
+                if self.had_clients and not self.clients:
+                    break
+                if self.clients:
+                    self.tick()
+        finally:
+            selector.close()
+            self.sock.close()
+
+    def stats(self):
+        return {
+            "ticks": self.game.frame,
+            "snapshots": self.snapshots_sent,
+            "full_snapshots": self.full_snapshots,
+            "snapshot_bytes_avg": self.snapshot_bytes / max(1, self.snapshots_sent),
+            "full_snapshot_bytes_avg": self.full_bytes / max(1, self.snapshots_sent),
+            "pickled_state_bytes": len(pickle.dumps(self.game, pickle.HIGHEST_PROTOCOL)),
+            "bytes_sent": self.link.bytes_sent,
+        }
+
+
+def run_server(host, port, seed, players, enemies, snapshot_every, loss, latency, max_ticks=None, ready=None):
+    # 服务端进程入口；ready 为队列时先放入实际端口，结束时放入统计
+    server = CoopServer(host, port, seed, players, enemies, snapshot_every, loss, latency)
+    if ready is not None:
+        ready.put(server.port)
+    else:
+        print(f"DDG co-op server on {host}:{server.port}, waiting for {players} players")
+    server.run(max_ticks)
+    stats = server.stats()
+    if ready is not None:
+        ready.put(stats)
+    else:
+        print(f"Server stopped after {stats['ticks']} ticks, {stats['snapshots']} snapshots, "
+              f"{stats['snapshot_bytes_avg']:.0f} bytes per snapshot")
+
+
+class CoopClient:
+    # 客户端：发送输入、接收增量快照并还原状态，自己的移动和射击先在本地预测
+    # 预测：从服务端确认执行到的指令处的权威位置出发，重放之后还没确认的指令
+    def __init__(self, host="127.0.0.1", port=DEFAULT_PORT, loss=0.0, latency=0.0, seed=None):
+        self.addr = (host, port)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("127.0.0.1" if host in ("127.0.0.1", "localhost") else "0.0.0.0", 0))
+        self.sock.setblocking(False)
+        self.link = Link(self.sock, loss, latency, seed)
+        self.index = None
+        self.snapshot_every = SNAPSHOT_EVERY
+        self.snapshots = {}  # 逻辑帧 -> 状态，用作增量基准
+        self.state = None  # 最新的权威状态
+        self.tick = 0  # 最新状态的逻辑帧
+        self.seq = 0
+        self.pending = deque()  # 已发送、服务端还没执行的指令
+        self.predicted_at = {}  # 指令序号 -> 执行后预测的位置
+        self.predicted = Player(lambda: 0, random.Random(0))  # 只用它的位置和 move()
+        self.predicted_bullets = []  # [(指令序号, Bullet)]
+        self.enemies = {}  # 编号 -> Enemy，只用于绘制
+        self.bullets = {}  # 编号 -> Bullet，只用于绘制
+        self.snapshots_received = 0
+        self.bytes_received = 0
+        self.missing_base = 0
+        self.mismatches = 0
+        self.prediction_errors = []
+
+    def connect(self, timeout=5.0):
+        deadline = time.perf_counter() + timeout
+        while time.perf_counter() < deadline:
+            self.link.send(HELLO + bytes((PROTOCOL_VERSION,)), self.addr)
+            self.link.flush()
+            wait_until = time.perf_counter() + 0.2
+            while time.perf_counter() < wait_until:
+                self.link.flush()
+                try:
+                    data, _ = self.sock.recvfrom(65536)
+                except (BlockingIOError, ConnectionResetError):
+                    time.sleep(0.005)
+                    continue
+                if data[:1] == WELCOME:
+                    self.index, _, self.snapshot_every = struct.unpack_from("<BHB", data, 1)
+                    return self.index
+                if data[:1] == FULL:
+                    raise ConnectionError("server is full")
+                if data[:1] == VERSION and len(data) > 1:
+                    raise ConnectionError(f"server speaks protocol version {data[1]}, "
+                                          f"this client {PROTOCOL_VERSION}")
+        raise TimeoutError(f"no answer from {self.addr[0]}:{self.addr[1]}")
+
+    def close(self):
+        for _ in range(3):
+            self.link.send(BYE, self.addr)
+        self.link.latency = 0
+        self.link.flush()
+        while self.link.queue:
+            _, data, addr = self.link.queue.popleft()
+            self.link._send(data, addr)
+        self.sock.close()
+
+    @property
+    def me(self):
+        if self.state is None:
+            return None
+        return self.state["players"].get(self.index)
+
+    def magazine(self):
+        # 预测的弹夹：服务端的弹夹减去还没确认的射击
+        me = self.me
+        if me is None:
+            return []
+        types = magazine_types(me[7], me[6])
+        if me[5]:
+            return []
+        shots = sum(1 for command in self.pending if command.buttons & (SHOOT | SHOOT_SELF))
+        return types[shots:]
+
+    def send_input(self, dx=0, dy=0, buttons=0, aim=(0, 0)):
+        self.seq += 1
+        command = Command(self.seq, dx, dy, buttons, int(aim[0]), int(aim[1]))
+        if self.me is not None and self.me[4]:
+            # 射击预测：弹夹里还有子弹时立即在本地生成子弹
+            magazine = self.magazine()
+            predicted = self.predicted
+            predicted.move(dx * predicted.speed, dy * predicted.speed)
+            if buttons & SHOOT and not buttons & SHOOT_SELF and magazine:
+                bullet = Bullet.create_active(predicted.x, predicted.y, command.aim_x, command.aim_y, magazine[0])
+                self.predicted_bullets.append((command.seq, bullet))
+            self.predicted_at[command.seq] = (predicted.x, predicted.y)
+        self.pending.append(command)
+        recent = list(self.pending)[-INPUT_REDUNDANCY:]
+        self.link.send(encode_input(self.tick, recent), self.addr)
+
+    def poll(self):
+        self.link.flush()
+        latest = None
+        while True:
+            try:
+                data, _ = self.sock.recvfrom(65536)
+            except (BlockingIOError, ConnectionResetError):
+                break
+            if data[:1] != SNAPSHOT:
+                continue
+            self.bytes_received += len(data)
+            self.snapshots_received += 1
+            try:
+                tick, base_tick, state, ok, input_seq = decode_snapshot(data, self.snapshots)
+            except ValueError:
+                self.mismatches += 1
+                continue
+            if state is None:
+                # 基准快照已经丢弃，等服务端按新的确认重发
+                self.missing_base += 1
+                continue
+            if not ok:
+                self.mismatches += 1
+                continue
+            self.snapshots[tick] = state
+            self.snapshots.pop(tick - HISTORY * self.snapshot_every, None)
+            if tick > self.tick:
+                self.tick = tick
+                self.state = state
+                # 快照里只有低 16 位；服务端执行到的序号不会超过本机发出的最新序号
+                latest = self.seq - ((self.seq - input_seq) & 0xFFFF)
+        if latest is not None:
+            self.reconcile(latest)
+        for seq, bullet in self.predicted_bullets:
+            bullet.update()
+        self.predicted_bullets = [(seq, bullet) for seq, bullet in self.predicted_bullets if bullet.alive]
+
+    def reconcile(self, input_seq):
+        # 丢掉服务端已执行的指令，从权威位置重放其余指令；记录预测误差
+        pending = self.pending
+        while pending and pending[0].seq <= input_seq:
+            pending.popleft()
+        me = self.me
+        x, y = dequantize(me[0]), dequantize(me[1])
+        guess = self.predicted_at.pop(input_seq, None)
+        if guess is not None:
+            self.prediction_errors.append(math.hypot(guess[0] - x, guess[1] - y))
+        for seq in [seq for seq in self.predicted_at if seq < input_seq]:
+            del self.predicted_at[seq]
+        self.predicted_bullets = [(seq, bullet) for seq, bullet in self.predicted_bullets if seq > input_seq]
+        predicted = self.predicted
+        predicted.x, predicted.y = x, y
+        if me[4]:
+            for command in pending:
+                predicted.move(command.dx * predicted.speed, command.dy * predicted.speed)
+        predicted.rect.center = (predicted.x, predicted.y)
+        self.sync_entities()
+
+    def sync_entities(self):
+        # 按最新状态更新绘制用的 Enemy 和 Bullet 对象
+        state = self.state
+        enemies = {}
+        for key, (qx, qy, health) in state["enemies"].items():
+            enemy = self.enemies.get(key)
+            if enemy is None:
+                enemy = Enemy(0, 0, lambda: 0)
+            enemy.x, enemy.y, enemy.health = dequantize(qx), dequantize(qy), health
+            enemies[key] = enemy
+        self.enemies = enemies
+        bullets = {}
+        for key, (qx, qy, code, owner) in state["bullets"].items():
+            bullet = self.bullets.get(key)
+            if bullet is None:
+                bullet = Bullet(BULLET_TYPES[code])
+                bullet.radius = 5
+            bullet.x, bullet.y = dequantize(qx), dequantize(qy)
+            bullets[key] = bullet
+        self.bullets = bullets
+
+    def nearest_enemy(self):
+        if not self.enemies:
+            return None
+        predicted = self.predicted
+        return min(self.enemies.values(),
+                   key=lambda e: (e.x - predicted.x) ** 2 + (e.y - predicted.y) ** 2)
+
+    def snapshot_bytes_avg(self):
+        return self.bytes_received / max(1, self.snapshots_received)
+
+    def stats(self):
+        errors = self.prediction_errors
+        return {
+            "player": self.index,
+            "snapshots": self.snapshots_received,
+            "snapshot_bytes_avg": self.snapshot_bytes_avg(),
+            "missing_base": self.missing_base,
+            "mismatches": self.mismatches,
+            "prediction_error_avg": sum(errors) / len(errors) if errors else 0.0,
+            "prediction_error_max": max(errors) if errors else 0.0,
+            "bytes_sent": self.link.bytes_sent,
+        }
+
+
+PLAYER_COLORS = (ddg.RED, ddg.GREEN)
+
+
+def draw_client(screen, client, mouse_pos):
+    screen.fill((50, 50, 50))
+    for x in range(0, ddg.SCREEN_WIDTH, 50):
+        pygame.draw.line(screen, (70, 70, 70), (x, 0), (x, ddg.SCREEN_HEIGHT))
+    for y in range(0, ddg.SCREEN_HEIGHT, 50):
+        pygame.draw.line(screen, (70, 70, 70), (0, y), (ddg.SCREEN_WIDTH, y))
+    font = ddg.get_font(36)
+    small_font = ddg.get_font(24)
+    if client.state is None:
+        screen.blit(font.render("Waiting for server...", True, ddg.WHITE), (10, 10))
+        return
+
+    # 队友按服务端位置绘制，自己按预测位置绘制
+    for index, record in client.state["players"].items():
+        if not record[4]:
+            continue
+        if index == client.index:
+            x, y = client.predicted.x, client.predicted.y
+        else:
+            x, y = dequantize(record[0]), dequantize(record[1])
+        pygame.draw.circle(screen, PLAYER_COLORS[index % len(PLAYER_COLORS)], (x, y), ddg.PLAYER_SIZE // 2)
+    for enemy in client.enemies.values():
+        enemy.draw(screen)
+    for bullet in client.bullets.values():
+        bullet.draw(screen)
+    for _, bullet in client.predicted_bullets:
+        bullet.draw(screen)
+
+    # 准星
+    mouse_x, mouse_y = mouse_pos
+    half = ddg.CROSSHAIR_SIZE // 2
+    pygame.draw.circle(screen, ddg.WHITE, (mouse_x, mouse_y), half, 2)
+    pygame.draw.line(screen, ddg.WHITE, (mouse_x - half, mouse_y), (mouse_x + half, mouse_y), 2)
+    pygame.draw.line(screen, ddg.WHITE, (mouse_x, mouse_y - half), (mouse_x, mouse_y + half), 2)
+
+    # 自己和队友的状态
+    me = client.me
+    screen.blit(font.render(f"Health: {me[2]}", True, ddg.WHITE), (10, 10))
+    screen.blit(font.render(f"San: {me[3]}", True, ddg.WHITE), (10, 50))
+    magazine = client.magazine()
+    ammo = "Reloading" if me[5] else f"Ammo: {len(magazine)}/6"
+    screen.blit(font.render(ammo, True, ddg.WHITE), (10, 90))
+    for i, bullet_type in enumerate(magazine):
+        pygame.draw.circle(screen, ddg.BULLET_INFO[bullet_type]["color"], (20 + i * 20, 135), 5)
+    for index, record in client.state["players"].items():
+        if index != client.index:
+            status = f"P{index + 1}: {record[2]} HP, {record[3]} San" if record[4] else f"P{index + 1}: down"
+            screen.blit(small_font.render(status, True, PLAYER_COLORS[index % len(PLAYER_COLORS)]),
+                        (ddg.SCREEN_WIDTH - 220, 10))
+    net = (f"tick {client.tick}  {client.snapshot_bytes_avg():.0f} B/snapshot  "
+           f"{len(client.pending)} unacked inputs")
+    screen.blit(small_font.render(net, True, ddg.WHITE), (10, ddg.SCREEN_HEIGHT - 30))
+    if not any(record[4] for record in client.state["players"].values()):
+        text = ddg.get_font(72).render("GAME OVER", True, ddg.WHITE)
+        screen.blit(text, text.get_rect(center=(ddg.SCREEN_WIDTH // 2, ddg.SCREEN_HEIGHT // 2)))
+
+
+def play(host, port, loss=0.0, latency=0.0):
+    # 窗口客户端：WASD 移动，左键朝鼠标射击，右键射击自己，R 装填
+    screen = ddg.init_pygame()
+    pygame.display.set_caption("Destiny Demon Gun - Co-op")
+    clock = pygame.time.Clock()
+    client = CoopClient(host, port, loss, latency)
+    index = client.connect()
+    print(f"Joined as player {index + 1}")
+    san_effect = SanEffect()
+    running = True
+    try:
+        while running:
+            buttons = 0
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    running = False
+                elif event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
+                    running = False
+                elif event.type == pygame.KEYDOWN and event.key == pygame.K_r:
+                    buttons |= RELOAD
+                elif event.type == pygame.MOUSEBUTTONDOWN:
+                    if event.button == 1:
+                        buttons |= SHOOT
+                    elif event.button == 3:
+                        buttons |= SHOOT_SELF
+            keys = pygame.key.get_pressed()
+            dx = (keys[pygame.K_d] or keys[pygame.K_RIGHT]) - (keys[pygame.K_a] or keys[pygame.K_LEFT])
+            dy = (keys[pygame.K_s] or keys[pygame.K_DOWN]) - (keys[pygame.K_w] or keys[pygame.K_UP])
+            mouse_pos = pygame.mouse.get_pos()
+            client.send_input(dx, dy, buttons, mouse_pos)
+            client.poll()
+            draw_client(screen, client, mouse_pos)
+            if client.me is not None:
+                san_effect.apply(screen, client.me[3], pygame.time.get_ticks())
+            pygame.display.flip()
+            clock.tick(TICK_RATE)
+    finally:
+        client.close()
+        pygame.quit()
+
+
+BOT_DIRECTIONS = ((1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1), (0, -1), (1, -1))
+
+
+def bot_input(client, frame, turn_every=90):
+    # 无头客户端的脚本输入：绕圈移动，每20帧朝最近的敌人开一枪，弹夹空了就装填；两名玩家错开半拍
+    dx, dy = BOT_DIRECTIONS[(frame // turn_every + client.index * 4) % len(BOT_DIRECTIONS)]
+    buttons, aim = 0, (0, 0)
+    me = client.me
+    if me is not None and frame % 20 == client.index * 10 % 20:
+        target = client.nearest_enemy()
+        if not me[5] and me[6] == 0:
+            buttons = RELOAD
+        elif target is not None:
+            buttons, aim = SHOOT, (target.x, target.y)
+    return dx, dy, buttons, aim
+
+
+def selftest(frames, seed, loss, latency, enemies):
+    # 本机回环测试：服务端在独立进程里运行，两个无头客户端在本进程里交替推进
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    server = context.Process(target=run_server, args=("127.0.0.1", 0, seed, 2, enemies, SNAPSHOT_EVERY,
+                                                      loss, latency, None, queue))
+    server.start()
+    port = queue.get(timeout=30)
+    clients = [CoopClient("127.0.0.1", port, loss, latency, seed=i) for i in range(2)]
+    try:
+        for client in clients:
+            client.connect()
+        interval = 1 / TICK_RATE
+        next_frame = time.perf_counter()
+        for frame in range(frames):
+            for client in clients:
+                client.poll()
+                client.send_input(*bot_input(client, frame))
+            next_frame += interval
+            delay = next_frame - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        # 停止输入后再收一会儿，等最后的快照到达
+        end = time.perf_counter() + 0.3 + latency * 2
+        while time.perf_counter() < end:
+            for client in clients:
+                client.poll()
+            time.sleep(0.005)
+        results = [client.stats() for client in clients]
+    finally:
+        for client in clients:
+            client.close()
+    server_stats = queue.get(timeout=30)
+    server.join()
+    return server_stats, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DDG 双人合作（本机权威服务端 + 客户端）")
+    parser.add_argument("mode", choices=("server", "client", "host", "selftest"),
+                        help="server 只运行服务端；client 连接服务端；host 启动服务端并作为1号玩家加入；"
+                             "selftest 用两个无头客户端在本机回环测试")
+    parser.add_argument("--host", default="127.0.0.1", help="服务端地址")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="服务端端口")
+    parser.add_argument("--seed", type=int, default=None, help="随机种子")
+    parser.add_argument("--enemies", type=int, default=3, help="第一波敌人数量")
+    parser.add_argument("--loss", type=float, default=0.0, help="模拟丢包率（0-1）")
+    parser.add_argument("--latency", type=float, default=0.0, help="模拟单向延迟（毫秒）")
+    parser.add_argument("--frames", type=int, default=1440, help="selftest 运行的帧数")
+    args = parser.parse_args()
+    latency = args.latency / 1000
+
+    if args.mode == "server":
+        run_server(args.host, args.port, args.seed, 2, args.enemies, SNAPSHOT_EVERY, args.loss, latency)
+    elif args.mode == "client":
+        play(args.host, args.port, args.loss, latency)
+    elif args.mode == "host":
+        context = multiprocessing.get_context("spawn")
+        server = context.Process(target=run_server, args=(args.host, args.port, args.seed, 2, args.enemies,
+                                                          SNAPSHOT_EVERY, args.loss, latency))
+        server.start()
+        try:
+            play(args.host, args.port, args.loss, latency)
+        finally:
+            server.join()
+    else:
+        server_stats, results = selftest(args.frames, args.seed, args.loss, latency, args.enemies)
+        print(f"server: {server_stats['ticks']} ticks, {server_stats['snapshots']} snapshots "
+              f"({server_stats['full_snapshots']} full), {server_stats['snapshot_bytes_avg']:.1f} bytes per "
+              f"snapshot on average, {server_stats['full_snapshot_bytes_avg']:.1f} if every one were full; "
+              f"the pickled game state {server_stats['pickled_state_bytes']} bytes")
+        kbps = server_stats["snapshot_bytes_avg"] * TICK_RATE / SNAPSHOT_EVERY * 8 / 1000
+        print(f"downstream per client: {kbps:.1f} kbit/s at {TICK_RATE // SNAPSHOT_EVERY} snapshots/s")
+        failed = False
+        for result in results:
+            print(f"player {result['player'] + 1}: {result['snapshots']} snapshots, "
+                  f"{result['snapshot_bytes_avg']:.1f} bytes avg, {result['missing_base']} without base, "
+                  f"{result['mismatches']} checksum mismatches, prediction error "
+                  f"avg {result['prediction_error_avg']:.2f}px max {result['prediction_error_max']:.2f}px")
+            failed = failed or result["mismatches"] > 0 or result["snapshots"] == 0
+        raise SystemExit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+import csv
+import json
+import time
+
+import numpy as np
+import pygame
+
+
+class FrameProfiler:
+    # 按阶段统计每帧耗时，两个游戏的主循环共用
+    # 用法：每帧开头 begin_frame()，每个阶段结束时 lap("阶段名")，帧末 end_frame()
+    # 同一阶段在一帧里可以 lap 多次，耗时累加；最近 capacity 帧保存在环形缓冲区里
+    # 关闭时 lap() 只做两次属性判断就返回
+    # monitor 可以挂一个 AllocationMonitor，按同样的帧和阶段统计内存分配，与性能分析是否打开无关
+    def __init__(self, phases, capacity=1024, enabled=False):
+        self.phases = tuple(phases)
+        self.columns = {name: i for i, name in enumerate(self.phases)}
+        self.capacity = capacity
+        self.enabled = enabled
+        self.show_overlay = enabled
+        self.monitor = None
+        self.durations = np.zeros((capacity, len(self.phases)))  # 秒
+        self.frame_starts = np.zeros(capacity)
+        self.segments = [None] * capacity  # 每帧的 (阶段编号, 开始时间, 耗时)，用于导出时间线
+        self.count = 0  # 已记录的帧数（可能超过 capacity）
+        self._current = [0.0] * len(self.phases)
+        self._segments = []
+        self._frame_start = 0.0
+        self._last = 0.0
+        self._overlay = None
+        self._overlay_frame = -1
+        self._font = None  # 第一次渲染时创建，之后复用
+
+    def toggle(self):
+        self.enabled = not self.enabled
+        self.show_overlay = self.enabled
+        if self.enabled:
+            # 在帧中间打开时，本帧从现在开始计时
+            self._start_frame()
+
+    def begin_frame(self):
+        if self.monitor is not None:
+            self.monitor.begin_frame()
+        if self.enabled:
+            self._start_frame()
+
+    def _start_frame(self):
+        self._frame_start = self._last = time.perf_counter()
+        self._current = [0.0] * len(self.phases)
+        self._segments = []
+
+    def lap(self, phase):
+        # 把上一次 lap 以来的时间记到 phase 上
+        if self.monitor is not None:
+            self.monitor.lap(phase)
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        elapsed = now - self._last
+        column = self.columns[phase]
+        self._current[column] += elapsed
+        segments = self._segments
+        if segments and segments[-1][0] == column:
+            # 连续的同一阶段合并成一段
+            segments[-1][2] += elapsed
+        else:
+            segments.append([column, self._last, elapsed])
+        self._last = now
+
+    def end_frame(self):
+        if self.monitor is not None:
+            self.monitor.end_frame()
+        if not self.enabled:
+            return
+        row = self.count % self.capacity
+        self.durations[row] = self._current
+        self.frame_starts[row] = self._frame_start
+        self.segments[row] = self._segments
+        self.count += 1
+
+    def _rows(self):
+        # 按时间先后返回有效行的下标
+        if self.count <= self.capacity:
+            return np.arange(self.count)
+        start = self.count % self.capacity
+        return (np.arange(self.capacity) + start) % self.capacity
+
+    def percentiles(self, q=(50, 95, 99)):
+        # 返回 {阶段: [各分位耗时(毫秒)]}，没有数据时返回空字典
+        rows = self._rows()
+        if len(rows) == 0:
+            return {}
+        values = np.percentile(self.durations[rows] * 1000, q, axis=0)
+        return {name: values[:, i].tolist() for i, name in enumerate(self.phases)}
+
+    def draw_overlay(self, screen, pos=(10, 10), refresh_every=30):
+        # 每 refresh_every 帧才重新统计和渲染一次，平时直接贴缓存的图层
+        if not self.show_overlay:
+            return
+        if self._overlay is None or self.count - self._overlay_frame >= refresh_every:
+            self._overlay = self._render_overlay()
+            self._overlay_frame = self.count
+        screen.blit(self._overlay, pos)
+
+    def _render_overlay(self):
+        if self._font is None:
+            self._font = pygame.font.Font(None, 20)
+        font = self._font
+        stats = self.percentiles()
+        lines = [f"{'phase':<10}{'p50':>7}{'p95':>7}{'p99':>7}  ms ({min(self.count, self.capacity)} frames)"]
+        for name in self.phases:
+            p50, p95, p99 = stats.get(name, (0.0, 0.0, 0.0))
+            lines.append(f"{name:<10}{p50:>7.2f}{p95:>7.2f}{p99:>7.2f}")
+        rows = self._rows()
+        if len(rows):
+            frame = np.percentile(self.durations[rows].sum(axis=1) * 1000, (50, 95, 99))
+            lines.append(f"{'frame':<10}{frame[0]:>7.2f}{frame[1]:>7.2f}{frame[2]:>7.2f}")
+        line_height = font.get_linesize()
+        width = max(font.size(line)[0] for line in lines) + 12
+        overlay = pygame.Surface((width, line_height * len(lines) + 8), pygame.SRCALPHA)
+        overlay.fill((0, 0, 0, 170))
+        for i, line in enumerate(lines):
+            overlay.blit(font.render(line, True, (255, 255, 255)), (6, 4 + i * line_height))
+        return overlay
+
+    def export_csv(self, path):
+        # 每帧一行，各阶段耗时单位为毫秒
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["frame", "start_s"] + [f"{name}_ms" for name in self.phases])
+            first = self.count - len(self._rows())
+            for frame, row in enumerate(self._rows().tolist(), first):
+                writer.writerow([frame, f"{self.frame_starts[row]:.6f}"] +
+                                [f"{value * 1000:.4f}" for value in self.durations[row].tolist()])
+
+    def export_chrome_trace(self, path):
+        # Chrome 的 chrome://tracing / Perfetto 可以直接打开的 JSON 时间线
+        events = []
+        for row in self._rows().tolist():
+            start = self.frame_starts[row]
+            segments = self.segments[row]
+            total = sum(duration for _, _, duration in segments)
+            events.append({"name": "frame", "ph": "X", "pid": 1, "tid": 1,
+                           "ts": start * 1e6, "dur": total * 1e6})
+            for column, segment_start, duration in segments:
+                events.append({"name": self.phases[column], "ph": "X", "pid": 1, "tid": 1,
+                               "ts": segment_start * 1e6, "dur": duration * 1e6})
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+    def export(self, prefix):
+        # 同时导出 CSV 和 Chrome trace，返回两个文件名
+        csv_path = f"{prefix}.csv"
+        trace_path = f"{prefix}.trace.json"
+        self.export_csv(csv_path)
+        self.export_chrome_trace(trace_path)
+        return csv_path, trace_path
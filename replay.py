@@ -0,0 +1,110 @@
+import bisect
+import gzip
+import os
+import pickle
+import zlib
+
+REPLAY_VERSION = 3
+
+
+def dump_state(state):
+    # 关键帧：把整个游戏状态（包括随机数生成器）序列化并压缩
+    return zlib.compress(pickle.dumps(state, pickle.HIGHEST_PROTOCOL))
+
+
+def load_state(data):
+    # 每次都反序列化出一份新的对象，恢复后可以随意修改而不影响关键帧
+    return pickle.loads(zlib.decompress(data))
+
+
+def numbered_path(path, index):
+    # 同一次运行录下多局时，第一局用 path，之后依次为 name-2.ext、name-3.ext ...
+    if index == 0:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}-{index + 1}{ext}"
+
+
+class Replay:
+    # 一局游戏的回放，两个游戏共用：
+    # header 是开局设置，inputs 按逻辑帧记录玩家输入（只记录有输入的帧），
+    # keyframes 是每隔 keyframe_interval 帧保存的完整状态，用来快速跳到任意一帧
+    # 游戏自己负责生成和应用输入、保存和恢复状态，这里只管存取和查找
+    def __init__(self, game, header=None, keyframe_interval=600):
+        self.game = game
+        self.header = dict(header or {})
+        self.keyframe_interval = keyframe_interval
+        self.inputs = {}  # 逻辑帧 -> [输入, ...]
+        self.input_ticks = []  # 有输入的逻辑帧，升序
+        self.keyframes = {}  # 逻辑帧 -> dump_state() 的结果
+        self.keyframe_ticks = []  # 升序
+        self.length = 0  # 录制结束时的逻辑帧
+
+    def record_input(self, tick, item):
+        # 录制时逻辑帧只增不减，直接追加
+        items = self.inputs.get(tick)
+        if items is None:
+            items = self.inputs[tick] = []
+            self.input_ticks.append(tick)
+        items.append(item)
+        self.length = max(self.length, tick)
+
+    def inputs_at(self, tick):
+        return self.inputs.get(tick, ())
+
+    def next_input_tick(self, tick):
+        # tick 之后（含 tick）第一个有输入的逻辑帧，没有时返回 None
+        i = bisect.bisect_left(self.input_ticks, tick)
+        return self.input_ticks[i] if i < len(self.input_ticks) else None
+
+    def wants_keyframe(self, tick):
+        return not self.keyframe_ticks or tick - self.keyframe_ticks[-1] >= self.keyframe_interval
+
+    def add_keyframe(self, tick, state):
+        # state 为 dump_state() 的结果；同一帧重复保存时以最后一次为准
+        if tick not in self.keyframes:
+            bisect.insort(self.keyframe_ticks, tick)
+        self.keyframes[tick] = state
+        self.length = max(self.length, tick)
+
+    def keyframe_before(self, tick):
+        # 返回 tick 之前（含 tick）最近的关键帧 (逻辑帧, 状态)
+        i = bisect.bisect_right(self.keyframe_ticks, tick) - 1
+        if i < 0:
+            raise ValueError(f"no keyframe at or before tick {tick}")
+        keyframe_tick = self.keyframe_ticks[i]
+        return keyframe_tick, self.keyframes[keyframe_tick]
+
+    @property
+    def final_keyframe(self):
+        return self.keyframe_before(self.keyframe_ticks[-1])
+
+    def save(self, path):
+        data = {
+            "version": REPLAY_VERSION,
+            "game": self.game,
+            "header": self.header,
+            "keyframe_interval": self.keyframe_interval,
+            "length": self.length,
+            "inputs": self.inputs,
+            "keyframes": self.keyframes,
+        }
+        with gzip.open(path, "wb", compresslevel=6) as f:
+            pickle.dump(data, f, pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, path, game=None):
+        # 回放文件包含 pickle 数据，只加载自己录制或信任的文件
+        with gzip.open(path, "rb") as f:
+            data = pickle.load(f)
+        if data.get("version") != REPLAY_VERSION:
+            raise ValueError(f"unsupported replay version {data.get('version')} in {path}")
+        if game is not None and data["game"] != game:
+            raise ValueError(f"{path} is a {data['game']} replay, not {game}")
+        replay = cls(data["game"], data["header"], data["keyframe_interval"])
+        replay.inputs = data["inputs"]
+        replay.input_ticks = sorted(replay.inputs)
+        replay.keyframes = data["keyframes"]
+        replay.keyframe_ticks = sorted(replay.keyframes)
+        replay.length = data["length"]
+        return replay
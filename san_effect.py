@@ -0,0 +1,162 @@
+import math
+
+import numpy as np
+import pygame
+
+# san 值低于 SAN_THRESHOLD 后整个画面逐渐褪色、四角变暗、横向波动，san 越低越强
+# 按 BAND_SIZE 分档，每档的颜色查找表、暗角和位移表在第一次进入这一档时生成，之后直接复用
+SAN_THRESHOLD = 60
+BAND_SIZE = 10
+MAX_DESATURATION = 0.9  # san 为0时褪色的比例
+MAX_VIGNETTE = 0.8  # san 为0时四角变暗的比例
+VIGNETTE_START = 0.35  # 从中心到四角的这个比例处开始变暗
+MAX_WOBBLE = 6  # san 为0时横向波动的幅度（像素）
+WOBBLE_WAVELENGTH = 150  # 波动沿竖直方向的波长（像素）
+WOBBLE_PERIOD = 1500  # 波动一个周期的时长（毫秒）
+WOBBLE_PHASES = 24  # 一个周期分成多少个相位，每个相位一张位移表
+LUT_BITS = 5  # 颜色查找表每个通道取高5位，共 32768 项
+MIN_DESATURATION = 0.2  # 褪色比例低于此值时不查表：颜色变化不明显，5位量化的色带反而更显眼
+
+
+class SanBand:
+    # 一档 san 值的预计算数据：
+    # lut 把每个像素按各通道高5位拼成的下标映射为褪色后的像素值（已按画面的像素格式打包），
+    # 褪色太弱的档位为 None，不做查表
+    # vignette 是和画面一样大的灰度图，用乘法混合叠上去
+    # wobble[相位] 是位移表，按偏移相同的连续行合并成 (起始行, 行数, 横向偏移)，偏移为0的行不记
+    def __init__(self, strength, size, shifts, alpha_mask):
+        self.strength = strength
+        amount = strength * MAX_DESATURATION
+        self.lut = self._build_lut(amount, shifts, alpha_mask) if amount >= MIN_DESATURATION else None
+        self.vignette = self._build_vignette(strength * MAX_VIGNETTE, size)
+        self.wobble = self._build_wobble(strength * MAX_WOBBLE, size[1])
+
+    @staticmethod
+    def _build_lut(amount, shifts, alpha_mask):
+        levels = np.arange(1 << LUT_BITS)
+        # 5位还原成8位时把高位补到低位，0 和 255 保持不变
+        values = (levels << (8 - LUT_BITS)) | (levels >> (2 * LUT_BITS - 8))
+        index = np.arange(1 << (3 * LUT_BITS))
+        mask = (1 << LUT_BITS) - 1
+        channels = [values[(index >> (2 * LUT_BITS)) & mask], values[(index >> LUT_BITS) & mask],
+                    values[index & mask]]
+        gray = 0.299 * channels[0] + 0.587 * channels[1] + 0.114 * channels[2]
+        lut = np.full(len(index), alpha_mask, dtype=np.uint32)
+        for channel, shift in zip(channels, shifts):
+            mixed = np.clip(np.rint(channel + (gray - channel) * amount), 0, 255).astype(np.uint32)
+            lut |= mixed << shift
+        return lut
+
+    @staticmethod
+    def _build_vignette(amount, size):
+        width, height = size
+        x = (np.arange(width) - (width - 1) / 2) / (width / 2)
+        y = (np.arange(height) - (height - 1) / 2) / (height / 2)
+        radius = np.sqrt(x[:, None] ** 2 + y[None, :] ** 2) / math.sqrt(2)
+        falloff = np.clip((radius - VIGNETTE_START) / (1 - VIGNETTE_START), 0, 1) ** 2
+        shade = np.rint(255 * (1 - amount * falloff)).astype(np.uint8)
+        surface = pygame.Surface(size)
+        pygame.surfarray.blit_array(surface, np.repeat(shade[:, :, None], 3, axis=2))
+        return surface
+
+    @staticmethod
+    def _build_wobble(amplitude, height):
+        rows = np.arange(height)
+        tables = []
+        for phase in range(WOBBLE_PHASES):
+            offsets = np.rint(amplitude * np.sin(
+                2 * math.pi * (rows / WOBBLE_WAVELENGTH + phase / WOBBLE_PHASES))).astype(int)
+            starts = np.concatenate(([0], np.flatnonzero(np.diff(offsets)) + 1, [height]))
+            tables.append([(int(start), int(end - start), int(offsets[start]))
+                           for start, end in zip(starts[:-1], starts[1:]) if offsets[start]])
+        return tables
+
+
+class SanEffect:
+    # 按玩家 san 值给整帧画面做后处理，在绘制完、显示之前调用 apply()
+    # 每帧的开销是一次整帧查表（surfarray 直接改像素）、一次乘法混合和几十次分行 blit，
+    # 不分配新的整帧数组；画面尺寸或像素格式变化时清空缓存重新生成
+    def __init__(self):
+        self.bands = {}  # 档位 -> SanBand
+        self.builds = 0  # 生成过几档预计算数据
+        self._format = None
+        self._steps = None  # 从像素值拼出查找表下标的 (右移位数, 掩码)，只支持 32 位像素
+        self._index = None
+        self._scratch = None
+        self._copy = None  # 波动时用的整帧副本
+
+    @staticmethod
+    def band_of(san):
+        # 高于阈值时没有效果，返回 None
+        if san >= SAN_THRESHOLD:
+            return None
+        return max(0, int(san)) // BAND_SIZE
+
+    @staticmethod
+    def band_strength(band):
+        return (SAN_THRESHOLD - band * BAND_SIZE) / SAN_THRESHOLD
+
+    def _prepare(self, surface):
+        surface_format = (surface.get_size(), surface.get_bytesize(), surface.get_shifts(),
+                          surface.get_masks())
+        if surface_format == self._format:
+            return
+        self._format = surface_format
+        self.bands.clear()
+        width, height = surface.get_size()
+        self._copy = surface.copy()
+        self._steps = None
+        if surface.get_bytesize() == 4:
+            shifts = surface.get_shifts()[:3]
+            self._steps = [(shift + 8 - LUT_BITS - position * LUT_BITS,
+                            ((1 << LUT_BITS) - 1) << (position * LUT_BITS))
+                           for shift, position in zip(shifts, (2, 1, 0))]
+            self._index = np.empty((height, width), dtype=np.intp)
+            self._scratch = np.empty((height, width), dtype=np.intp)
+
+    def _band(self, band, surface):
+        tables = self.bands.get(band)
+        if tables is None:
+            shifts = surface.get_shifts()[:3]
+            tables = self.bands[band] = SanBand(self.band_strength(band), surface.get_size(), shifts,
+                                                surface.get_masks()[3])
+            self.builds += 1
+        return tables
+
+    def apply(self, surface, san, now):
+        # now 为游戏时间（毫秒），决定波动的相位
+        band = self.band_of(san)
+        if band is None:
+            return
+        self._prepare(surface)
+        tables = self._band(band, surface)
+        self._wobble(surface, tables.wobble[int(now * WOBBLE_PHASES // WOBBLE_PERIOD) % WOBBLE_PHASES])
+        if self._steps is not None and tables.lut is not None:
+            self._recolor(surface, tables.lut)
+        surface.blit(tables.vignette, (0, 0), special_flags=pygame.BLEND_RGB_MULT)
+
+    def _wobble(self, surface, runs):
+        if not runs:
+            return
+        copy = self._copy
+        copy.blit(surface, (0, 0))
+        width = surface.get_width()
+        for y, height, dx in runs:
+            surface.blit(copy, (dx, y), (0, y, width, height))
+
+    def _recolor(self, surface, lut):
+        # 转置后按行连续，和 _index 的布局一致
+        pixels = pygame.surfarray.pixels2d(surface).T
+        index, scratch = self._index, self._scratch
+        for i, (amount, mask) in enumerate(self._steps):
+            target = index if i == 0 else scratch
+            if amount >= 0:
+                np.right_shift(pixels, amount, out=target)
+            else:
+                np.left_shift(pixels, -amount, out=target)
+            np.bitwise_and(target, mask, out=target)
+            if i:
+                np.bitwise_or(index, scratch, out=index)
+        np.take(lut, index, out=pixels, mode="clip")
+        # 释放像素数组，解除 surface 的锁定
+        del pixels
@@ -2,12 +2,21 @@ import pygame
 import math
 from enum import Enum
 import random
+import bisect
+import copy
+from collections import deque
+import numpy as np
+import time
+import argparse
+import contextlib
+import json
+import hashlib
+from alloc_monitor import AllocationMonitor
+from frame_profiler import FrameProfiler
+from replay import Replay, dump_state, load_state, numbered_path
+from telemetry import Telemetry
 
-# 初始化
-pygame.init()
 WINDOW_SIZE = (1200, 900)
-screen = pygame.display.set_mode(WINDOW_SIZE)
-pygame.display.set_caption("音律战境")
 
 # 颜色定义
 BLACK = (0, 0, 0)
@@ -17,210 +26,544 @@ RED = (255, 50, 50)
 YELLOW = (255, 255, 0)
 GREEN = (0, 255, 0)
 
+DEBUG_LOG = True  # 是否输出调试信息，无头模式下关闭
+
+def debug_log(message):
+    if DEBUG_LOG:
+        print(message)
+
+_FONTS = {}
+
+def get_font(size):
+    # 按字号缓存字体，绘制时不再每帧重新加载；游戏状态里不保存字体对象
+    font = _FONTS.get(size)
+    if font is None:
+        font = _FONTS[size] = pygame.font.Font(None, size)
+    return font
+
+class ArenaGeometry:
+    # 场地几何信息：圆环半径、音波判定带和中心点，创建后不再修改，所有对象共享同一份
+    # 圆环按半径从内到外编号，所有按半径的查找都是对有序数组二分，与圆环数量无关
+    def __init__(self, center, ring_radii, ring_width):
+        self.center = (int(center[0]), int(center[1]))
+        self.ring_radii = tuple(ring_radii)
+        self.ring_width = ring_width
+        if not self.ring_radii:
+            raise ValueError("arena needs at least one ring")
+        if any(b - a <= ring_width for a, b in zip(self.ring_radii, self.ring_radii[1:])):
+            raise ValueError("ring radii must be increasing and bands must not overlap")
+        self.ring_count = len(self.ring_radii)
+        self.outer_ring = self.ring_count - 1  # 最外圈编号，战士出生和返回的位置
+        self.max_radius = self.ring_radii[-1]
+        half = ring_width / 2
+        # 每个圆环的判定带 [下界, 上界]
+        self.ring_bands = tuple((r - half, r + half) for r in self.ring_radii)
+        self.band_lows = tuple(low for low, _ in self.ring_bands)
+        self.band_highs = tuple(high for _, high in self.ring_bands)
+
+    def note_value(self, ring_index):
+        # 音符价值：最外圈2点，每靠近中心+2；也是移动到该圆环的消耗
+        return (self.outer_ring - ring_index) * 2
+
+    def rings_near(self, radius, reach):
+        # 返回圆环半径与 radius 相差小于 reach 的所有圆环编号
+        return range(bisect.bisect_right(self.ring_radii, radius - reach),
+                     bisect.bisect_left(self.ring_radii, radius + reach))
+
+    def ring_at(self, radius):
+        # 返回半径所在判定带的圆环编号，不在任何圆环上时返回None
+        i = bisect.bisect_right(self.band_lows, radius) - 1
+        if i >= 0 and radius <= self.band_highs[i]:
+            return i
+        return None
+
+    def rings_crossed(self, old_radius, new_radius):
+        # 半径从 old_radius 移动到 new_radius 时跨过（含终点、不含起点）的圆环编号
+        if new_radius >= old_radius:
+            return range(bisect.bisect_right(self.ring_radii, old_radius),
+                         bisect.bisect_right(self.ring_radii, new_radius))
+        return range(bisect.bisect_left(self.ring_radii, new_radius),
+                     bisect.bisect_left(self.ring_radii, old_radius))
+
+    def bands_entered(self, old_radius, new_radius):
+        # 向外扩散时从 old_radius 到 new_radius 之间进入的判定带（下界被跨过）
+        return range(bisect.bisect_right(self.band_lows, old_radius),
+                     bisect.bisect_right(self.band_lows, new_radius))
+
+    def next_band_low(self, radius):
+        # 大于 radius 的最近判定带下界，没有时返回None
+        i = bisect.bisect_right(self.band_lows, radius)
+        return self.band_lows[i] if i < self.ring_count else None
+
+    def prev_band_high(self, radius):
+        # 小于 radius 的最近判定带上界，没有时返回None
+        i = bisect.bisect_left(self.band_highs, radius)
+        return self.band_highs[i - 1] if i > 0 else None
+
+    def prev_ring_radius(self, radius):
+        # 小于 radius 的最近圆环半径，没有时返回None
+        i = bisect.bisect_left(self.ring_radii, radius)
+        return self.ring_radii[i - 1] if i > 0 else None
+
+def make_arena(ring_count=6, ring_spacing=50, ring_width=15):
+    # 以窗口中心为圆心、等间距排布的场地；圆环很密时收窄判定带，保证相邻判定带不重叠
+    radii = [ring_spacing * (i + 1) for i in range(ring_count)]
+    return ArenaGeometry((WINDOW_SIZE[0]//2, WINDOW_SIZE[1]//2), radii,
+                         min(ring_width, ring_spacing / 2))
+
+ARENA = make_arena()
+
+class PolarProjector:
+    # 批量把 (角度, 圆环编号) 转换为屏幕坐标，输入没有变化时直接复用上次的结果
+    def __init__(self, geometry=ARENA):
+        self.geometry = geometry
+        self.ring_radii = np.asarray(geometry.ring_radii, dtype=float)
+        self.points = np.empty((0, 2))  # 浮点坐标，用于碰撞检测
+        self.pixels = np.empty((0, 2), dtype=int)  # 整数坐标，用于绘制
+        self._key = None
+
+    def project(self, angles, rings):
+        angles = np.asarray(angles, dtype=float)
+        rings = np.asarray(rings, dtype=np.intp)
+        key = (angles.tobytes(), rings.tobytes())
+        if key != self._key:
+            cx, cy = self.geometry.center
+            radii = self.ring_radii[rings]
+            self.points = np.column_stack((cx + np.cos(angles) * radii,
+                                           cy + np.sin(angles) * radii))
+            self.pixels = self.points.astype(int)
+            self._key = key
+        return self.points
+
+    def project_objects(self, objects):
+        # 适用于带有 angle 和 ring_index 属性的对象（音符能量、战士）
+        count = len(objects)
+        angles = np.fromiter((o.angle for o in objects), dtype=float, count=count)
+        rings = np.fromiter((o.ring_index for o in objects), dtype=np.intp, count=count)
+        return self.project(angles, rings)
+
+class SectorIndex:
+    # 按 (圆环, 角度扇区) 给战士分桶，飞弹只需检测所在圆环和附近扇区里的战士
+    def __init__(self, geometry=ARENA, sector_count=64):
+        self.geometry = geometry
+        self.sector_count = sector_count
+        self.sector_width = 2 * math.pi / sector_count
+        self.buckets = {}
+        self.keys = []
+
+    def sector_of(self, angle):
+        return int((angle % (2 * math.pi)) / self.sector_width) % self.sector_count
+
+    def rebuild(self, warriors):
+        self.buckets = {}
+        self.keys = []
+        for i, warrior in enumerate(warriors):
+            key = (warrior.ring_index, self.sector_of(warrior.angle))
+            self.buckets.setdefault(key, []).append(i)
+            self.keys.append(key)
+
+    def relocate(self, i, warrior):
+        # 战士的圆环或角度变化后，把它移到新的桶里
+        self.buckets[self.keys[i]].remove(i)
+        key = (warrior.ring_index, self.sector_of(warrior.angle))
+        self.buckets.setdefault(key, []).append(i)
+        self.keys[i] = key
+
+    def candidates(self, radius, angle, reach):
+        # 以极坐标 (radius, angle) 为中心、reach 为半径的范围内可能存在的战士编号
+        rings = self.geometry.rings_near(radius, reach)
+        if not rings:
+            return
+        # 以 reach 为半径的圆在中心点看来张开的角度，靠近中心时直接检查整圈
+        if reach >= radius:
+            span = self.sector_count
+        else:
+            span = int(math.asin(reach / radius) / self.sector_width) + 1
+        center = self.sector_of(angle)
+        if 2 * span + 1 >= self.sector_count:
+            sectors = range(self.sector_count)
+        else:
+            sectors = [(center + k) % self.sector_count for k in range(-span, span + 1)]
+        for ring in rings:
+            for sector in sectors:
+                yield from self.buckets.get((ring, sector), ())
+
+ECHO_BINS = 360  # 回声直方图的角度分桶数
+TICKS_PER_SECOND = 60  # 逻辑帧率（x1 速度时）
+
+class TempoMap:
+    # 速度表：[(起始逻辑帧, BPM), ...]，把逻辑帧换算成拍数
+    def __init__(self, segments, ticks_per_second=TICKS_PER_SECOND):
+        self.segments = sorted(segments)
+        if not self.segments or self.segments[0][0] != 0:
+            raise ValueError("tempo map must start at tick 0")
+        self.ticks_per_second = ticks_per_second
+        self.start_ticks = [tick for tick, _ in self.segments]
+        # 每段开始时已经累计的拍数
+        self.start_beats = [0.0]
+        for (tick, bpm), (next_tick, _) in zip(self.segments, self.segments[1:]):
+            self.start_beats.append(self.start_beats[-1] + self._beats(next_tick - tick, bpm))
+
+    @classmethod
+    def constant(cls, bpm, ticks_per_second=TICKS_PER_SECOND):
+        return cls([(0, bpm)], ticks_per_second)
+
+    def _beats(self, ticks, bpm):
+        return ticks / self.ticks_per_second * bpm / 60
+
+    def beat_at(self, tick):
+        i = bisect.bisect_right(self.start_ticks, tick) - 1
+        start_tick, bpm = self.segments[i]
+        return self.start_beats[i] + self._beats(tick - start_tick, bpm)
+
+class BeatClock:
+    # 节拍时钟：每个逻辑帧推进一次，on_beat 表示本帧跨过了一个拍点
+    def __init__(self, tempo_map):
+        self.tempo_map = tempo_map
+        self.tick = 0
+        self.beat = 0.0
+        self.on_beat = False
+
+    def advance(self):
+        self.tick += 1
+        beat = self.tempo_map.beat_at(self.tick)
+        self.on_beat = math.floor(beat) > math.floor(self.beat)
+        self.beat = beat
+
 class WaveState(Enum):
     EXPANDING = 1
     CONTRACTING = 2
 
 class NoteEnergy:
-    def __init__(self, angle, ring_index):
+    def __init__(self, angle, ring_index, geometry=ARENA):
         self.angle = angle
         self.ring_index = ring_index
-        self.value = (5 - ring_index) * 2  # 最外圈2点，每靠近中心+2
+        self.value = geometry.note_value(ring_index)  # 最外圈2点，每靠近中心+2
         self.collected = False
-        print(f"Created note energy at ring {ring_index} with value {self.value}")  # Debug
+        debug_log(f"Created note energy at ring {ring_index} with value {self.value}")  # Debug
 
 class Wave:
-    def __init__(self):
+    SPEED = 2
+    # beat_clock 不为空时，音波经过每个圆环都会停在圆环上，直到下一个拍点再继续
+    # rng 为生成音符用的随机数生成器，World 传入自己的生成器，对局可以按种子复现
+    def __init__(self, geometry=ARENA, beat_clock=None, rng=None):
+        self.geometry = geometry
+        self.beat_clock = beat_clock
+        self.rng = rng if rng is not None else random.Random()
+        self.dwelling = False
         self.radius = 0
         self.state = WaveState.EXPANDING
-        self.speed = 2  # 降低音波速度
-        self.ring_radii = [50, 100, 150, 200, 250, 300]
-        self.ring_width = 15  # 增加音波宽度，让音波在圆环上停留更久
-        self.absorbed_positions = []
+        self.speed = Wave.SPEED  # 降低音波速度
+        self.ring_radii = geometry.ring_radii
+        self.ring_width = geometry.ring_width  # 增加音波宽度，让音波在圆环上停留更久
+        self.current_ring = geometry.ring_at(self.radius)  # 本帧音波所在圆环，每帧只计算一次
+        self.note_projector = PolarProjector(geometry)
+        # 回声直方图：按角度分桶记录本轮音波被战士吸收的次数
+        self.echo_bins = np.zeros(ECHO_BINS, dtype=np.int32)
+        self.returned_echo = 0  # 音波返回中心的那一帧结算给Boss的能量
+        self.echo_peak = None  # 上一轮回声最强的方向（弧度），音波返回中心时更新
         self.wave_id = 0
+        self.notes_version = 0  # 每次生成音符后加一，用来判断圆环汇总是否需要重建
         self.note_energies = []
         self.rings_passed = set()
         self.warriors_energized = set()
         
     def is_on_ring(self, ring_index):
-        # 检查音波是否在指定圆环上
-        ring_radius = self.ring_radii[ring_index]
-        return abs(self.radius - ring_radius) <= self.ring_width / 2
+        # 检查音波是否在指定圆环上（直接读取本帧缓存的结果）
+        return self.current_ring == ring_index
         
+    def record_absorption(self, angle):
+        # 战士在 angle 方向吸收了音波能量，O(1) 记入直方图
+        self.echo_bins[int(angle % (2 * math.pi) / (2 * math.pi) * ECHO_BINS) % ECHO_BINS] += 1
+
     def update(self):
         old_radius = self.radius
+        self.returned_echo = 0
+        
+        if self.dwelling:
+            # 随节奏停留在圆环上，拍点到来后下一帧继续移动
+            if self.beat_clock.on_beat:
+                self.dwelling = False
+            return
         
         if self.state == WaveState.EXPANDING:
             self.radius += self.speed
+            self.dwell_on_ring(old_radius)
             # 检查是否首次经过某个圆环
-            for i, ring_radius in enumerate(self.ring_radii):
-                if (old_radius < ring_radius - self.ring_width/2 and 
-                    self.radius >= ring_radius - self.ring_width/2):
-                    if (self.wave_id, i) not in self.rings_passed:
-                        print(f"Wave {self.wave_id} passing ring {i}")  # Debug
-                        self.spawn_note_energies(i)
-                        self.rings_passed.add((self.wave_id, i))
+            for i in self.geometry.bands_entered(old_radius, self.radius):
+                if (self.wave_id, i) not in self.rings_passed:
+                    debug_log(f"Wave {self.wave_id} passing ring {i}")  # Debug
+                    self.spawn_note_energies(i)
+                    self.rings_passed.add((self.wave_id, i))
             
-            if self.radius >= max(self.ring_radii):
+            if self.radius >= self.geometry.max_radius:
                 self.state = WaveState.CONTRACTING
         else:
             self.radius -= self.speed
+            self.dwell_on_ring(old_radius)
             if self.radius <= 0:
                 self.state = WaveState.EXPANDING
                 self.wave_id += 1
-                self.absorbed_positions.clear()
+                # 每轮音波只结算一次Boss能量
+                self.returned_echo = int(self.echo_bins.sum())
+                if self.returned_echo:
+                    self.echo_peak = (int(self.echo_bins.argmax()) + 0.5) * (2 * math.pi / ECHO_BINS)
+                self.echo_bins[:] = 0
+        
+        self.current_ring = self.geometry.ring_at(self.radius)
                 
+    def dwell_on_ring(self, old_radius):
+        # 跨过某个圆环时停在圆环正中，等待节拍
+        if self.beat_clock is None:
+            return
+        crossed = self.geometry.rings_crossed(old_radius, self.radius)
+        if crossed:
+            # 停在最先到达的圆环上
+            i = crossed[0] if self.state == WaveState.EXPANDING else crossed[-1]
+            self.radius = self.ring_radii[i]
+            self.dwelling = True
+
     def spawn_note_energies(self, ring_index):
         # 在圆环上随机生成1-2个音符能量
-        num_notes = random.randint(1, 2)
+        num_notes = self.rng.randint(1, 2)
         for _ in range(num_notes):
-            angle = random.uniform(0, 2 * math.pi)
-            note = NoteEnergy(angle, ring_index)
-            print(f"Spawned note at ring {ring_index}, angle {angle:.2f} with value {note.value}")  # Debug
+            angle = self.rng.uniform(0, 2 * math.pi)
+            note = NoteEnergy(angle, ring_index, self.geometry)
+            debug_log(f"Spawned note at ring {ring_index}, angle {angle:.2f} with value {note.value}")  # Debug
             self.note_energies.append(note)
+        self.notes_version += 1
             
-    def draw(self, screen):
-        # 绘制音波
-        pygame.draw.circle(screen, BLUE, (WINDOW_SIZE[0]//2, WINDOW_SIZE[1]//2), 
-                         self.radius, 2)
-        # 绘制固定圆环
+    def draw_rings(self, surface):
+        # 绘制固定圆环（只在构建静态图层时调用一次）
         for radius in self.ring_radii:
-            pygame.draw.circle(screen, WHITE, 
-                             (WINDOW_SIZE[0]//2, WINDOW_SIZE[1]//2), 
-                             radius, self.ring_width)
-        # 绘制音符能量
-        for note in self.note_energies:
-            if not note.collected:
-                x = (WINDOW_SIZE[0]//2 + math.cos(note.angle) * 
-                     self.ring_radii[note.ring_index])
-                y = (WINDOW_SIZE[1]//2 + math.sin(note.angle) * 
-                     self.ring_radii[note.ring_index])
-                pygame.draw.circle(screen, YELLOW, (int(x), int(y)), 6)
+            pygame.draw.circle(surface, WHITE, self.geometry.center, radius,
+                               max(1, int(self.ring_width)))
+
+    def draw(self, screen, note_sprite):
+        # 绘制音波
+        pygame.draw.circle(screen, BLUE, self.geometry.center, self.radius, 2)
+        # 绘制音符能量（批量贴图）
+        notes = [note for note in self.note_energies if not note.collected]
+        self.note_projector.project_objects(notes)
+        offset = note_sprite.get_width() // 2
+        screen.blits([(note_sprite, (x - offset, y - offset))
+                      for x, y in self.note_projector.pixels.tolist()], False)
+
+    def prune_collected_notes(self):
+        # 丢弃已被收集的音符，避免列表随对局时长无限增长
+        self.note_energies = [note for note in self.note_energies if not note.collected]
 
-    def give_initial_energy(self, warrior):
+    def give_initial_energy(self, warrior, world):
         # 音波第一次经过战士时给予能量
         warrior_key = (self.wave_id, id(warrior))
         if warrior_key not in self.warriors_energized:
             warrior.note_energy += 2  # 提供2点初始能量
             # 50%进入集体能量池
             collective_gain = 1
-            NoteWarrior.collective_energy = min(
-                NoteWarrior.collective_energy + collective_gain,
-                NoteWarrior.COLLECTIVE_ENERGY_MAX
-            )
+            world.add_collective_energy(collective_gain)
             self.warriors_energized.add(warrior_key)
-            print(f"Wave {self.wave_id} gave warrior initial energy. Warrior energy: {warrior.note_energy}, Added to collective: {collective_gain}")
+            self.record_absorption(warrior.angle)
+            debug_log(f"Wave {self.wave_id} gave warrior initial energy. Warrior energy: {warrior.note_energy}, Added to collective: {collective_gain}")
+
+class RingSummary:
+    # 每个逻辑帧构建一次：各圆环上未收集音符的能量总和，以及按角度排序的音符
+    # 所有战士共用这份汇总做决策，不再各自反复扫描全部音符
+    # 只为有音符的圆环建立列表，构建开销与圆环数量无关
+    def __init__(self, wave):
+        per_ring = {}
+        for note in wave.note_energies:
+            if not note.collected:
+                per_ring.setdefault(note.ring_index, []).append(
+                    (note.angle % (2 * math.pi), id(note), note))
+        self.angles = {}
+        self.notes = {}
+        self.energy = np.zeros(wave.geometry.ring_count)
+        for i, entries in per_ring.items():
+            entries.sort()
+            self.angles[i] = [angle for angle, _, _ in entries]
+            self.notes[i] = [note for _, _, note in entries]
+            self.energy[i] = sum(note.value for note in self.notes[i])
+
+    def has_energy(self, ring_index):
+        return bool(self.notes.get(ring_index))
+
+    def nearest(self, ring_index, angle):
+        # 返回圆环上角度最近的音符及带符号的角度差，没有音符时返回 (None, 0)
+        angles = self.angles.get(ring_index)
+        if not angles:
+            return None, 0
+        angle %= 2 * math.pi
+        pos = bisect.bisect_left(angles, angle)
+        best_note = None
+        best_diff = math.pi
+        # 排序后的相邻两个音符就是顺时针和逆时针方向上最近的
+        for k in (pos - 1, pos % len(angles)):
+            diff = (angles[k] - angle + math.pi) % (2 * math.pi) - math.pi
+            if best_note is None or abs(diff) < abs(best_diff):
+                best_note = self.notes[ring_index][k]
+                best_diff = diff
+        return best_note, best_diff
+
+    def remove(self, note):
+        # 音符被收集后从汇总中移除
+        ring_index = note.ring_index
+        notes = self.notes[ring_index]
+        pos = bisect.bisect_left(self.angles[ring_index], note.angle % (2 * math.pi))
+        while notes[pos] is not note:
+            pos += 1
+        del notes[pos]
+        del self.angles[ring_index][pos]
+        self.energy[ring_index] -= note.value
+
+STRATEGIES = ('aggressive', 'balanced', 'conservative')
+STRATEGY_INDEX = {name: i for i, name in enumerate(STRATEGIES)}
+
+class StrategyParams:
+    # 三种策略的可调参数，每项都按 STRATEGIES 的顺序各有一个值
+    # join_thresholds: 加入旋律冲击波所需能量
+    # ring_weight_scales: 圆环偏好系数（激进型看重内圈、平衡型偏好中间层级、保守型看重外圈）
+    # min_reserves: 跟随音波换圆环后至少要保留的能量
+    NAMES = tuple(f"{field}.{strategy}"
+                  for field in ('join_thresholds', 'ring_weight_scales', 'min_reserves')
+                  for strategy in STRATEGIES)
+
+    def __init__(self, join_thresholds=(30, 50, 80), ring_weight_scales=(1.2, 1.5, 1.1),
+                 min_reserves=(5, 8, 12)):
+        self.join_thresholds = dict(zip(STRATEGIES, join_thresholds))
+        self.ring_weight_scales = tuple(ring_weight_scales)
+        self.min_reserves = dict(zip(STRATEGIES, min_reserves))
+
+    def to_vector(self):
+        return ([self.join_thresholds[s] for s in STRATEGIES] + list(self.ring_weight_scales) +
+                [self.min_reserves[s] for s in STRATEGIES])
+
+    @classmethod
+    def from_vector(cls, vector):
+        vector = list(vector)
+        if len(vector) != len(cls.NAMES):
+            raise ValueError(f"expected {len(cls.NAMES)} strategy parameters, got {len(vector)}")
+        return cls(vector[0:3], vector[3:6], vector[6:9])
+
+    def to_dict(self):
+        return dict(zip(self.NAMES, self.to_vector()))
+
+    @classmethod
+    def from_dict(cls, values):
+        return cls.from_vector(values[name] for name in cls.NAMES)
+
+    def ring_weights(self, ring_count):
+        return strategy_ring_weights(ring_count, self.ring_weight_scales)
+
+DEFAULT_PARAMS = StrategyParams()
+
+_RING_WEIGHT_CACHE = {}
+
+def strategy_ring_weights(ring_count, scales=DEFAULT_PARAMS.ring_weight_scales):
+    # 各策略对每个圆环能量的偏好系数，行顺序与 STRATEGIES 一致；按圆环数量和系数缓存
+    key = (ring_count, scales)
+    weights = _RING_WEIGHT_CACHE.get(key)
+    if weights is None:
+        weights = _RING_WEIGHT_CACHE[key] = _build_ring_weights(ring_count, scales)
+    return weights
+
+def _build_ring_weights(ring_count, scales):
+    aggressive, balanced, conservative = scales
+    rings = np.arange(ring_count)
+    # 中间三分之一的圆环（6个圆环时为第2、3圈）
+    middle = (rings * 3 >= ring_count) & (rings * 3 < ring_count * 2)
+    return np.array([
+        (ring_count - rings) * aggressive,  # 激进型更看重内圈
+        np.where(middle, balanced, 1.0),  # 平衡型偏好中间层级
+        (rings + 1) * conservative,  # 保守型更看重外圈的安全能量
+    ])
+
+def find_best_rings(warriors, summary, params=DEFAULT_PARAMS):
+    # 批量计算所有战士的最佳目标圆环，返回 (目标圆环数组, 价值数组)
+    count = len(warriors)
+    rings = np.fromiter((w.ring_index for w in warriors), dtype=np.intp, count=count)
+    strategies = np.fromiter((STRATEGY_INDEX[w.strategy] for w in warriors),
+                             dtype=np.intp, count=count)
+    energy = summary.energy
+    ring_ids = np.arange(len(energy))
+    # 根据策略调整圆环价值，并扣除移动成本
+    values = (energy * params.ring_weights(len(energy))[strategies]
+              - np.abs(ring_ids - rings[:, None]) * 2)
+    values[:, energy == 0] = -np.inf
+    if count == 0 or len(energy) == 0:
+        return rings, np.zeros(count)
+    best = values.argmax(axis=1)
+    best_values = values[np.arange(count), best]
+    # 没有价值为正的圆环时留在原地
+    stay = best_values <= 0
+    best[stay] = rings[stay]
+    best_values[stay] = 0
+    return best, best_values
 
 class NoteWarrior:  # 原Enemy类改名
-    def __init__(self, angle, strategy, warrior_id):
+    ANGULAR_SPEED = 0.05
+    
+    def __init__(self, angle, strategy, warrior_id, geometry=ARENA, params=DEFAULT_PARAMS):
+        self.geometry = geometry
+        self.params = params
         self.angle = angle
-        self.ring_index = 5
+        self.ring_index = geometry.outer_ring
         self.note_energy = 0
         self.move_cooldown = 0
         self.health = 100
-        self.angular_speed = 0.05
+        self.angular_speed = NoteWarrior.ANGULAR_SPEED
         self.move_direction = 0
         self.is_moving = False
         self.energy_change_display = []
         self.strategy = strategy
+        self.melody_wave = None  # 正在搭乘的旋律冲击波，None 表示没有搭乘
         self.warrior_id = warrior_id  # 存储战士ID
         
     def add_energy_display(self, value):
         # 添加能量变化显示
         self.energy_change_display.append((value, 60))  # 显示60帧
         
-    def check_ring_energy(self, wave):
+    def check_ring_energy(self, summary):
         # 检查当前圆环上是否还有可收集的能量
-        for note in wave.note_energies:
-            if (not note.collected and note.ring_index == self.ring_index):
-                return True
-        return False
+        return summary.has_energy(self.ring_index)
         
     def estimate_melody_cost(self, target_ring):
         # 估算搭乘冲击波到达目标圆环需要的能量
         total_cost = 0
         current_ring = self.ring_index
         while current_ring > target_ring:
-            cost = (5 - current_ring) * 2 * 0.5  # 50%的正常消耗
+            cost = self.geometry.note_value(current_ring) * 0.5  # 50%的正常消耗
             total_cost += cost
             current_ring -= 1
         return total_cost
         
     def should_join_melody_wave(self):
         # 只根据能量和策略判断是否加入
-        if self.strategy == 'aggressive':
-            return self.note_energy >= 30
-        elif self.strategy == 'balanced':
-            return self.note_energy >= 50
-        else:  # conservative
-            return self.note_energy >= 80
+        return self.note_energy >= self.params.join_thresholds[self.strategy]
                 
-    def calculate_ring_energy(self, wave, ring_index):
+    def calculate_ring_energy(self, summary, ring_index):
         # 计算指定圆环上的可用能量总和
-        total_energy = 0
-        for note in wave.note_energies:
-            if not note.collected and note.ring_index == ring_index:
-                total_energy += (5 - ring_index) * 2
-        return total_energy
+        return summary.energy[ring_index]
         
-    def find_best_ring(self, wave):
+    def find_best_ring(self, summary):
         # 寻找能量最丰富的圆环，考虑战略偏好
-        best_ring = self.ring_index
-        max_value = 0
-        
-        for i in range(6):  # 检查所有圆环
-            ring_energy = self.calculate_ring_energy(wave, i)
-            if ring_energy == 0:
-                continue
-                
-            # 根据策略调整圆环价值
-            strategic_value = ring_energy
-            if self.strategy == 'aggressive':
-                # 激进型更看重内圈
-                strategic_value *= (6 - i) * 1.2
-            elif self.strategy == 'balanced':
-                # 平衡型偏好中间层级
-                if 2 <= i <= 3:
-                    strategic_value *= 1.5
-            else:  # conservative
-                # 保守型更看重外圈的安全能量
-                strategic_value *= (i + 1) * 1.1
-                
-            # 考虑移动成本
-            move_cost = abs(i - self.ring_index) * 2
-            strategic_value -= move_cost
-            
-            if strategic_value > max_value:
-                max_value = strategic_value
-                best_ring = i
-                
-        return best_ring, max_value
+        best, values = find_best_rings([self], summary, self.params)
+        return int(best[0]), float(values[0])
         
-    def move(self, wave):
+    def move(self, wave, summary, best_choice=None):
+        # best_choice 为批量决策阶段算好的 (目标圆环, 价值)，未提供时单独计算
         if self.move_cooldown > 0:
             self.move_cooldown -= 1
             return
             
         # 环形移动（必须在音波上）
         if wave.is_on_ring(self.ring_index):
-            # 检查周围是否有音符能量
-            nearby_energy = False
-            closest_angle_diff = math.pi
-            best_direction = 0
-            
             # 寻找最近的能量
-            for note in wave.note_energies:
-                if not note.collected and note.ring_index == self.ring_index:
-                    angle_diff = (note.angle - self.angle + math.pi) % (2 * math.pi) - math.pi
-                    if abs(angle_diff) < abs(closest_angle_diff):
-                        closest_angle_diff = angle_diff
-                        best_direction = 1 if angle_diff > 0 else -1
-                        nearby_energy = True
+            note, angle_diff = summary.nearest(self.ring_index, self.angle)
             
-            if nearby_energy:
-                self.move_direction = best_direction
+            if note is not None:
+                self.move_direction = 1 if angle_diff > 0 else -1
                 self.is_moving = True
-                print(f"Warrior at ring {self.ring_index} moving towards energy, angle: {self.angle:.2f}")  # Debug
+                debug_log(f"Warrior at ring {self.ring_index} moving towards energy, angle: {self.angle:.2f}")  # Debug
             else:
                 self.is_moving = False
                 self.move_direction = 0
@@ -228,82 +571,71 @@ class NoteWarrior:  # 原Enemy类改名
             if self.is_moving:
                 old_angle = self.angle
                 self.angle = (self.angle + self.angular_speed * self.move_direction) % (2 * math.pi)
-                print(f"Warrior moved from {old_angle:.2f} to {self.angle:.2f}")  # Debug
+                debug_log(f"Warrior moved from {old_angle:.2f} to {self.angle:.2f}")  # Debug
         else:
             self.is_moving = False
             self.move_direction = 0
             
         # 跨环移动时考虑策略
-        if not self.check_ring_energy(wave):
-            best_ring, max_value = self.find_best_ring(wave)
-            
-            if best_ring != self.ring_index:
-                can_move = (best_ring < self.ring_index and 
-                           wave.is_on_ring(best_ring) and 
-                           wave.state == WaveState.CONTRACTING) or \
-                          (best_ring > self.ring_index and 
-                           wave.is_on_ring(best_ring) and 
-                           wave.state == WaveState.EXPANDING)
-                           
-                if can_move:
-                    cost = (5 - best_ring) * 2
-                    min_reserve = 5 if self.strategy == 'aggressive' else (
-                        8 if self.strategy == 'balanced' else 12)
-                    if self.note_energy >= cost + min_reserve:
-                        print(f"{self.strategy} warrior moving to ring {best_ring} with value {max_value}")
-                        self.ring_index = best_ring
-                        self.note_energy -= cost
-                        self.add_energy_display(-cost)
-                        self.move_cooldown = 30
-                        self.is_moving = False
-
-    def draw(self, screen, ring_radii):
-        x = WINDOW_SIZE[0]//2 + math.cos(self.angle) * ring_radii[self.ring_index]
-        y = WINDOW_SIZE[1]//2 + math.sin(self.angle) * ring_radii[self.ring_index]
-        # 绘制战士圆球
-        pygame.draw.circle(screen, RED, (int(x), int(y)), 10)
-        if self.is_moving:
-            pygame.draw.circle(screen, YELLOW, (int(x), int(y)), 12, 1)
-            
-        # 绘制战士ID
-        font = pygame.font.Font(None, 20)
-        id_text = str(self.warrior_id)
-        text_surface = font.render(id_text, True, WHITE)
-        text_rect = text_surface.get_rect(center=(int(x), int(y)))
-        screen.blit(text_surface, text_rect)
+        if not self.check_ring_energy(summary):
+            if best_choice is None:
+                best_choice = self.find_best_ring(summary)
+            best_ring, max_value = best_choice
+            cost = self.ring_change_cost(wave, best_ring)
+            if cost is not None:
+                debug_log(f"{self.strategy} warrior moving to ring {best_ring} with value {max_value}")
+                self.ring_index = best_ring
+                self.note_energy -= cost
+                self.add_energy_display(-cost)
+                self.move_cooldown = 30
+                self.is_moving = False
 
-    def check_wave_collision(self, wave):
-        # 检查是否在音波上并收集能量
-        if wave.is_on_ring(self.ring_index):
-            wave.give_initial_energy(self)  # 检查是否需要给予初始能量
-            if self.collect_note_energy(wave):  # 收集音符能量
-                print(f"Warrior at ring {self.ring_index} collected energy, now has {self.note_energy}")  # Debug
+    def ring_change_cost(self, wave, best_ring):
+        # 当前能否跟随音波移动到 best_ring，能则返回能量消耗，否则返回 None
+        if best_ring == self.ring_index or not wave.is_on_ring(best_ring):
+            return None
+        can_move = (best_ring < self.ring_index and 
+                    wave.state == WaveState.CONTRACTING) or \
+                   (best_ring > self.ring_index and 
+                    wave.state == WaveState.EXPANDING)
+        if not can_move:
+            return None
+        cost = self.geometry.note_value(best_ring)
+        min_reserve = self.params.min_reserves[self.strategy]
+        if self.note_energy >= cost + min_reserve:
+            return cost
+        return None
 
-    def collect_note_energy(self, wave):
-        # 检查当前圆环上是否有可收集的能量
-        for note in wave.note_energies:
-            if (not note.collected and 
-                note.ring_index == self.ring_index and
-                abs((note.angle - self.angle + math.pi) % (2 * math.pi) - math.pi) < 0.2):  # 修正角度计算
-                note.collected = True
-                collected_value = (5 - note.ring_index) * 2  # 重新计算能量值
-                self.note_energy += collected_value
-                self.add_energy_display(collected_value)  # 显示获得的能量
-                
-                collective_gain = collected_value // 2
-                NoteWarrior.collective_energy = min(
-                    NoteWarrior.collective_energy + collective_gain,
-                    NoteWarrior.COLLECTIVE_ENERGY_MAX
-                )
-                # 打印调试信息
-                print(f"Warrior at angle {self.angle:.2f} collected energy at ring {note.ring_index}")
-                print(f"Base value: {collected_value}, Added to warrior: {collected_value}, New warrior energy: {self.note_energy}")
-                print(f"Added to collective: {collective_gain}, Total collective: {NoteWarrior.collective_energy}")
+    def check_wave_collision(self, wave, summary, world):
+        # 检查是否在音波上并收集能量，集体能量记在 world 上
+        if wave.is_on_ring(self.ring_index):
+            wave.give_initial_energy(self, world)  # 检查是否需要给予初始能量
+            if self.collect_note_energy(summary, world):  # 收集音符能量
+                wave.record_absorption(self.angle)
+                debug_log(f"Warrior at ring {self.ring_index} collected energy, now has {self.note_energy}")  # Debug
                 return True
         return False
 
-# 添加集体能量池
-NoteWarrior.collective_energy = 0
+    def collect_note_energy(self, summary, world):
+        # 检查当前圆环上是否有可收集的能量（取角度最近的音符）
+        note, angle_diff = summary.nearest(self.ring_index, self.angle)
+        if note is not None and abs(angle_diff) < 0.2:
+            note.collected = True
+            summary.remove(note)
+            collected_value = self.geometry.note_value(note.ring_index)  # 重新计算能量值
+            self.note_energy += collected_value
+            self.add_energy_display(collected_value)  # 显示获得的能量
+            
+            collective_gain = collected_value // 2
+            world.add_collective_energy(collective_gain)
+            # 打印调试信息
+            debug_log(f"Warrior at angle {self.angle:.2f} collected energy at ring {note.ring_index}")
+            debug_log(f"Base value: {collected_value}, Added to warrior: {collected_value}, New warrior energy: {self.note_energy}")
+            debug_log(f"Added to collective: {collective_gain}, Total collective: {world.collective_energy}")
+            return True
+        return False
+
+# 集体能量池记在每局的 World 上（World.collective_energy），这里只是上限
 NoteWarrior.COLLECTIVE_ENERGY_MAX = 20  # 满能量值
 
 class Boss:  # 原Player类改名
@@ -312,6 +644,9 @@ class Boss:  # 原Player类改名
         self.y = WINDOW_SIZE[1] // 2
         self.health = 200
         self.energy = 0
+        self.volley_size = 5  # 一次齐射最多发射的飞弹数
+        self.volley_spread = 0.4  # 齐射的总扇形角度（弧度）
+        self.missile_cost = 1  # 每枚飞弹消耗的能量
         
     def draw(self, screen):
         # 绘制Boss主体
@@ -326,47 +661,140 @@ class Boss:  # 原Player类改名
         pygame.draw.line(screen, WHITE, (self.x, self.y), (cursor_x, cursor_y), 2)
 
 class Missile:
-    def __init__(self, angle):
-        self.x = WINDOW_SIZE[0] // 2
-        self.y = WINDOW_SIZE[1] // 2
-        self.angle = angle
+    HIT_RADIUS = 15  # 碰撞半径
+
+    def __init__(self, angle, geometry=ARENA):
+        self.geometry = geometry
         self.speed = 5
+        self.reset(angle)
+
+    def reset(self, angle):
+        # 从对象池取出时重新发射
+        self.x, self.y = self.geometry.center
+        self.angle = angle
+        self.dx = math.cos(angle) * self.speed
+        self.dy = math.sin(angle) * self.speed
+        self.flown = 0  # 已飞行的帧数；位置由帧数直接算出，跳过安静帧时与逐帧更新完全一致
         self.active = True
     
     def update(self):
-        self.x += math.cos(self.angle) * self.speed
-        self.y += math.sin(self.angle) * self.speed
+        self.fly(1)
+
+    def fly(self, ticks):
+        self.flown += ticks
+        cx, cy = self.geometry.center
+        self.x = cx + self.dx * self.flown
+        self.y = cy + self.dy * self.flown
         # 超出屏幕边界时销毁
         if (self.x < 0 or self.x > WINDOW_SIZE[0] or 
             self.y < 0 or self.y > WINDOW_SIZE[1]):
             self.active = False
+
+    def quiet_ticks(self, points):
+        # 接下来肯定不会飞出屏幕、也不会碰到 points 里任何战士的帧数，
+        # 调用方保证这段时间里战士不动；按浮点误差多留一帧、碰撞半径多留1像素
+        cx, cy = self.geometry.center
+        exits = []
+        for d, c, size in ((self.dx, cx, WINDOW_SIZE[0]), (self.dy, cy, WINDOW_SIZE[1])):
+            if d < 0:
+                exits.append(-c / d)
+            elif d > 0:
+                exits.append((size - c) / d)
+        quiet = int(min(exits) - self.flown) - 1
+        if len(points):
+            # 第 n 帧与战士的距离平方为 |n*v - q|^2，解出进入碰撞半径的最早帧
+            qx = points[:, 0] - cx
+            qy = points[:, 1] - cy
+            along = qx * self.dx + qy * self.dy
+            speed2 = self.dx * self.dx + self.dy * self.dy
+            reach = self.HIT_RADIUS + 1
+            disc = along * along - speed2 * (qx * qx + qy * qy - reach * reach)
+            ahead = disc >= 0
+            if ahead.any():
+                root = np.sqrt(disc[ahead])
+                enter = (along[ahead] - root) / speed2
+                leave = (along[ahead] + root) / speed2
+                enter = enter[leave > self.flown]
+                if len(enter):
+                    quiet = min(quiet, int(math.floor(enter.min() - self.flown)) - 1)
+        return max(quiet, 0)
     
     def draw(self, screen):
         pygame.draw.circle(screen, YELLOW, (int(self.x), int(self.y)), 5)
     
-    def check_enemy_collision(self, enemy, ring_radii):
-        enemy_x = WINDOW_SIZE[0]//2 + math.cos(enemy.angle) * ring_radii[enemy.ring_index]
-        enemy_y = WINDOW_SIZE[1]//2 + math.sin(enemy.angle) * ring_radii[enemy.ring_index]
-        distance = math.sqrt((self.x - enemy_x)**2 + (self.y - enemy_y)**2)
-        if distance < 15:  # 碰撞半径
-            enemy.health -= 20
-            enemy.ring_index = min(5, enemy.ring_index + 1)  # 击中后向外移动
-            self.active = False
-            return True
+    def check_enemy_collision(self, enemies, sector_index, points):
+        # 先把飞弹位置换算成极坐标，只检测同一圆环附近扇区的战士
+        # points 为 PolarProjector 缓存的战士坐标
+        if not self.active:
+            return False
+        cx, cy = self.geometry.center
+        dx = self.x - cx
+        dy = self.y - cy
+        radius = math.hypot(dx, dy)
+        angle = math.atan2(dy, dx)
+        for i in sector_index.candidates(radius, angle, self.HIT_RADIUS):
+            ex, ey = points[i]
+            if (self.x - ex) ** 2 + (self.y - ey) ** 2 < self.HIT_RADIUS ** 2:
+                enemy = enemies[i]
+                enemy.health -= 20
+                old_ring = enemy.ring_index
+                enemy.ring_index = min(self.geometry.outer_ring, enemy.ring_index + 1)  # 击中后向外移动
+                if enemy.melody_wave is not None:
+                    enemy.melody_wave.move_rider(enemy, old_ring, enemy.ring_index)
+                sector_index.relocate(i, enemy)
+                self.active = False
+                return True
         return False
 
+class MissilePool:
+    # 预先创建飞弹对象，齐射时复用，避免频繁创建和销毁
+    def __init__(self, geometry=ARENA, size=32):
+        self.geometry = geometry
+        self.free = [Missile(0, geometry) for _ in range(size)]
+
+    def acquire(self, angle):
+        missile = self.free.pop() if self.free else Missile(angle, self.geometry)
+        missile.reset(angle)
+        return missile
+
+    def release(self, missile):
+        missile.active = False
+        self.free.append(missile)
+
+def index_free_warriors(warriors):
+    # 不在旋律冲击波上的战士按所在圆环分组，冲击波经过圆环时直接取出该圆环上的战士
+    index = {}
+    for warrior in warriors:
+        if warrior.melody_wave is None:
+            index.setdefault(warrior.ring_index, []).append(warrior)
+    return index
+
 class MelodyWave:
-    def __init__(self, boss, enemies):  # 添加 enemies 参数
-        self.radius = max(Wave().ring_radii)
+    def __init__(self, boss, enemies, geometry=ARENA):  # 添加 enemies 参数
+        self.geometry = geometry
+        self.radius = geometry.max_radius
         self.speed = 2
         self.active = True
         self.warriors = []
+        self.riders_by_ring = {}  # 按当前所在圆环索引的搭乘战士，换环时用 move_rider() 更新
         self.ring_width = 10
         self.boss = boss
         self.enemies = enemies  # 存储 enemies 引用
 
     def add_warrior(self, warrior):  # 添加缺失的方法
         self.warriors.append(warrior)
+        self.riders_by_ring.setdefault(warrior.ring_index, []).append(warrior)
+        warrior.melody_wave = self
+
+    def move_rider(self, warrior, old_ring, new_ring):
+        # 搭乘中的战士被飞弹击中换了圆环，之后在新圆环上获得能量
+        if old_ring == new_ring:
+            return
+        riders = self.riders_by_ring[old_ring]
+        riders.remove(warrior)
+        if not riders:
+            del self.riders_by_ring[old_ring]
+        self.riders_by_ring.setdefault(new_ring, []).append(warrior)
         
     def attack_boss(self):
         total_damage = sum(w.note_energy for w in self.warriors)
@@ -374,23 +802,26 @@ class MelodyWave:
         
     def return_warriors(self):
         for warrior in self.warriors:
-            warrior.ring_index = 5  # 返回最外圈
+            warrior.ring_index = self.geometry.outer_ring  # 返回最外圈
             warrior.note_energy = 0  # 消耗所有能量
+            warrior.melody_wave = None
             
-    def update(self):
+    def update(self, ring_warriors=None):
+        # ring_warriors 为 index_free_warriors() 建立的圆环索引，多道冲击波共用同一份
         old_radius = self.radius
         self.radius -= self.speed
         
-        ring_radii = Wave().ring_radii
-        for i, radius in enumerate(ring_radii):
-            if old_radius > radius and self.radius <= radius:
-                for warrior in [w for w in self.warriors if w.ring_index == i]:
-                    warrior.note_energy += 10
-                # 使用实例变量 self.enemies
-                for warrior in [w for w in self.enemies if w.ring_index == i and w not in self.warriors]:
-                    if warrior.should_join_melody_wave():
-                        self.add_warrior(warrior)
-                        print(f"Warrior {warrior.warrior_id} joined melody wave at ring {i}")
+        crossed = self.geometry.rings_crossed(old_radius, self.radius)
+        if crossed and ring_warriors is None:
+            ring_warriors = index_free_warriors(self.enemies)
+        for i in crossed:
+            for warrior in self.riders_by_ring.get(i, ()):
+                warrior.note_energy += 10
+            for warrior in ring_warriors.get(i, ()):
+                # 同一帧里可能已经被另一道冲击波带走
+                if warrior.melody_wave is None and warrior.should_join_melody_wave():
+                    self.add_warrior(warrior)
+                    debug_log(f"Warrior {warrior.warrior_id} joined melody wave at ring {i}")
         
         if self.radius <= 20:
             self.active = False
@@ -399,22 +830,23 @@ class MelodyWave:
 
     def draw(self, screen):
         # 绘制旋律冲击波
-        pygame.draw.circle(screen, RED, 
-                         (WINDOW_SIZE[0]//2, WINDOW_SIZE[1]//2), 
-                         int(self.radius), 3)
-        # 绘制搭载的战士
-        for warrior in self.warriors:
-            x = (WINDOW_SIZE[0]//2 + math.cos(warrior.angle) * self.radius)
-            y = (WINDOW_SIZE[1]//2 + math.sin(warrior.angle) * self.radius)
-            pygame.draw.circle(screen, YELLOW, (int(x), int(y)), 10)
+        cx, cy = self.geometry.center
+        pygame.draw.circle(screen, RED, (cx, cy), int(self.radius), 3)
+        # 绘制搭载的战士（批量计算坐标）
+        angles = np.fromiter((w.angle for w in self.warriors), dtype=float,
+                             count=len(self.warriors))
+        xs = (cx + np.cos(angles) * self.radius).astype(int).tolist()
+        ys = (cy + np.sin(angles) * self.radius).astype(int).tolist()
+        for warrior, x, y in zip(self.warriors, xs, ys):
+            pygame.draw.circle(screen, YELLOW, (x, y), 10)
             
             # 绘制能量变化
             for value, timer in warrior.energy_change_display:
                 if timer > 0:
                     color = GREEN if value > 0 else RED
                     text = f"+{value}" if value > 0 else str(value)
-                    text_surface = pygame.font.Font(None, 24).render(text, True, color)
-                    screen.blit(text_surface, (int(x) + 15, int(y) - 10))
+                    text_surface = get_font(24).render(text, True, color)
+                    screen.blit(text_surface, (x + 15, y - 10))
 
 class SpeedButton:
     def __init__(self, x, y, speed):
@@ -425,8 +857,8 @@ class SpeedButton:
     def draw(self, screen):
         color = GREEN if self.selected else WHITE
         pygame.draw.rect(screen, color, self.rect, 2)
-        font = pygame.font.Font(None, 24)
-        text = f"x{self.speed}"
+        font = get_font(24)
+        text = "MAX" if self.speed is None else f"x{self.speed}"
         text_surface = font.render(text, True, color)
         text_rect = text_surface.get_rect(center=self.rect.center)
         screen.blit(text_surface, text_rect)
@@ -434,8 +866,10 @@ class SpeedButton:
     def handle_click(self, pos):
         return self.rect.collidepoint(pos)
 
-def draw_ui(screen, player, enemies):
-    font = pygame.font.Font(None, 36)
+def draw_ui(screen, world):
+    player = world.boss
+    enemies = world.enemies
+    font = get_font(36)
     
     # Boss信息
     health_text = f"Boss HP: {player.health}"
@@ -447,7 +881,7 @@ def draw_ui(screen, player, enemies):
     screen.blit(text_surface, (10, 50))
     
     # 集体能量
-    collective_text = f"Collective: {NoteWarrior.collective_energy}/{NoteWarrior.COLLECTIVE_ENERGY_MAX}"
+    collective_text = f"Collective: {world.collective_energy}/{NoteWarrior.COLLECTIVE_ENERGY_MAX}"
     text_surface = font.render(collective_text, True, WHITE)
     screen.blit(text_surface, (10, 90))
     
@@ -464,154 +898,1150 @@ def draw_ui(screen, player, enemies):
         text_surface = font.render(warrior_text, True, WHITE)
         screen.blit(text_surface, (10, 130 + i * 40))
 
-def main():
+class WorldSnapshot:
+    # 紧凑的世界状态（圆环占用、音符数组、能量、集体能量池、音波状态），用于AI向前推演
+    # fork() 与父快照共享数组，只有在某一方写入时才复制该数组（写时复制）
+    def __init__(self, arrays, collective, boss_health, wave_id, wave_radius,
+                 wave_expanding, geometry):
+        self.arrays = arrays
+        self._owned = set(arrays)
+        self.collective = collective
+        self.boss_health = boss_health
+        self.wave_id = wave_id
+        self.wave_radius = wave_radius
+        self.wave_expanding = wave_expanding
+        self.geometry = geometry
+        self.ring_values = [geometry.note_value(i) for i in range(geometry.ring_count)]  # 音符价值/移动消耗
+
+    @classmethod
+    def capture(cls, world):
+        enemies = world.enemies
+        notes = [note for note in world.wave.note_energies if not note.collected]
+        count = len(enemies)
+        arrays = {
+            'rings': np.fromiter((e.ring_index for e in enemies), dtype=np.int16, count=count),
+            'angles': np.fromiter((e.angle for e in enemies), dtype=float, count=count),
+            'energies': np.fromiter((e.note_energy for e in enemies), dtype=float, count=count),
+            'join_thresholds': np.fromiter((e.params.join_thresholds[e.strategy] for e in enemies),
+                                           dtype=float, count=count),
+            'note_rings': np.fromiter((n.ring_index for n in notes), dtype=np.int16, count=len(notes)),
+            'note_angles': np.fromiter((n.angle for n in notes), dtype=float, count=len(notes)),
+            'note_alive': np.ones(len(notes), dtype=bool),
+        }
+        wave = world.wave
+        return cls(arrays, world.collective_energy, world.boss.health, wave.wave_id,
+                   wave.radius, wave.state == WaveState.EXPANDING, world.geometry)
+
+    def fork(self):
+        child = copy.copy(self)
+        child.arrays = dict(self.arrays)
+        child._owned = set()
+        # 父快照也不再独占这些数组，之后写入时同样需要先复制
+        self._owned = set()
+        return child
+
+    def _write(self, name):
+        if name not in self._owned:
+            self.arrays[name] = self.arrays[name].copy()
+            self._owned.add(name)
+        return self.arrays[name]
+
+    def step_wave(self, warrior=None, target_ring=None):
+        # 以"一轮音波"为单位推进：warrior 先尝试移动到 target_ring，
+        # 然后所有战士获得初始能量、收集可达的音符，集体能量满时发动旋律冲击波
+        a = self.arrays
+        if warrior is not None and target_ring != a['rings'][warrior]:
+            cost = self.ring_values[target_ring]
+            if a['energies'][warrior] >= cost:
+                self._write('rings')[warrior] = target_ring
+                self._write('energies')[warrior] -= cost
+        energies = self._write('energies')
+        energies += 2
+        gain = len(energies)
+        
+        # 每轮音波两次经过圆环，每次最多收集一个角度可达的音符
+        alive = a['note_alive']
+        if alive.any() and len(energies):
+            reach = NoteWarrior.ANGULAR_SPEED * self.geometry.ring_width / Wave.SPEED + 0.2
+            diff = np.abs((a['note_angles'][None, :] - a['angles'][:, None] + math.pi)
+                          % (2 * math.pi) - math.pi)
+            reachable = ((a['note_rings'][None, :] == a['rings'][:, None]) &
+                         alive[None, :] & (diff <= reach))
+            if reachable.any():
+                alive = self._write('note_alive')
+                angles = self._write('angles')
+                for w in np.flatnonzero(reachable.any(axis=1)).tolist():
+                    candidates = np.flatnonzero(reachable[w] & alive)
+                    for n in candidates[np.argsort(diff[w, candidates])][:2].tolist():
+                        alive[n] = False
+                        value = self.ring_values[a['note_rings'][n]]
+                        energies[w] += value
+                        gain += value // 2
+                        angles[w] = a['note_angles'][n]
+        
+        self.collective = min(self.collective + gain, NoteWarrior.COLLECTIVE_ENERGY_MAX)
+        if self.collective >= NoteWarrior.COLLECTIVE_ENERGY_MAX:
+            riders = energies >= a['join_thresholds']
+            if riders.any():
+                self.boss_health -= energies[riders].sum()
+                self._write("rings")[riders] = self.geometry.outer_ring
+                energies[riders] = 0
+            self.collective = 0
+        self.wave_id += 1
+
+class EchoGunner:
+    # 没有玩家时代替玩家操作 Boss：音波返回中心、能量够 min_volley 枚飞弹时，
+    # 朝这一轮回声最强的方向齐射。只依赖对局状态，随世界一起保存，回放时不需要录成输入
+    def __init__(self, min_volley=3):
+        self.min_volley = min_volley
+        self.volleys = 0  # 已发射的齐射轮数
+
+    def volley_angle(self, world):
+        # 本帧要齐射时返回方向，否则返回 None；只在音波返回中心的那一帧调用
+        boss = world.boss
+        if boss.energy < self.min_volley * boss.missile_cost:
+            return None
+        self.volleys += 1
+        return world.wave.echo_peak
+
+class LookaheadPlanner:
+    # 有界深度搜索：在快照上推演 depth 轮音波，为战士选出目标圆环
+    # 评分为 Boss 损失的血量加上战士自身保留的能量
+    def __init__(self, depth=2, energy_weight=0.5):
+        self.depth = depth
+        self.energy_weight = energy_weight
+        self.branches = 0  # 已推演的分支数，用于统计每秒分支数
+
+    def plan(self, snapshot, warrior):
+        # 一次跑完全部分支，返回 (目标圆环, 评分)
+        task = self.plan_steps(snapshot, warrior)
+        while True:
+            try:
+                next(task)
+            except StopIteration as done:
+                return done.value
+
+    def plan_steps(self, snapshot, warrior):
+        # 生成器版本：每推演一个分支让出一次，结束时返回 (目标圆环, 评分)
+        best_ring = int(snapshot.arrays['rings'][warrior])
+        best_score = -math.inf
+        for ring in range(len(snapshot.ring_values)):
+            score = yield from self._search(snapshot, warrior, ring, self.depth,
+                                            snapshot.boss_health)
+            if score > best_score:
+                best_score = float(score)
+                best_ring = ring
+        return best_ring, best_score
+
+    def _search(self, snapshot, warrior, ring, depth, start_health):
+        child = snapshot.fork()
+        child.step_wave(warrior, ring)
+        self.branches += 1
+        yield
+        if depth <= 1:
+            return (start_health - child.boss_health +
+                    child.arrays['energies'][warrior] * self.energy_weight)
+        best = -math.inf
+        for next_ring in range(len(child.ring_values)):
+            score = yield from self._search(child, warrior, next_ring, depth - 1, start_health)
+            best = max(best, score)
+        return best
+
+class PlannerService:
+    # 把规划器的推演分摊到多个显示帧：每帧最多用 frame_budget 秒推进规划任务
+    # 任务按提交顺序逐个完成，完成前战士沿用上一次的决策
+    def __init__(self, planner, frame_budget=0.004):
+        self.planner = planner
+        self.frame_budget = frame_budget
+        self.tasks = deque()  # (战士ID, 规划生成器)
+        self.overruns = 0  # 超出预算的帧数
+        self.worst_overrun = 0.0  # 单帧超出预算最多的秒数
+        self.completed = 0
+
+    @property
+    def pending(self):
+        return len(self.tasks)
+
+    def submit(self, snapshot, warrior_ids):
+        # 新一轮规划直接替换尚未完成的旧任务
+        self.tasks.clear()
+        for i, warrior_id in enumerate(warrior_ids):
+            self.tasks.append((warrior_id, self.planner.plan_steps(snapshot, i)))
+
+    def run(self):
+        # 在预算内推进规划任务，返回本帧完成的规划 {战士ID: (目标圆环, 评分)}
+        finished = {}
+        start = time.perf_counter()
+        deadline = start + self.frame_budget
+        while self.tasks and time.perf_counter() < deadline:
+            warrior_id, task = self.tasks[0]
+            try:
+                next(task)
+            except StopIteration as done:
+                finished[warrior_id] = done.value
+                self.tasks.popleft()
+                self.completed += 1
+        # 单个分支无法再拆分，最后一步可能越过预算，记录下来
+        overrun = time.perf_counter() - deadline
+        if overrun > 0 and (self.tasks or finished):
+            self.overruns += 1
+            self.worst_overrun = max(self.worst_overrun, overrun)
+            debug_log(f"Planner overran its {self.frame_budget * 1000:.1f}ms budget "
+                      f"by {overrun * 1000:.2f}ms")
+        return finished
+
+DEFAULT_ROSTER = ('aggressive', 'balanced', 'balanced', 'conservative')
+
+class World:
+    # 一局对战的全部状态，step() 推进一个逻辑帧，draw() 只负责绘制
+    # roster 为战士策略列表，战士在最外圈均匀分布
+    # seed 决定本局所有随机数，相同的种子和输入总是得到相同的对局
+    def __init__(self, geometry=ARENA, roster=DEFAULT_ROSTER, planner=None, tempo_map=None,
+                 planner_budget=None, params=DEFAULT_PARAMS, seed=None, gunner=None):
+        self.geometry = geometry
+        self.params = params  # 战士策略参数
+        self.seed = seed
+        self.rng = random.Random(seed)
+        # 有速度表时音波随节拍在圆环上停留
+        self.beat_clock = BeatClock(tempo_map) if tempo_map is not None else None
+        self.wave = Wave(geometry, self.beat_clock, self.rng)
+        self.boss = Boss()
+        self.enemies = [
+            NoteWarrior(2 * math.pi * i / len(roster), strategy, i + 1, geometry, params)
+            for i, strategy in enumerate(roster)
+        ]
+        self.missiles = []
+        self.missile_pool = MissilePool(geometry)
+        self.melody_waves = []
+        self.warrior_projector = PolarProjector(geometry)
+        self.sector_index = SectorIndex(geometry)
+        self.tick = 0
+        self.game_over = False
+        self.game_result = None
+        self.winner = None  # 'boss' 或 'warriors'
+        self.melody_wave_count = 0
+        # 本局发生的事件（节拍、收集、命中、冲击波），供音效等表现层消费
+        self.events = deque(maxlen=256)
+        self.collective_energy = 0  # 集体能量池，满了发动旋律冲击波
+        # 向前推演的规划器：每轮音波开始时为所有战士规划一次目标圆环
+        # 设置了 planner_budget 时规划交给 PlannerService 分帧完成，由 think() 推进
+        self.planner = planner
+        self.planner_service = (PlannerService(planner, planner_budget)
+                                if planner is not None and planner_budget else None)
+        self.plans = {}
+        self.planned_wave_id = None
+        # 无头对局里代替玩家开火的 Boss AI（EchoGunner），窗口模式由玩家用鼠标齐射
+        self.gunner = gunner
+        self.summary = None
+        self.summary_version = None
+        self.profiler = None  # 设置后 step() 按阶段把耗时记到 FrameProfiler 上
+        self.recorder = None  # 设置后把输入和关键帧录进这个 Replay
+        self.telemetry = None  # 设置后把音符收集、旋律冲击波等事件发给这个 Telemetry
+
+    def __getstate__(self):
+        # 关键帧里不保存表现层和录制相关的对象，也不保存事件
+        # 分帧规划的结果是按到达的逻辑帧录下的输入，恢复后不再需要规划器
+        state = self.__dict__.copy()
+        state['profiler'] = None
+        state['recorder'] = None
+        state['telemetry'] = None
+        state['events'] = deque(maxlen=256)
+        if self.planner_service is not None:
+            state['planner_service'] = None
+            state['planner'] = None
+        return state
+
+    def save_state(self):
+        return dump_state(self)
+
+    @staticmethod
+    def restore_state(data):
+        return load_state(data)
+
+    def add_collective_energy(self, gain):
+        self.collective_energy = min(self.collective_energy + gain, NoteWarrior.COLLECTIVE_ENERGY_MAX)
+
+    def start_recording(self, replay):
+        # 从当前逻辑帧开始录制，立即保存第一个关键帧
+        self.recorder = replay
+        replay.add_keyframe(self.tick, self.save_state())
+
+    def finish_recording(self):
+        # 保存最后一个关键帧，返回录好的 Replay
+        replay = self.recorder
+        replay.add_keyframe(self.tick, self.save_state())
+        self.recorder = None
+        return replay
+
+    def state_digest(self):
+        # 回放校验用的状态摘要：只包含会影响之后对局的状态，不包含缓存和事件
+        wave = self.wave
+        data = (
+            self.tick, wave.radius, wave.state.name, wave.wave_id, wave.dwelling,
+            sorted((n.ring_index, n.angle) for n in wave.note_energies if not n.collected),
+            [(e.warrior_id, e.ring_index, e.angle, e.note_energy, e.health, e.move_cooldown,
+              e.melody_wave is not None) for e in self.enemies],
+            [(mw.radius, [w.warrior_id for w in mw.warriors]) for mw in self.melody_waves],
+            [(m.x, m.y, m.angle) for m in self.missiles],
+            self.boss.health, self.boss.energy, self.collective_energy,
+            sorted(self.plans.items()), self.rng.getstate(),
+        )
+        return hashlib.sha1(repr(data).encode("utf-8")).hexdigest()
+
+    def ring_summary(self):
+        # 音符只在音波经过圆环时生成、收集时会同步从汇总里移除，其余帧直接复用上一份汇总
+        wave = self.wave
+        if self.summary is None or self.summary_version != wave.notes_version:
+            wave.prune_collected_notes()
+            self.summary = RingSummary(wave)
+            self.summary_version = wave.notes_version
+        return self.summary
+
+    def replan(self):
+        self.planned_wave_id = self.wave.wave_id
+        if self.planner is None:
+            return
+        snapshot = WorldSnapshot.capture(self)
+        if self.planner_service is not None:
+            self.planner_service.submit(snapshot, [enemy.warrior_id for enemy in self.enemies])
+            return
+        self.plans = {enemy.warrior_id: self.planner.plan(snapshot, i)
+                      for i, enemy in enumerate(self.enemies)}
+
+    def think(self):
+        # 每个显示帧调用一次，在预算内推进分帧规划，新的规划到达后才替换旧决策
+        if self.planner_service is not None:
+            arrived = self.planner_service.run()
+            if arrived:
+                if self.recorder is not None:
+                    # 规划结果何时到达取决于机器速度，作为输入录下来
+                    self.recorder.record_input(self.tick, ('plans', tuple(arrived.items())))
+                self.plans.update(arrived)
+
+    def decide_rings(self, warriors, summary):
+        # 批量决策，有规划结果的战士使用规划出的目标圆环
+        best_rings, best_values = find_best_rings(warriors, summary, self.params)
+        if self.plans:
+            for i, warrior in enumerate(warriors):
+                plan = self.plans.get(warrior.warrior_id)
+                if plan is not None:
+                    best_rings[i], best_values[i] = plan
+        return best_rings, best_values
+
+    def step(self):
+        if self.game_over:
+            return
+        wave = self.wave
+        enemies = self.enemies
+        profiler = self.profiler
+        telemetry = self.telemetry
+        if self.beat_clock is not None:
+            self.beat_clock.advance()
+            if self.beat_clock.on_beat:
+                self.events.append(('beat',))
+        wave.update()
+        if profiler is not None:
+            profiler.lap("wave")
+        if wave.wave_id != self.planned_wave_id:
+            self.replan()
+            if profiler is not None:
+                profiler.lap("ai")
+        
+        # 更新和检测飞弹
+        if self.missiles:
+            points = self.warrior_projector.project_objects(enemies)
+            self.sector_index.rebuild(enemies)
+            for missile in self.missiles:
+                missile.update()
+                if missile.check_enemy_collision(enemies, self.sector_index, points):
+                    self.events.append(('hit',))
+                    if telemetry is not None:
+                        telemetry.emit("missile_hit", tick=self.tick)
+                    # 被击中的战士换了圆环，刷新坐标
+                    points = self.warrior_projector.project_objects(enemies)
+            for missile in [m for m in self.missiles if not m.active]:
+                self.missiles.remove(missile)
+                self.missile_pool.release(missile)
+            if profiler is not None:
+                profiler.lap("collision")
+        
+        # 更新旋律冲击波，所有冲击波共用同一份圆环索引
+        if self.melody_waves:
+            ring_warriors = index_free_warriors(enemies)
+            boss_health = self.boss.health
+            for melody_wave in self.melody_waves:
+                melody_wave.update(ring_warriors)
+            if telemetry is not None and self.boss.health < boss_health:
+                telemetry.emit("boss_damage", tick=self.tick, damage=boss_health - self.boss.health,
+                               health=self.boss.health)
+            self.melody_waves = [mw for mw in self.melody_waves if mw.active]
+            if profiler is not None:
+                profiler.lap("melody")
+        
+        # 更新敌人：只有不在旋律冲击波上的战士才检查普通音波碰撞和移动
+        active = [enemy for enemy in enemies if enemy.melody_wave is None]
+        summary = self.ring_summary()
+        for enemy in active:
+            if enemy.check_wave_collision(wave, summary, self):
+                self.events.append(('collect', enemy.ring_index))
+                if telemetry is not None:
+                    telemetry.emit("note_pickup", tick=self.tick, warrior=enemy.warrior_id,
+                                   ring=enemy.ring_index,
+                                   value=self.geometry.note_value(enemy.ring_index))
+        if profiler is not None:
+            profiler.lap("collision")
+        # 决策阶段：所有战士基于同一份圆环汇总批量评估策略
+        best_rings, best_values = self.decide_rings(active, summary)
+        for enemy, best_ring, best_value in zip(active, best_rings.tolist(), best_values.tolist()):
+            enemy.move(wave, summary, (best_ring, best_value))
+        if profiler is not None:
+            profiler.lap("ai")
+        for enemy in enemies[:]:
+            if enemy.health <= 0:
+                enemies.remove(enemy)
+        
+        # 检查是否发动旋律冲击波，集体能量每次充满都会发动一道，多道冲击波可以同时存在
+        if self.collective_energy >= NoteWarrior.COLLECTIVE_ENERGY_MAX:
+            self.melody_waves.append(MelodyWave(self.boss, enemies, self.geometry))
+            self.melody_wave_count += 1
+            self.events.append(('melody',))
+            if telemetry is not None:
+                telemetry.emit("melody_launch", tick=self.tick, count=self.melody_wave_count)
+            self.collective_energy = 0
+        
+        # 音波返回中心时按回声直方图给boss能量
+        self.boss.energy += wave.returned_echo
+        if self.gunner is not None and wave.returned_echo:
+            angle = self.gunner.volley_angle(self)
+            if angle is not None:
+                self.launch_volley(angle)
+        
+        self.tick += 1
+        
+        # 检查游戏结束条件
+        if len(enemies) == 0:
+            self.game_over = True
+            self.game_result = "BOSS WINS!"
+            self.winner = 'boss'
+        elif self.boss.health <= 0:
+            self.game_over = True
+            self.game_result = "WARRIORS WIN!"
+            self.winner = 'warriors'
+        if self.game_over and telemetry is not None:
+            telemetry.end_match(tick=self.tick, winner=self.winner, boss_health=self.boss.health,
+                                warriors_left=len(enemies), melody_waves=self.melody_wave_count)
+        recorder = self.recorder
+        if recorder is not None and recorder.wants_keyframe(self.tick):
+            recorder.add_keyframe(self.tick, self.save_state())
+        if profiler is not None:
+            profiler.lap("sim")
+
+    def quiet_ticks(self):
+        # 接下来可以解析跳过的逻辑帧数：这些帧里音波不会进入有战士活动的圆环，
+        # 不会经过圆环、反弹或返回中心，旋律冲击波也不会经过圆环或到达中心，
+        # 飞弹不会命中战士或飞出屏幕，因此除了半径、飞弹位置和移动冷却之外什么都不会变化
+        wave = self.wave
+        if self.game_over:
+            return 0
+        if self.beat_clock is not None and (wave.dwelling or wave.current_ring is not None):
+            # 随节拍停留的音波不能解析推进
+            return 0
+        geometry = self.geometry
+        quiet = math.inf
+        if wave.current_ring is not None:
+            # 音波停在一个没有战士、也没有战士会移入的圆环上时同样是安静的
+            ring = wave.current_ring
+            active = [enemy for enemy in self.enemies if enemy.melody_wave is None]
+            if any(enemy.ring_index == ring for enemy in active):
+                return 0
+            summary = self.ring_summary()
+            best_rings, _ = self.decide_rings(active, summary)
+            for enemy, best_ring in zip(active, best_rings.tolist()):
+                if enemy.move_cooldown > 0:
+                    # 冷却结束后可能会移入，最多跳到冷却结束
+                    quiet = min(quiet, enemy.move_cooldown)
+                elif (not enemy.check_ring_energy(summary) and
+                      enemy.ring_change_cost(wave, best_ring) is not None):
+                    return 0
+        if wave.state == WaveState.EXPANDING:
+            # 下一个圆环判定带的下界或最外圈反弹点
+            limit = geometry.next_band_low(wave.radius)
+            if limit is None or limit > geometry.max_radius:
+                limit = geometry.max_radius
+            quiet = min(quiet, math.ceil((limit - wave.radius) / wave.speed) - 1)
+        else:
+            # 下一个圆环判定带的上界或中心
+            limit = geometry.prev_band_high(wave.radius)
+            if limit is None or limit < 0:
+                limit = 0
+            quiet = min(quiet, math.ceil((wave.radius - limit) / wave.speed) - 1)
+        for melody_wave in self.melody_waves:
+            target = geometry.prev_ring_radius(melody_wave.radius)
+            if target is None or target < 20:
+                target = 20
+            quiet = min(quiet, math.ceil((melody_wave.radius - target) / melody_wave.speed) - 1)
+        if self.missiles and quiet > 0:
+            # 安静帧里战士不移动，飞弹沿直线飞行，到命中战士或飞出屏幕之前都可以跳过
+            points = self.warrior_projector.project_objects(self.enemies)
+            for missile in self.missiles:
+                quiet = min(quiet, missile.quiet_ticks(points))
+        return max(quiet, 0)
+
+    def fast_forward(self, ticks):
+        # 直接推进 ticks 个安静帧，调用前必须保证 ticks <= quiet_ticks()
+        if ticks <= 0:
+            return
+        wave = self.wave
+        if wave.state == WaveState.EXPANDING:
+            wave.radius += wave.speed * ticks
+        else:
+            wave.radius -= wave.speed * ticks
+        wave.returned_echo = 0
+        wave.current_ring = self.geometry.ring_at(wave.radius)
+        clock = self.beat_clock
+        if clock is not None:
+            clock.tick += ticks
+            clock.beat = clock.tempo_map.beat_at(clock.tick)
+            clock.on_beat = (math.floor(clock.beat) >
+                             math.floor(clock.tempo_map.beat_at(clock.tick - 1)))
+        for melody_wave in self.melody_waves:
+            melody_wave.radius -= melody_wave.speed * ticks
+        for missile in self.missiles:
+            missile.fly(ticks)
+        for enemy in self.enemies:
+            if enemy.melody_wave is not None:
+                continue
+            # 与逐帧调用 move() 等价：先消耗冷却，之后因为不在音波上而停止移动
+            if enemy.move_cooldown >= ticks:
+                enemy.move_cooldown -= ticks
+            else:
+                enemy.move_cooldown = 0
+                enemy.is_moving = False
+                enemy.move_direction = 0
+        self.tick += ticks
+
+    def advance(self, limit=None):
+        # 跳到下一个事件并执行事件所在的那一帧，最多推进 limit 帧，返回推进的帧数
+        quiet = self.quiet_ticks()
+        if limit is not None:
+            quiet = min(quiet, limit - 1)
+        self.fast_forward(quiet)
+        self.step()
+        return quiet + 1
+
+    def fire_volley(self, angle):
+        # Boss 朝 angle 方向扇形齐射，每枚飞弹消耗能量，返回发射数量
+        if self.boss.energy < self.boss.missile_cost or self.game_over:
+            return 0
+        if self.recorder is not None:
+            self.recorder.record_input(self.tick, ('volley', angle))
+        return self.launch_volley(angle)
+
+    def launch_volley(self, angle):
+        # 不录制输入的齐射，EchoGunner 在 step() 里直接调用
+        boss = self.boss
+        count = min(boss.volley_size, boss.energy // boss.missile_cost)
+        if count <= 0:
+            return 0
+        boss.energy -= count * boss.missile_cost
+        step = boss.volley_spread / (count - 1) if count > 1 else 0
+        for k in range(count):
+            offset = (k - (count - 1) / 2) * step
+            self.missiles.append(self.missile_pool.acquire(angle + offset))
+        return count
+
+class SoundCache:
+    # 预先合成并混音好的音效缓冲区，播放时不需要解码或混音
+    # 混音器还没初始化时按 pygame.mixer.pre_init() 的参数初始化（init_pygame() 设置了较小的缓冲区），
+    # 已经是 16 位有符号格式时直接沿用；没有可用音频设备时静音运行
+    SAMPLE_SIZE = -16
+
+    def __init__(self, ring_count):
+        self.sounds = {}
+        config = self.init_mixer()
+        if config is None:
+            return
+        self.frequency, _, self.channels = config
+        click = self._tone(1760, 0.03, decay=120)
+        self.sounds[('beat',)] = self._make(click)
+        for i in range(ring_count):
+            # 越靠内的圆环音高越高
+            tone = self._tone(220 * 2 ** ((ring_count - 1 - i) * 2 / 12), 0.25)
+            self.sounds[('collect', i)] = self._make(self._mix(tone * 0.7, click * 0.3))
+        chord = self._mix(*(self._tone(f, 0.6, decay=4) * 0.4 for f in (261.6, 329.6, 392.0)))
+        self.sounds[('melody',)] = self._make(chord)
+        noise = np.random.default_rng(0).uniform(-1, 1, int(self.frequency * 0.08))
+        self.sounds[('hit',)] = self._make(noise * np.exp(-np.arange(len(noise)) / self.frequency * 40))
+
+    @classmethod
+    def init_mixer(cls):
+        # 返回可用的混音器参数 (采样率, 格式, 声道数)，初始化失败时返回 None
+        config = pygame.mixer.get_init()
+        if config is not None and config[1] == cls.SAMPLE_SIZE:
+            return config
+        try:
+            if config is None:
+                # 只指定采样格式，采样率、声道数和缓冲区沿用 pre_init() 的设置
+                pygame.mixer.init(size=cls.SAMPLE_SIZE)
+            else:
+                # 别处用其他采样格式初始化过，保留采样率和声道数重新初始化
+                pygame.mixer.quit()
+                pygame.mixer.init(config[0], cls.SAMPLE_SIZE, config[2])
+        except pygame.error:
+            return None
+        config = pygame.mixer.get_init()
+        if config is None or config[1] != cls.SAMPLE_SIZE:
+            return None
+        return config
+
+    def _tone(self, frequency, duration, decay=12):
+        t = np.arange(int(self.frequency * duration)) / self.frequency
+        return np.sin(2 * math.pi * frequency * t) * np.exp(-decay * t)
+
+    def _mix(self, *waves):
+        mixed = np.zeros(max(len(w) for w in waves))
+        for w in waves:
+            mixed[:len(w)] += w
+        return mixed
+
+    def _make(self, wave):
+        samples = (np.clip(wave, -1, 1) * 16383).astype(np.int16)
+        if self.channels > 1:
+            samples = np.repeat(samples[:, None], self.channels, axis=1)
+        return pygame.sndarray.make_sound(np.ascontiguousarray(samples))
+
+    def play_events(self, events):
+        # 同一帧内相同的事件只播放一次
+        for event in set(events):
+            sound = self.sounds.get(event)
+            if sound is not None:
+                sound.play()
+
+def make_circle_sprite(color, radius):
+    # 预渲染一个带透明通道的圆形贴图
+    size = radius * 2 + 2
+    sprite = pygame.Surface((size, size), pygame.SRCALPHA)
+    pygame.draw.circle(sprite, color, (size // 2, size // 2), radius)
+    return sprite.convert_alpha()
+
+def make_warrior_sprite(warrior_id, is_moving):
+    # 战士圆球、移动中的光圈和编号合成一张贴图
+    size = 26
+    sprite = pygame.Surface((size, size), pygame.SRCALPHA)
+    center = (size // 2, size // 2)
+    pygame.draw.circle(sprite, RED, center, 10)
+    if is_moving:
+        pygame.draw.circle(sprite, YELLOW, center, 12, 1)
+    font = get_font(20)
+    text_surface = font.render(str(warrior_id), True, WHITE)
+    sprite.blit(text_surface, text_surface.get_rect(center=center))
+    return sprite.convert_alpha()
+
+class ArenaRenderer:
+    # 分层合成：静态场地层只渲染一次，动态层用批量贴图，HUD层只在数值变化时重绘
+    def __init__(self, geometry=ARENA):
+        self.geometry = geometry
+        self.static_layer = pygame.Surface(WINDOW_SIZE).convert()
+        self.static_layer.fill(BLACK)
+        Wave(geometry).draw_rings(self.static_layer)
+        self.note_sprite = make_circle_sprite(YELLOW, 6)
+        self.warrior_sprites = {}
+        self.hud_layer = None
+        self.hud_pos = (0, 0)
+        self._hud_key = None
+
+    def warrior_sprite(self, warrior):
+        key = (warrior.warrior_id, warrior.is_moving)
+        sprite = self.warrior_sprites.get(key)
+        if sprite is None:
+            sprite = self.warrior_sprites[key] = make_warrior_sprite(*key)
+        return sprite
+
+    def update_hud(self, world):
+        key = (world.boss.health, world.boss.energy, world.collective_energy,
+               tuple((w.strategy, w.ring_index, w.health, w.note_energy) for w in world.enemies))
+        if key == self._hud_key:
+            return
+        self._hud_key = key
+        scratch = pygame.Surface(WINDOW_SIZE, pygame.SRCALPHA)
+        draw_ui(scratch, world)
+        # 只保留有内容的区域，减少每帧混合的像素
+        rect = scratch.get_bounding_rect()
+        self.hud_layer = scratch.subsurface(rect).copy()
+        self.hud_pos = rect.topleft
+
+    def draw(self, screen, world):
+        wave = world.wave
+        screen.blit(self.static_layer, (0, 0))
+        wave.draw(screen, self.note_sprite)
+        world.boss.draw(screen)
+        
+        # 每帧批量计算一次战士坐标并批量贴图
+        world.warrior_projector.project_objects(world.enemies)
+        screen.blits([(self.warrior_sprite(enemy), (x - 13, y - 13))
+                      for enemy, (x, y) in zip(world.enemies,
+                                               world.warrior_projector.pixels.tolist())],
+                     False)
+        
+        for melody_wave in world.melody_waves:
+            melody_wave.draw(screen)
+        
+        # 显示被吸收的能量位置
+        if wave.state == WaveState.CONTRACTING:
+            cx, cy = self.geometry.center
+            bins = np.flatnonzero(wave.echo_bins)
+            angles = (bins + 0.5) * (2 * math.pi / ECHO_BINS)
+            xs = (cx + np.cos(angles) * wave.radius).astype(int).tolist()
+            ys = (cy + np.sin(angles) * wave.radius).astype(int).tolist()
+            # 吸收越多的方向回声越大
+            sizes = np.minimum(3 + wave.echo_bins[bins], 8).tolist()
+            for x, y, size in zip(xs, ys, sizes):
+                pygame.draw.circle(screen, YELLOW, (x, y), size)
+        
+        for missile in world.missiles:
+            missile.draw(screen)
+        
+        self.update_hud(world)
+        screen.blit(self.hud_layer, self.hud_pos)
+
+class SimScheduler:
+    # 把倍速换算成每个显示帧要执行的逻辑帧数，每个逻辑帧只调用一次 World.step()
+    # speed 为 None 时表示尽可能快：每个显示帧用满 max_frame_budget 秒做模拟
+    def __init__(self, speed=1, render_every=1, max_frame_budget=1/60):
+        self.speed = speed
+        self.render_every = render_every  # 每隔几个显示帧绘制一次，0表示不绘制
+        self.max_frame_budget = max_frame_budget
+        self.accumulator = 0.0
+        self.frame = 0
+        self.total_ticks = 0
+        self.ticks_per_second = 0.0
+        self._window_start = time.perf_counter()
+        self._window_ticks = 0
+
+    def set_speed(self, speed):
+        self.speed = speed
+        self.accumulator = 0.0
+
+    def run_frame(self, world):
+        # 推进一个显示帧，返回本帧执行的逻辑帧数
+        self.frame += 1
+        ticks = 0
+        if self.speed is None:
+            deadline = time.perf_counter() + self.max_frame_budget
+            while not world.game_over and time.perf_counter() < deadline:
+                world.step()
+                ticks += 1
+        else:
+            self.accumulator += self.speed
+            while self.accumulator >= 1 and not world.game_over:
+                world.step()
+                ticks += 1
+                self.accumulator -= 1
+            if world.game_over:
+                self.accumulator = 0.0
+        self._record(ticks)
+        return ticks
+
+    def should_render(self):
+        return self.render_every > 0 and self.frame % self.render_every == 0
+
+    def _record(self, ticks):
+        # 每0.5秒统计一次实际达到的逻辑帧率
+        self.total_ticks += ticks
+        self._window_ticks += ticks
+        now = time.perf_counter()
+        elapsed = now - self._window_start
+        if elapsed >= 0.5:
+            self.ticks_per_second = self._window_ticks / elapsed
+            self._window_start = now
+            self._window_ticks = 0
+
+def run_headless(world, max_ticks=None, event_driven=False):
+    # 不绘制、不限帧率地跑完一局，返回 (逻辑帧数, 实际执行的 step 次数, 每秒逻辑帧数)
+    # event_driven 时跳过事件之间的安静帧，结果与逐帧模拟完全一致
+    start = time.perf_counter()
+    start_tick = world.tick
+    steps = 0
+    while not world.game_over:
+        remaining = None if max_ticks is None else max_ticks - (world.tick - start_tick)
+        if remaining is not None and remaining <= 0:
+            break
+        if event_driven:
+            world.advance(remaining)
+        else:
+            world.step()
+        steps += 1
+    elapsed = time.perf_counter() - start
+    ticks = world.tick - start_tick
+    return ticks, steps, (ticks / elapsed if elapsed > 0 else 0.0)
+
+@contextlib.contextmanager
+def worker_pool(processes, start_method=None, maxtasksperchild=None):
+    # 无头工具共用的进程池，with 块结束时等所有工作进程自行退出
+    # 工作进程导入 pygame 后 SDL 会接管 SIGTERM，Pool 自带的 terminate() 会让工作进程卡住，
+    # 所以这里总是 close() + join()，不使用 terminate()
+    # 导入本模块时不加载 multiprocessing，只有用到进程池的工具才需要
+    import multiprocessing
+    pool = multiprocessing.get_context(start_method).Pool(processes, maxtasksperchild=maxtasksperchild)
+    try:
+        yield pool
+    finally:
+        pool.close()
+        pool.join()
+
+def apply_replay_input(world, item):
+    kind = item[0]
+    if kind == 'volley':
+        world.fire_volley(item[1])
+    elif kind == 'plans':
+        world.plans.update(item[1])
+
+def replay_advance(world, replay, ticks):
+    # 按录下的输入推进 ticks 个逻辑帧；两次输入之间用 advance() 跳过安静帧
+    # 每个逻辑帧的输入在推进这一帧之前应用，与录制时的顺序一致
+    target = world.tick + ticks
+    while world.tick < target and not world.game_over:
+        for item in replay.inputs_at(world.tick):
+            apply_replay_input(world, item)
+        next_input = replay.next_input_tick(world.tick + 1)
+        stop = target if next_input is None else min(target, next_input)
+        world.advance(stop - world.tick)
+    return world
+
+def replay_seek(replay, tick):
+    # 从 tick 之前最近的关键帧恢复，再补上之后的输入，返回位于 tick 的新世界
+    _, state = replay.keyframe_before(tick)
+    world = World.restore_state(state)
+    return replay_advance(world, replay, tick - world.tick)
+
+def start_recording(world, lookahead=0, bpm=None):
+    # 录像头部记录开局设置，方便查看；真正用于恢复的是关键帧
+    world.start_recording(Replay('te', {
+        "seed": world.seed, "roster": [e.strategy for e in world.enemies],
+        "rings": world.geometry.ring_count, "lookahead": lookahead, "bpm": bpm,
+        "params": world.params.to_dict()}))
+
+def start_telemetry(world, telemetry, lookahead=0, bpm=None):
+    # 每个 World 是一局，match_end 由 World.step() 在分出胜负时发出
+    world.telemetry = telemetry
+    telemetry.begin_match('te', seed=world.seed, roster=[e.strategy for e in world.enemies],
+                          rings=world.geometry.ring_count, lookahead=lookahead, bpm=bpm)
+
+def save_recording(world, path):
+    replay = world.finish_recording()
+    replay.save(path)
+    print(f"Saved replay ({replay.length} ticks) to {path}")
+
+def verify_replay(replay):
+    # 从头重放到结尾，与最后一个关键帧比较，返回 (是否一致, 逻辑帧数, 每秒逻辑帧数)
+    start = time.perf_counter()
+    world = replay_seek(replay, 0)
+    replay_advance(world, replay, replay.length - world.tick)
+    # 最后一个关键帧在录制结束时保存，已经包含最后一帧的输入
+    for item in replay.inputs_at(world.tick):
+        apply_replay_input(world, item)
+    elapsed = time.perf_counter() - start
+    replayed = world.state_digest()
+    _, state = replay.final_keyframe
+    recorded = World.restore_state(state).state_digest()
+    return replayed == recorded, world.tick, (world.tick / elapsed if elapsed > 0 else 0.0)
+
+def make_planner(depth):
+    return LookaheadPlanner(depth) if depth > 0 else None
+
+def make_gunner(enabled):
+    return EchoGunner() if enabled else None
+
+def load_params(path):
+    # 读取 te_optimize.py 输出的策略参数 JSON，没有指定时使用默认参数
+    if not path:
+        return DEFAULT_PARAMS
+    with open(path, encoding="utf-8") as f:
+        return StrategyParams.from_dict(json.load(f))
+
+def make_tempo_map(bpm):
+    return TempoMap.constant(bpm) if bpm else None
+
+PROFILE_PHASES = ("input", "wave", "collision", "melody", "ai", "sim", "audio", "draw", "flip", "wait")
+
+def init_pygame():
+    # 只在窗口模式的入口初始化显示和字体，导入本模块不会打开窗口
+    # 声音由 SoundCache 在需要时初始化，这里只用 pre_init() 设置较小的混音缓冲区降低延迟
+    # 手柄等其他子系统用不到
+    pygame.mixer.pre_init(44100, SoundCache.SAMPLE_SIZE, 2, 256)
+    pygame.display.init()
+    pygame.font.init()
+    screen = pygame.display.set_mode(WINDOW_SIZE)
+    pygame.display.set_caption("音律战境")
+    return screen
+
+def main(speed=1, render_every=1, lookahead=0, bpm=None, geometry=ARENA, planner_budget=0.004,
+         params=DEFAULT_PARAMS, profile=False, profile_out=None, seed=None, record=None,
+         telemetry_path=None, alloc=False, alloc_budget=None):
+    screen = init_pygame()
     clock = pygame.time.Clock()
-    wave = Wave()
-    boss = Boss()
-    
-    # 固定分配策略，添加ID
-    enemies = [
-        NoteWarrior(0, 'aggressive', 1),
-        NoteWarrior(math.pi/2, 'balanced', 2),
-        NoteWarrior(math.pi, 'balanced', 3),
-        NoteWarrior(3*math.pi/2, 'conservative', 4)
-    ]
+    # F3 开关分阶段耗时统计和叠加层，F4 导出 CSV 和 Chrome trace
+    profiler = FrameProfiler(PROFILE_PHASES, enabled=profile)
+    # alloc 时按同样的阶段统计每帧内存分配和垃圾回收，退出时打印报告
+    monitor = None
+    if alloc or alloc_budget is not None:
+        monitor = profiler.monitor = AllocationMonitor(alloc_budget, warmup=60)
+        monitor.start()
+    world = World(geometry, planner=make_planner(lookahead), tempo_map=make_tempo_map(bpm),
+                  planner_budget=planner_budget, params=params, seed=seed)
+    world.profiler = profiler
+    # 设置了 record 时每局录一个回放，按R重新开始时保存上一局
+    recordings = 0
+    if record:
+        start_recording(world, lookahead, bpm)
+    telemetry = Telemetry(telemetry_path) if telemetry_path else None
+    if telemetry is not None:
+        start_telemetry(world, telemetry, lookahead, bpm)
+    scheduler = SimScheduler(speed, render_every)
+    renderer = ArenaRenderer(world.geometry)
+    sound_cache = SoundCache(world.geometry.ring_count)
     
     # 添加速度控制按钮
     speed_buttons = [
-        SpeedButton(WINDOW_SIZE[0] - 220, 10, 1),
-        SpeedButton(WINDOW_SIZE[0] - 160, 10, 2),
-        SpeedButton(WINDOW_SIZE[0] - 100, 10, 4),
-        SpeedButton(WINDOW_SIZE[0] - 40, 10, 8)
+        SpeedButton(WINDOW_SIZE[0] - 340 + i * 60, 10, button_speed)
+        for i, button_speed in enumerate([1, 2, 4, 8, 32, None])
     ]
-    game_speed = 1
-    
-    missiles = []
-    melody_waves = []
-    font = pygame.font.Font(None, 36)
+    for button in speed_buttons:
+        button.selected = (button.speed == scheduler.speed)
+    font = get_font(36)
+    small_font = get_font(24)
     
     running = True
-    game_over = False
     while running:
+        profiler.begin_frame()
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 running = False
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                profiler.toggle()
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_F4:
+                paths = profiler.export(profile_out or time.strftime("te-profile-%Y%m%d-%H%M%S"))
+                print(f"Exported frame profile to {', '.join(paths)}")
             elif event.type == pygame.MOUSEBUTTONDOWN:
                 # 处理速度按钮点击
+                clicked_button = False
                 for button in speed_buttons:
                     if button.handle_click(event.pos):
-                        game_speed = button.speed
+                        clicked_button = True
+                        scheduler.set_speed(button.speed)
                         for b in speed_buttons:
-                            b.selected = (b.speed == game_speed)
+                            b.selected = (b.speed == scheduler.speed)
+                # 左键朝鼠标方向发射飞弹齐射
+                if event.button == 1 and not clicked_button:
+                    mx, my = event.pos
+                    cx, cy = world.geometry.center
+                    world.fire_volley(math.atan2(my - cy, mx - cx))
         
-        # 根据游戏速度更新多次
-        for _ in range(game_speed):
-            # 更新游戏状态
-            wave.update()
-            for missile in missiles[:]:
-                missile.update()
-            for melody_wave in melody_waves[:]:
-                melody_wave.update()
-            for enemy in enemies[:]:
-                if not any(enemy in wave.warriors for wave in melody_waves):
-                    enemy.check_wave_collision(wave)
-                    enemy.move(wave)
-        
-        # 绘制
-        screen.fill(BLACK)
-        wave.draw(screen)
-        boss.draw(screen)
-        
-        # 检查是否发动旋律冲击波
-        if (NoteWarrior.collective_energy >= NoteWarrior.COLLECTIVE_ENERGY_MAX and 
-            not any(wave.active for wave in melody_waves)):
-            melody_wave = MelodyWave(boss, enemies)  # 传入 enemies 参数
-            melody_waves.append(melody_wave)
-            NoteWarrior.collective_energy = 0
-        
-        # 更新敌人
-        for enemy in enemies[:]:
-            if not any(enemy in wave.warriors for wave in melody_waves):
-                # 只有不在旋律冲击波上的战士才检查普通音波碰撞
-                enemy.check_wave_collision(wave)
-                enemy.move(wave)
-            enemy.draw(screen, wave.ring_radii)
-            if enemy.health <= 0:
-                enemies.remove(enemy)
+        profiler.lap("input")
         
-        # 更新和绘制旋律冲击波
-        for melody_wave in melody_waves[:]:
-            melody_wave.update()
-            melody_wave.draw(screen)
-            if not melody_wave.active:
-                melody_waves.remove(melody_wave)
+        # 根据游戏速度推进逻辑帧
+        scheduler.run_frame(world)
+        world.think()
+        profiler.lap("ai")
+        sound_cache.play_events(world.events)
+        world.events.clear()
+        profiler.lap("audio")
         
-        # 显示被吸收的能量位置并累积boss能量
-        if wave.state == WaveState.CONTRACTING:
-            for pos in wave.absorbed_positions:
-                angle, ring_idx = pos
-                x = WINDOW_SIZE[0]//2 + math.cos(angle) * wave.radius
-                y = WINDOW_SIZE[1]//2 + math.sin(angle) * wave.radius
-                pygame.draw.circle(screen, YELLOW, (int(x), int(y)), 4)
-                if wave.radius < 20:  # 音波返回中心时给boss能量
-                    boss.energy += 1
-        
-        # 更新和绘制飞弹
-        for missile in missiles[:]:
-            missile.update()
-            for enemy in enemies:
-                missile.check_enemy_collision(enemy, wave.ring_radii)
-            if missile.active:
-                missile.draw(screen)
-            else:
-                missiles.remove(missile)
-        
-        # 绘制UI
-        draw_ui(screen, boss, enemies)
-        
-        # 绘制速度控制按钮
-        for button in speed_buttons:
-            button.draw(screen)
-        
-        if not game_over:
-            # 检查游戏结束条件
-            if len(enemies) == 0:
-                game_over = True
-                game_result = "BOSS WINS!"
-            elif boss.health <= 0:
-                game_over = True
-                game_result = "WARRIORS WIN!"
-        else:
-            # 显示游戏结果
-            font = pygame.font.Font(None, 72)
-            text_surface = font.render(game_result, True, WHITE)
-            text_rect = text_surface.get_rect(center=(WINDOW_SIZE[0]//2, WINDOW_SIZE[1]//2))
-            screen.blit(text_surface, text_rect)
-            
-            # 显示重启提示
-            font = pygame.font.Font(None, 36)
-            restart_text = font.render("按R键重新开始", True, WHITE)
-            restart_rect = restart_text.get_rect(center=(WINDOW_SIZE[0]//2, WINDOW_SIZE[1]//2 + 50))
-            screen.blit(restart_text, restart_rect)
-            
+        if world.game_over:
             # 检查重启游戏
             keys = pygame.key.get_pressed()
             if keys[pygame.K_r]:
-                wave = Wave()
-                enemies = [
-                    NoteWarrior(0, 'aggressive', 1),
-                    NoteWarrior(math.pi/2, 'balanced', 2),
-                    NoteWarrior(math.pi, 'balanced', 3),
-                    NoteWarrior(3*math.pi/2, 'conservative', 4)
-                ]
-                missiles = []
-                boss.energy = 0
-                game_over = False
+                if record:
+                    save_recording(world, numbered_path(record, recordings))
+                    recordings += 1
+                world = World(geometry, planner=make_planner(lookahead),
+                              tempo_map=make_tempo_map(bpm), planner_budget=planner_budget,
+                              params=params, seed=seed)
+                world.profiler = profiler
+                if record:
+                    start_recording(world, lookahead, bpm)
+                if telemetry is not None:
+                    start_telemetry(world, telemetry, lookahead, bpm)
         
-        pygame.display.flip()
-        clock.tick(60)  # 保持60FPS的基础刷新率
+        if scheduler.should_render():
+            renderer.draw(screen, world)
+            
+            # 绘制速度控制按钮和实际逻辑帧率
+            for button in speed_buttons:
+                button.draw(screen)
+            tps_text = small_font.render(f"TPS: {scheduler.ticks_per_second:.0f}", True, WHITE)
+            screen.blit(tps_text, (WINDOW_SIZE[0] - 340, 45))
+            service = world.planner_service
+            if service is not None:
+                ai_text = small_font.render(
+                    f"AI: {service.pending} pending, {service.overruns} overruns "
+                    f"(max {service.worst_overrun * 1000:.1f}ms)", True, WHITE)
+                screen.blit(ai_text, (WINDOW_SIZE[0] - 340, 70))
+            
+            if world.game_over:
+                # 显示游戏结果
+                result_font = get_font(72)
+                text_surface = result_font.render(world.game_result, True, WHITE)
+                text_rect = text_surface.get_rect(center=(WINDOW_SIZE[0]//2, WINDOW_SIZE[1]//2))
+                screen.blit(text_surface, text_rect)
+                
+                # 显示重启提示
+                restart_text = font.render("按R键重新开始", True, WHITE)
+                restart_rect = restart_text.get_rect(center=(WINDOW_SIZE[0]//2, WINDOW_SIZE[1]//2 + 50))
+                screen.blit(restart_text, restart_rect)
+            
+            profiler.draw_overlay(screen, (10, WINDOW_SIZE[1] - 240))
+            profiler.lap("draw")
+            pygame.display.flip()
+            profiler.lap("flip")
+        
+        if scheduler.speed is None:
+            clock.tick()  # 尽可能快模式不限制帧率
+        else:
+            clock.tick(60)  # 保持60FPS的基础刷新率
+        profiler.lap("wait")
+        profiler.end_frame()
         
+    if profile_out and profiler.count:
+        paths = profiler.export(profile_out)
+        print(f"Exported frame profile to {', '.join(paths)}")
+    if record:
+        save_recording(world, numbered_path(record, recordings))
+    if monitor is not None:
+        monitor.stop()
+        print(monitor.format_report())
+    if telemetry is not None:
+        telemetry.close()
     pygame.quit()
 
+def view_replay(path, speed=1):
+    # 回放查看器：空格暂停，左右方向键后退/前进10秒，Home/End 跳到开头/结尾，上下方向键调整倍速
+    # 跳转时从最近的关键帧恢复再补上输入，不需要从头重放
+    replay = Replay.load(path, 'te')
+    screen = init_pygame()
+    clock = pygame.time.Clock()
+    world = replay_seek(replay, 0)
+    renderer = ArenaRenderer(world.geometry)
+    font = get_font(24)
+    seek_ticks = TICKS_PER_SECOND * 10
+    accumulator = 0.0
+    paused = False
+    running = True
+    while running:
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+            elif event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_SPACE:
+                    paused = not paused
+                elif event.key == pygame.K_LEFT:
+                    world = replay_seek(replay, max(0, world.tick - seek_ticks))
+                elif event.key == pygame.K_RIGHT:
+                    world = replay_seek(replay, min(replay.length, world.tick + seek_ticks))
+                elif event.key == pygame.K_HOME:
+                    world = replay_seek(replay, 0)
+                elif event.key == pygame.K_END:
+                    world = replay_seek(replay, replay.length)
+                elif event.key == pygame.K_UP:
+                    speed = min(speed * 2, 64)
+                elif event.key == pygame.K_DOWN:
+                    speed = max(speed / 2, 0.25)
+        
+        if not paused:
+            accumulator += speed
+            ticks = int(accumulator)
+            accumulator -= ticks
+            replay_advance(world, replay, min(ticks, replay.length - world.tick))
+        world.events.clear()
+        
+        renderer.draw(screen, world)
+        status = f"Replay {world.tick}/{replay.length}  x{speed:g}"
+        if paused:
+            status += "  PAUSED"
+        if world.game_over:
+            status += f"  {world.game_result}"
+        screen.blit(font.render(status, True, WHITE), (10, WINDOW_SIZE[1] - 30))
+        pygame.display.flip()
+        clock.tick(60)
+    pygame.quit()
+
+def parse_speed(value):
+    return None if value == "max" else float(value)
+
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Tone Evolution")
+    parser.add_argument("--speed", type=parse_speed, default=1,
+                        help="倍速，任意数值或 max（尽可能快）")
+    parser.add_argument("--render-every", type=int, default=1,
+                        help="每隔几个显示帧绘制一次，0表示不绘制")
+    parser.add_argument("--headless", action="store_true",
+                        help="不开窗口，直接以最快速度跑完一局并输出统计")
+    parser.add_argument("--max-ticks", type=int, default=None,
+                        help="无头模式下最多运行的逻辑帧数")
+    parser.add_argument("--no-gunner", action="store_true",
+                        help="无头模式下 Boss 不开火（默认由 EchoGunner 朝回声最强的方向齐射）")
+    parser.add_argument("--event-driven", action="store_true",
+                        help="无头模式下直接跳到下一个事件，而不是逐帧推进")
+    parser.add_argument("--lookahead", type=int, default=0,
+                        help="战士AI向前推演的音波轮数，0表示使用贪心策略")
+    parser.add_argument("--bpm", type=float, default=None,
+                        help="节奏速度，设置后音波随节拍在圆环上停留")
+    parser.add_argument("--planner-budget", type=float, default=4,
+                        help="窗口模式下每个显示帧留给战士规划的毫秒数，0表示每轮音波开始时同步规划完")
+    parser.add_argument("--rings", type=int, default=6,
+                        help="圆环数量")
+    parser.add_argument("--ring-spacing", type=float, default=None,
+                        help="相邻圆环的间距，默认50；窗口模式下圆环太多时自动缩小以放进窗口")
+    parser.add_argument("--profile", action="store_true",
+                        help="启动时就打开分阶段耗时统计（游戏中按F3开关、F4导出）")
+    parser.add_argument("--profile-out", default=None,
+                        help="耗时统计导出文件名前缀，设置后退出时自动导出")
+    parser.add_argument("--params", default=None,
+                        help="策略参数 JSON 文件（te_optimize.py --out 的输出）")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="随机种子，相同的种子和输入得到相同的对局")
+    parser.add_argument("--record", default=None,
+                        help="把对局录成回放文件（多局时依次编号）")
+    parser.add_argument("--replay", default=None,
+                        help="播放回放文件；与 --headless 一起使用时从头重放并校验结果")
+    parser.add_argument("--alloc", action="store_true",
+                        help="统计每帧的内存分配和垃圾回收（按性能分析的阶段），退出时打印报告")
+    parser.add_argument("--alloc-budget", type=int, default=None,
+                        help="每帧内存分配预算（字节），报告里统计超出预算的帧数；隐含 --alloc")
+    parser.add_argument("--telemetry", default=None,
+                        help="把音符收集、旋律冲击波、Boss伤害等对局事件写入该文件（.jsonl 或 .db）")
+    args = parser.parse_args()
+    if args.replay:
+        if args.headless:
+            DEBUG_LOG = False
+            matched, ticks, tps = verify_replay(Replay.load(args.replay, 'te'))
+            print(f"{'MATCHED' if matched else 'DIVERGED'} after {ticks} ticks ({tps:.0f} ticks/s)")
+            raise SystemExit(0 if matched else 1)
+        view_replay(args.replay, args.speed or 1)
+        raise SystemExit
+    params = load_params(args.params)
+    ring_spacing = args.ring_spacing
+    if ring_spacing is None:
+        ring_spacing = 50 if args.headless else min(50, (min(WINDOW_SIZE) // 2 - 20) / args.rings)
+    geometry = make_arena(args.rings, ring_spacing)
+    if args.headless:
+        DEBUG_LOG = False
+        world = World(geometry, planner=make_planner(args.lookahead),
+                      tempo_map=make_tempo_map(args.bpm), params=params, seed=args.seed,
+                      gunner=make_gunner(not args.no_gunner))
+        if args.record:
+            start_recording(world, args.lookahead, args.bpm)
+        telemetry = Telemetry(args.telemetry) if args.telemetry else None
+        if telemetry is not None:
+            start_telemetry(world, telemetry, args.lookahead, args.bpm)
+        ticks, steps, tps = run_headless(world, args.max_ticks, args.event_driven)
+        print(f"{world.game_result or 'UNFINISHED'} after {ticks} ticks "
+              f"({steps} steps, {tps:.0f} ticks/s)")
+        if args.record:
+            save_recording(world, args.record)
+        if telemetry is not None:
+            telemetry.close()
+    else:
+        main(args.speed, args.render_every, args.lookahead, args.bpm, geometry,
+             args.planner_budget / 1000, params, args.profile, args.profile_out,
+             args.seed, args.record, args.telemetry, args.alloc, args.alloc_budget)
@@ -0,0 +1,186 @@
+import argparse
+import hashlib
+import json
+import os
+import random
+import time
+
+import te
+
+# 每个参数的搜索范围，顺序与 te.StrategyParams.NAMES 一致；阈值和保留能量只取整数
+PARAM_BOUNDS = (
+    (10, 120), (10, 120), (10, 120),  # join_thresholds
+    (0.5, 3.0), (0.5, 3.0), (0.5, 3.0),  # ring_weight_scales
+    (0, 30), (0, 30), (0, 30),  # min_reserves
+)
+INTEGER_PARAMS = {0, 1, 2, 6, 7, 8}
+
+
+def normalize(vector):
+    # 限制在搜索范围内并统一精度，保证同一组参数总是得到同一个哈希
+    values = []
+    for i, (value, (low, high)) in enumerate(zip(vector, PARAM_BOUNDS)):
+        value = min(max(value, low), high)
+        values.append(int(round(value)) if i in INTEGER_PARAMS else round(float(value), 3))
+    return values
+
+
+def param_hash(vector, roster, max_ticks, gunner=True):
+    # 参数和对局设置一起决定评估结果，都计入哈希
+    key = json.dumps({"params": normalize(vector), "roster": list(roster), "max_ticks": max_ticks,
+                      "gunner": gunner}, sort_keys=True)
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+
+def match_score(winner, ticks, boss_health, max_ticks):
+    # 战士获胜得 1~2 分（越快越高），平局按对Boss造成的伤害得 0~1 分，Boss获胜 -1 分
+    if winner == "warriors":
+        return 2 - ticks / max_ticks
+    if winner == "boss":
+        return -1.0
+    return (200 - boss_health) / 200
+
+
+def play_match(job):
+    # 在工作进程中用给定参数无头跑完一局
+    vector, seed, roster, max_ticks, gunner = job
+    te.DEBUG_LOG = False
+    world = te.World(roster=roster, params=te.StrategyParams.from_vector(vector), seed=seed,
+                     gunner=te.make_gunner(gunner))
+    while not world.game_over and world.tick < max_ticks:
+        world.advance(max_ticks - world.tick)
+    return {
+        "hash": param_hash(vector, roster, max_ticks, gunner),
+        "seed": seed,
+        "params": normalize(vector),
+        "winner": world.winner or "draw",
+        "ticks": world.tick,
+        "boss_health": world.boss.health,
+        "score": match_score(world.winner, world.tick, world.boss.health, max_ticks),
+    }
+
+
+class EvalCache:
+    # 磁盘上的评估缓存：每局结果追加写入 JSONL，按 (参数哈希, 种子) 查找
+    # 重新运行时先读入已有结果，中断后可以接着搜索
+    def __init__(self, path):
+        self.path = path
+        self.results = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        result = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # 上次中断时写了一半的行
+                    self.results[(result["hash"], result["seed"])] = result
+        self.file = open(path, "a", encoding="utf-8")
+
+    def get(self, key):
+        return self.results.get(key)
+
+    def add(self, result):
+        self.results[(result["hash"], result["seed"])] = result
+        self.file.write(json.dumps(result) + "\n")
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def evaluate(pool, cache, candidates, seeds, roster, max_ticks, gunner=True):
+    # 并行评估所有候选参数，缓存里已有的对局直接复用；返回每组参数的平均得分
+    jobs = []
+    queued = set()
+    for vector in candidates:
+        key_hash = param_hash(vector, roster, max_ticks, gunner)
+        for seed in seeds:
+            if cache.get((key_hash, seed)) is None and (key_hash, seed) not in queued:
+                queued.add((key_hash, seed))
+                jobs.append((normalize(vector), seed, roster, max_ticks, gunner))
+    for result in pool.imap_unordered(play_match, jobs):
+        cache.add(result)
+    scores = []
+    for vector in candidates:
+        key_hash = param_hash(vector, roster, max_ticks, gunner)
+        rows = [cache.get((key_hash, seed)) for seed in seeds]
+        scores.append(sum(r["score"] for r in rows) / len(rows))
+    return scores, len(jobs)
+
+
+def mutate(vector, rng, sigma):
+    # 高斯变异，步长按各参数的搜索范围缩放
+    return normalize(value + rng.gauss(0, sigma * (high - low))
+                     for value, (low, high) in zip(vector, PARAM_BOUNDS))
+
+
+def random_vector(rng):
+    return normalize(rng.uniform(low, high) for low, high in PARAM_BOUNDS)
+
+
+def search(pool, cache, args):
+    # (mu + lambda) 进化搜索：初始种群包含默认参数，每代保留最好的 elite 组参数并变异出下一代
+    rng = random.Random(args.seed)
+    seeds = list(range(args.match_seed, args.match_seed + args.matches))
+    roster = tuple(args.roster)
+    population = [normalize(te.DEFAULT_PARAMS.to_vector())]
+    population += [random_vector(rng) for _ in range(args.population - 1)]
+    ranked = []
+    for generation in range(args.generations):
+        start = time.perf_counter()
+        scores, played = evaluate(pool, cache, population, seeds, roster, args.max_ticks,
+                                  not args.no_gunner)
+        ranked = sorted(zip(scores, population), key=lambda item: -item[0])
+        best_score, best = ranked[0]
+        print(f"gen {generation:>3}: best {best_score:+.3f}  mean {sum(scores) / len(scores):+.3f}  "
+              f"played {played:>4} (cached {len(population) * len(seeds) - played:>4})  "
+              f"{time.perf_counter() - start:.1f}s")
+        elites = [vector for _, vector in ranked[:args.elite]]
+        population = elites + [mutate(rng.choice(elites), rng, args.sigma)
+                               for _ in range(args.population - len(elites))]
+    return ranked
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tone Evolution 策略参数优化（无头、多进程）")
+    parser.add_argument("--generations", type=int, default=10, help="进化代数")
+    parser.add_argument("--population", type=int, default=16, help="每代评估的参数组数")
+    parser.add_argument("--elite", type=int, default=4, help="每代保留的最优参数组数")
+    parser.add_argument("--sigma", type=float, default=0.1, help="变异步长（占搜索范围的比例）")
+    parser.add_argument("--matches", type=int, default=8, help="每组参数评估的对局数")
+    parser.add_argument("--match-seed", type=int, default=0, help="第一局的随机种子")
+    parser.add_argument("--seed", type=int, default=0, help="搜索本身的随机种子")
+    parser.add_argument("--roster", nargs="+", default=list(te.DEFAULT_ROSTER),
+                        choices=te.STRATEGIES, help="战士策略阵容")
+    parser.add_argument("--max-ticks", type=int, default=50000, help="单局最多逻辑帧数，超过判平局")
+    parser.add_argument("--no-gunner", action="store_true",
+                        help="Boss 不开火（默认由 te.EchoGunner 朝回声最强的方向齐射）")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="进程数")
+    parser.add_argument("--cache", default="te_eval_cache.jsonl", help="评估缓存文件（JSONL）")
+    parser.add_argument("--out", default=None, help="把最优参数写入该 JSON 文件，可用 te.py --params 加载")
+    args = parser.parse_args()
+
+    cache = EvalCache(args.cache)
+    print(f"Loaded {len(cache.results)} cached matches from {args.cache}")
+    try:
+        with te.worker_pool(args.workers) as pool:
+            ranked = search(pool, cache, args)
+    finally:
+        cache.close()
+
+    print()
+    print(f"{'score':>7}  params")
+    for score, vector in ranked[:args.elite]:
+        print(f"{score:>+7.3f}  {vector}")
+    best = te.StrategyParams.from_vector(ranked[0][1]).to_dict()
+    print(json.dumps(best, indent=2))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(best, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
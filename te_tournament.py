@@ -0,0 +1,126 @@
+import argparse
+import itertools
+import json
+import os
+import time
+from collections import defaultdict
+
+import te
+
+
+def strategy_mixes(team_size):
+    # 所有不计顺序的策略组合，例如 4 人队伍共 15 种
+    return list(itertools.combinations_with_replacement(te.STRATEGIES, team_size))
+
+
+def play_match(job):
+    # 在工作进程中无头跑完一局，返回结果字典
+    mix, seed, max_ticks, hp_sample_every, lookahead, gunner = job
+    te.DEBUG_LOG = False
+    world = te.World(roster=mix, planner=te.make_planner(lookahead), seed=seed,
+                     gunner=te.make_gunner(gunner))
+    hp_curve = [world.boss.health]
+    while not world.game_over and world.tick < max_ticks:
+        # 事件驱动推进，但不越过下一个采样点，保证血量曲线与逐帧模拟一致
+        next_sample = (world.tick // hp_sample_every + 1) * hp_sample_every
+        world.advance(min(next_sample, max_ticks) - world.tick)
+        if world.tick % hp_sample_every == 0:
+            hp_curve.append(world.boss.health)
+    if hp_curve[-1] != world.boss.health:
+        hp_curve.append(world.boss.health)
+    return {
+        "mix": list(mix),
+        "seed": seed,
+        "winner": world.winner or "draw",
+        "ticks": world.tick,
+        "melody_waves": world.melody_wave_count,
+        "boss_hp_curve": hp_curve,
+    }
+
+
+def build_jobs(team_size, matches, base_seed, max_ticks, hp_sample_every, lookahead=0, gunner=True):
+    jobs = []
+    for mix in strategy_mixes(team_size):
+        for i in range(matches):
+            jobs.append((mix, base_seed + i, max_ticks, hp_sample_every, lookahead, gunner))
+    return jobs
+
+
+def summarize(results):
+    # 战士方共享胜负，无法归到单个策略上，按策略统计的是它所在组合的胜率：
+    # seats 里每个使用该策略的席位记一次（占三席的组合权重是占一席的三倍），
+    # without 是不含该策略的组合的胜率，两者之差才大致反映这个策略的影响
+    by_mix = defaultdict(list)
+    seats = defaultdict(list)
+    without = defaultdict(list)
+    for result in results:
+        mix = tuple(result["mix"])
+        by_mix[mix].append(result)
+        for strategy in mix:
+            seats[strategy].append(result)
+        for strategy in te.STRATEGIES:
+            if strategy not in mix:
+                without[strategy].append(result)
+    return by_mix, seats, without
+
+
+def win_rate(results):
+    wins = sum(1 for r in results if r["winner"] == "warriors")
+    return wins / len(results) if results else 0.0
+
+
+def print_tables(results):
+    by_mix, seats, without = summarize(results)
+    
+    print(f"{'mix':<48} {'matches':>7} {'win%':>6} {'ticks':>8} {'melody':>7}")
+    for mix in sorted(by_mix, key=lambda m: -win_rate(by_mix[m])):
+        rows = by_mix[mix]
+        avg_ticks = sum(r["ticks"] for r in rows) / len(rows)
+        avg_melody = sum(r["melody_waves"] for r in rows) / len(rows)
+        print(f"{','.join(mix):<48} {len(rows):>7} {win_rate(rows) * 100:>5.1f}% "
+              f"{avg_ticks:>8.0f} {avg_melody:>7.1f}")
+    
+    print()
+    print(f"{'strategy':<14} {'seats':>7} {'mix win%':>9} {'without%':>9} {'diff':>7}")
+    for strategy in te.STRATEGIES:
+        rows = seats.get(strategy, [])
+        with_rate = win_rate(rows) * 100
+        without_rate = win_rate(without.get(strategy, [])) * 100
+        print(f"{strategy:<14} {len(rows):>7} {with_rate:>8.1f}% {without_rate:>8.1f}% "
+              f"{with_rate - without_rate:>+6.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tone Evolution 策略锦标赛（无头、多进程）")
+    parser.add_argument("--matches", type=int, default=20, help="每种策略组合的对局数")
+    parser.add_argument("--team-size", type=int, default=4, help="每局战士数量")
+    parser.add_argument("--seed", type=int, default=0, help="第一局的随机种子")
+    parser.add_argument("--max-ticks", type=int, default=100000, help="单局最多逻辑帧数，超过判平局")
+    parser.add_argument("--hp-sample-every", type=int, default=100, help="Boss血量曲线的采样间隔（逻辑帧）")
+    parser.add_argument("--lookahead", type=int, default=0, help="战士AI向前推演的音波轮数")
+    parser.add_argument("--no-gunner", action="store_true",
+                        help="Boss 不开火（默认由 te.EchoGunner 朝回声最强的方向齐射）")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="进程数")
+    parser.add_argument("--out", default="tournament.jsonl", help="逐局结果输出文件（JSONL）")
+    args = parser.parse_args()
+    
+    jobs = build_jobs(args.team_size, args.matches, args.seed,
+                      args.max_ticks, args.hp_sample_every, args.lookahead, not args.no_gunner)
+    print(f"Running {len(jobs)} matches on {args.workers} workers -> {args.out}")
+    
+    results = []
+    start = time.perf_counter()
+    with open(args.out, "w", encoding="utf-8") as out, te.worker_pool(args.workers) as pool:
+        # 结果按完成顺序逐条写入磁盘
+        for result in pool.imap_unordered(play_match, jobs, chunksize=4):
+            out.write(json.dumps(result) + "\n")
+            out.flush()
+            results.append(result)
+    elapsed = time.perf_counter() - start
+    
+    print(f"Finished {len(results)} matches in {elapsed:.1f}s")
+    print_tables(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+import math
+
+import numpy as np
+
+import te
+
+
+class ToneEvolutionVecEnv:
+    # 同时推进 K 个互相独立的竞技场，所有状态都存放在批量 NumPy 数组里：
+    # 音波半径 (K,)、音符 (K, max_notes)、战士圆环/角度/能量 (K, W)、旋律冲击波半径 (K, max_waves)
+    # 一次 step() 推进所有竞技场一个逻辑帧。音波、音符、换环、集体能量和旋律冲击波按 te.World 的规则推进，
+    # 集体能量每次充满都发动一道冲击波，多道冲击波可以同时存在。与 te.World 不同的地方：
+    # - 战士的转向和换环由 actions 决定，不运行 te 的策略 AI
+    # - 没有飞弹，Boss 不开火，也不积累回声能量，战士不会受伤
+    # - 同时存在的冲击波最多 max_waves 道，槽位占满时集体能量保持充满，等有冲击波到达中心后再发动
+    # - 音符由 NumPy 的随机数生成器生成，同一个种子得到的对局与 te.World 不同
+
+    # 每个战士的动作
+    HOLD, TURN_CCW, TURN_CW, RING_IN, RING_OUT = range(5)
+    NUM_ACTIONS = 5
+
+    def __init__(self, num_envs, roster=te.DEFAULT_ROSTER, max_notes=64,
+                 max_ticks=100000, geometry=te.ARENA, seed=None, auto_reset=True,
+                 params=te.DEFAULT_PARAMS, max_waves=4):
+        self.num_envs = num_envs
+        self.num_warriors = len(roster)
+        self.max_notes = max_notes
+        self.max_waves = max_waves
+        self.max_ticks = max_ticks
+        self.auto_reset = auto_reset
+        self.rng = np.random.default_rng(seed)
+
+        # 场地常量
+        self.ring_radii = np.asarray(geometry.ring_radii, dtype=float)
+        self.ring_count = len(self.ring_radii)
+        self.band_low = np.array([low for low, _ in geometry.ring_bands])
+        self.band_high = np.array([high for _, high in geometry.ring_bands])
+        self.max_radius = geometry.max_radius
+        self.note_values = (self.ring_count - 1 - np.arange(self.ring_count)) * 2
+        self.join_thresholds = np.array([params.join_thresholds[s] for s in roster], dtype=float)
+        self.min_reserves = np.array([params.min_reserves[s] for s in roster], dtype=float)
+
+        K, W, N = num_envs, self.num_warriors, max_notes
+        self.tick = np.zeros(K, dtype=np.int64)
+        self.wave_radius = np.zeros(K)
+        self.wave_expanding = np.ones(K, dtype=bool)
+        self.current_ring = np.full(K, -1, dtype=np.intp)
+        self.note_ring = np.zeros((K, N), dtype=np.intp)
+        self.note_angle = np.zeros((K, N))
+        self.note_alive = np.zeros((K, N), dtype=bool)
+        self.ring_note_count = np.zeros((K, self.ring_count), dtype=np.int64)  # 各圆环上的音符数
+        self.warrior_ring = np.zeros((K, W), dtype=np.intp)
+        self.warrior_angle = np.zeros((K, W))
+        self.warrior_energy = np.zeros((K, W))
+        self.cooldown = np.zeros((K, W), dtype=np.int64)
+        self.energized = np.zeros((K, W), dtype=bool)  # 本轮音波是否已给过初始能量
+        self.riding = np.zeros((K, W), dtype=bool)  # 是否搭乘旋律冲击波
+        self.rider_wave = np.full((K, W), -1, dtype=np.intp)  # 搭乘的冲击波槽位，-1 表示没有搭乘
+        self.collective = np.zeros(K)
+        self.boss_health = np.zeros(K)
+        self.melody_active = np.zeros((K, max_waves), dtype=bool)
+        self.melody_radius = np.zeros((K, max_waves))
+        self.melody_launched = np.zeros((K, max_waves), dtype=np.int64)  # 发动时的逻辑帧，决定处理顺序
+        self.melody_count = np.zeros(K, dtype=np.int64)  # 本局发动过的冲击波数
+        self.reset()
+
+    def reset(self, mask=None):
+        # 重置 mask 选中的竞技场（默认全部），返回观测
+        if mask is None:
+            mask = np.ones(self.num_envs, dtype=bool)
+        W = self.num_warriors
+        self.tick[mask] = 0
+        self.wave_radius[mask] = 0
+        self.wave_expanding[mask] = True
+        self.current_ring[mask] = -1
+        self.note_alive[mask] = False
+        self.ring_note_count[mask] = 0
+        self.warrior_ring[mask] = self.ring_count - 1
+        self.warrior_angle[mask] = 2 * math.pi * np.arange(W) / W
+        self.warrior_energy[mask] = 0
+        self.cooldown[mask] = 0
+        self.energized[mask] = False
+        self.riding[mask] = False
+        self.rider_wave[mask] = -1
+        self.collective[mask] = 0
+        self.boss_health[mask] = 200
+        self.melody_active[mask] = False
+        self.melody_count[mask] = 0
+        return self.observe()
+
+    def observe(self):
+        # 返回内部数组的视图，调用方不应修改
+        return {
+            "wave_radius": self.wave_radius,
+            "wave_expanding": self.wave_expanding,
+            "current_ring": self.current_ring,
+            "ring_note_energy": self.ring_note_count * self.note_values,
+            "warrior_ring": self.warrior_ring,
+            "warrior_angle": self.warrior_angle,
+            "warrior_energy": self.warrior_energy,
+            "riding": self.riding,
+            "collective": self.collective,
+            "boss_health": self.boss_health,
+        }
+
+    def step(self, actions=None):
+        # actions: (K, W) 的动作数组，None 表示全部 HOLD
+        # 返回 (观测, 奖励=本帧Boss损失的血量, 是否结束)
+        K = self.num_envs
+        rows = np.arange(K)[:, None]
+        prev_health = self.boss_health.copy()
+        speed = te.Wave.SPEED
+
+        # 音波
+        old_radius = self.wave_radius.copy()
+        expanding = self.wave_expanding.copy()
+        self.wave_radius += np.where(expanding, speed, -speed)
+        crossed = (expanding[:, None] & (old_radius[:, None] < self.band_low) &
+                   (self.wave_radius[:, None] >= self.band_low))
+        if crossed.any():
+            self._spawn_notes(crossed)
+        self.wave_expanding[expanding & (self.wave_radius >= self.max_radius)] = False
+        returned = ~expanding & (self.wave_radius <= 0)
+        self.wave_expanding[returned] = True
+        self.energized[returned] = False
+        in_band = ((self.wave_radius[:, None] >= self.band_low) &
+                   (self.wave_radius[:, None] <= self.band_high))
+        self.current_ring = np.where(in_band.any(axis=1), in_band.argmax(axis=1), -1)
+
+        self._update_melody(rows)
+
+        # 音波经过战士：初始能量和收集音符
+        free = ~self.riding
+        on_ring = free & (self.warrior_ring == self.current_ring[:, None])
+        give = on_ring & ~self.energized
+        self.warrior_energy += 2 * give
+        self.collective += give.sum(axis=1)
+        self.energized |= give
+        self._collect_notes(on_ring)
+
+        # 动作：冷却中的战士只消耗冷却
+        cooling = free & (self.cooldown > 0)
+        self.cooldown[cooling] -= 1
+        ready = free & ~cooling
+        if actions is not None:
+            actions = np.asarray(actions)
+            turn = np.where(actions == self.TURN_CW, 1, np.where(actions == self.TURN_CCW, -1, 0))
+            turn = turn * (ready & on_ring)
+            self.warrior_angle = (self.warrior_angle + turn * te.NoteWarrior.ANGULAR_SPEED) % (2 * math.pi)
+            self._change_rings(actions, ready)
+
+        # 集体能量满时在空闲槽位上发动一道旋律冲击波
+        np.minimum(self.collective, te.NoteWarrior.COLLECTIVE_ENERGY_MAX, out=self.collective)
+        idle = ~self.melody_active
+        launch = np.flatnonzero((self.collective >= te.NoteWarrior.COLLECTIVE_ENERGY_MAX) & idle.any(axis=1))
+        if len(launch):
+            slots = idle[launch].argmax(axis=1)
+            self.melody_active[launch, slots] = True
+            self.melody_radius[launch, slots] = self.max_radius
+            self.melody_launched[launch, slots] = self.tick[launch]
+            self.melody_count[launch] += 1
+            self.collective[launch] = 0
+
+        self.tick += 1
+        reward = prev_health - self.boss_health
+        done = (self.boss_health <= 0) | (self.tick >= self.max_ticks)
+        if self.auto_reset and done.any():
+            self.reset(done)
+        return self.observe(), reward, done
+
+    def _spawn_notes(self, crossed):
+        # 音波首次经过圆环时在圆环上随机生成1-2个音符，音符槽位用完时不再生成
+        # 每帧每个竞技场最多经过一个圆环
+        envs, rings = np.nonzero(crossed)
+        # 稳定排序后每行最前面的就是空槽位
+        slots = np.argsort(self.note_alive[envs], axis=1, kind='stable')[:, :2]
+        counts = self.rng.integers(1, 3, size=len(envs))
+        use = ((np.arange(2) < counts[:, None]) &
+               ~self.note_alive[envs[:, None], slots])
+        envs = np.broadcast_to(envs[:, None], slots.shape)[use]
+        rings = np.broadcast_to(rings[:, None], slots.shape)[use]
+        slots = slots[use]
+        self.note_alive[envs, slots] = True
+        self.note_ring[envs, slots] = rings
+        self.note_angle[envs, slots] = self.rng.uniform(0, 2 * math.pi, len(slots))
+        np.add.at(self.ring_note_count, (envs, rings), 1)
+
+    def _collect_notes(self, on_ring):
+        # 只计算有战士正处在音波上的竞技场
+        candidates = np.flatnonzero(on_ring.any(axis=1))
+        if len(candidates) == 0:
+            return
+        alive = self.note_alive[candidates]
+        diff = np.abs((self.note_angle[candidates][:, None, :] -
+                       self.warrior_angle[candidates][:, :, None] + math.pi)
+                      % (2 * math.pi) - math.pi)
+        reachable = (on_ring[candidates][:, :, None] & alive[:, None, :] &
+                     (self.note_ring[candidates][:, None, :] ==
+                      self.warrior_ring[candidates][:, :, None]) & (diff < 0.2))
+        envs, warriors = np.nonzero(reachable.any(axis=2))
+        if len(envs) == 0:
+            return
+        notes = np.where(reachable, diff, np.inf).argmin(axis=2)[envs, warriors]
+        envs = candidates[envs]
+        # 同一帧多个战士抢同一个音符时，编号小的战士得到
+        _, first = np.unique(envs * self.max_notes + notes, return_index=True)
+        envs, warriors, notes = envs[first], warriors[first], notes[first]
+        rings = self.note_ring[envs, notes]
+        values = self.note_values[rings]
+        self.note_alive[envs, notes] = False
+        np.add.at(self.ring_note_count, (envs, rings), -1)
+        self.warrior_energy[envs, warriors] += values
+        np.add.at(self.collective, envs, values // 2)
+
+    def _change_rings(self, actions, ready):
+        # 跟随音波换环：向内只能在音波收缩时、向外只能在音波扩张时，且需要足够能量
+        step = np.where(actions == self.RING_IN, -1, np.where(actions == self.RING_OUT, 1, 0))
+        target = self.warrior_ring + step
+        valid = ready & (step != 0) & (target >= 0) & (target < self.ring_count)
+        target = np.clip(target, 0, self.ring_count - 1)
+        direction_ok = np.where(step < 0, ~self.wave_expanding[:, None], self.wave_expanding[:, None])
+        cost = self.note_values[target]
+        move = (valid & direction_ok & (self.current_ring[:, None] == target) &
+                (self.warrior_energy >= cost + self.min_reserves))
+        self.warrior_ring = np.where(move, target, self.warrior_ring)
+        self.warrior_energy -= cost * move
+        self.cooldown[move] = 30
+
+    def _update_melody(self, rows):
+        active = self.melody_active
+        if not active.any():
+            return
+        envs = rows[:, 0]
+        old_radius = self.melody_radius.copy()
+        self.melody_radius[active] -= te.Wave.SPEED
+        # 与 te.World 一样按发动顺序处理各道冲击波：同一帧里先发动的先带走战士，
+        # 本帧到达中心后回到外圈的战士要到下一帧才能再加入
+        free = self.rider_wave < 0
+        order = np.argsort(np.where(active, self.melody_launched, np.iinfo(np.int64).max),
+                           axis=1, kind='stable')
+        for rank in range(self.max_waves):
+            slot = order[:, rank]
+            live = active[envs, slot]
+            if not live.any():
+                break
+            radius = self.melody_radius[envs, slot]
+            crossed = (live[:, None] & (old_radius[envs, slot][:, None] > self.ring_radii) &
+                       (radius[:, None] <= self.ring_radii))
+            if crossed.any():
+                # 冲击波经过战士所在圆环：搭乘者获得能量，达到阈值的空闲战士加入
+                at_ring = crossed[rows, self.warrior_ring]
+                self.warrior_energy += 10 * (at_ring & (self.rider_wave == slot[:, None]))
+                join = free & at_ring & (self.rider_wave < 0) & (self.warrior_energy >= self.join_thresholds)
+                self.rider_wave = np.where(join, slot[:, None], self.rider_wave)
+            arrived = live & (radius <= 20)
+            if arrived.any():
+                riders = (self.rider_wave == slot[:, None]) & arrived[:, None]
+                self.boss_health -= (self.warrior_energy * riders).sum(axis=1)
+                self.warrior_ring[riders] = self.ring_count - 1
+                self.warrior_energy[riders] = 0
+                self.rider_wave[riders] = -1
+                self.melody_active[envs[arrived], slot[arrived]] = False
+        self.riding = self.rider_wave >= 0
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="批量推进多个 Tone Evolution 竞技场并测量速度")
+    parser.add_argument("--envs", type=int, default=1000)
+    parser.add_argument("--ticks", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    env = ToneEvolutionVecEnv(args.envs, seed=args.seed)
+    rng = np.random.default_rng(args.seed)
+    start = time.perf_counter()
+    for _ in range(args.ticks):
+        actions = rng.integers(0, env.NUM_ACTIONS, size=(env.num_envs, env.num_warriors))
+        env.step(actions)
+    elapsed = time.perf_counter() - start
+    print(f"{args.envs} arenas x {args.ticks} ticks in {elapsed:.2f}s "
+          f"({args.envs * args.ticks / elapsed:.0f} arena-ticks/s)")
@@ -0,0 +1,267 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque, defaultdict
+
+
+def encode_each(records, encode):
+    # 逐条编码，返回 (编码结果, [(无法编码的记录, 错误)])，一条坏事件不影响同一批的其他事件
+    encoded = []
+    failed = []
+    for record in records:
+        try:
+            encoded.append(encode(record))
+        except (TypeError, ValueError) as error:
+            failed.append((record, error))
+    return encoded, failed
+
+
+class JsonlWriter:
+    # 每个事件一行 JSON；文件超过 max_bytes 时轮转为 path.1、path.2 ...，最多保留 backups 个旧文件
+    # write() 返回字段无法序列化而没有写入的 [(记录, 错误)]
+    def __init__(self, path, max_bytes, backups):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.file = open(path, "a", encoding="utf-8")
+
+    def write(self, records):
+        lines, failed = encode_each(records, lambda record: json.dumps(record, separators=(",", ":")) + "\n")
+        self.file.write("".join(lines))
+        self.file.flush()
+        if self.max_bytes and self.file.tell() >= self.max_bytes:
+            self.file.close()
+            rotate(self.path, self.backups)
+            self.file = open(self.path, "a", encoding="utf-8")
+        return failed
+
+    def close(self):
+        self.file.close()
+
+
+class SqliteWriter:
+    # 写入 SQLite 的 events 表，事件的其余字段存成 JSON；轮转方式与 JsonlWriter 相同
+    # sqlite3 的连接只能在创建它的线程里使用，所以由后台线程创建
+    def __init__(self, path, max_bytes, backups):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.connection = self._connect()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path)
+        connection.execute("CREATE TABLE IF NOT EXISTS events "
+                           "(time REAL, match TEXT, event TEXT, data TEXT)")
+        return connection
+
+    @staticmethod
+    def _row(record):
+        data = dict(record)
+        return (data.pop("time"), data.pop("match"), data.pop("event"),
+                json.dumps(data, separators=(",", ":")))
+
+    def write(self, records):
+        rows, failed = encode_each(records, self._row)
+        with self.connection:
+            self.connection.executemany("INSERT INTO events VALUES (?, ?, ?, ?)", rows)
+        if self.max_bytes and os.path.getsize(self.path) >= self.max_bytes:
+            self.connection.close()
+            rotate(self.path, self.backups)
+            self.connection = self._connect()
+        return failed
+
+    def close(self):
+        self.connection.close()
+
+
+def rotate(path, backups):
+    # path.N-1 -> path.N, ..., path -> path.1，超出 backups 的最旧文件被覆盖
+    if backups <= 0:
+        os.remove(path)
+        return
+    for i in range(backups - 1, 0, -1):
+        if os.path.exists(f"{path}.{i}"):
+            os.replace(f"{path}.{i}", f"{path}.{i + 1}")
+    os.replace(path, f"{path}.1")
+
+
+def make_writer(path, max_bytes, backups):
+    if os.path.splitext(path)[1].lower() in (".db", ".sqlite", ".sqlite3"):
+        return SqliteWriter(path, max_bytes, backups)
+    return JsonlWriter(path, max_bytes, backups)
+
+
+class Telemetry:
+    # 对局数据采集：emit() 只往有界缓冲区里追加一条记录，后台线程定期批量写盘
+    # deque 的 append/popleft 在 CPython 里是原子的，emit() 不加锁、不等待磁盘；
+    # 缓冲区满时（磁盘太慢）丢弃新事件并计数，写入线程之后会补写一条 telemetry_dropped
+    # 写盘出错时这一批事件同样计入丢弃数，写入线程关闭文件、下一次写盘前重新打开；
+    # 字段无法序列化的事件单独丢弃并计数，同一批的其他事件照常写入；
+    # 所有错误都记在 errors 里，写入线程不会因为任何错误退出。
+    # close() 时如果最后一次写盘仍然失败（之后没有成功写入过），抛出这个错误
+    # path 以 .db/.sqlite/.sqlite3 结尾时写入 SQLite，否则写 JSONL
+    def __init__(self, path, capacity=10000, flush_interval=0.25,
+                 max_bytes=10 * 1024 * 1024, backups=5):
+        self.path = path
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.buffer = deque()
+        self.overflowed = 0  # 缓冲区满时丢弃的事件数，只由 emit() 修改
+        self.lost = 0  # 写盘失败丢掉的事件数，只由写入线程修改
+        self.written = 0  # 累计写入的事件数
+        self.errors = deque(maxlen=32)  # 最近的错误 (事件名或 None, 异常)，事件名为无法序列化的那条事件
+        self.match = None  # 当前对局编号，写进每条记录
+        self._reported_drops = 0
+        self._stop = threading.Event()
+        self._ready = threading.Event()
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name="telemetry-writer", daemon=True)
+        self._thread.start()
+        # 等写入线程打开文件，路径不可写时在这里就报错
+        self._ready.wait()
+        if self._error is not None:
+            raise self._error
+
+    def emit(self, event, **fields):
+        if len(self.buffer) >= self.capacity:
+            self.overflowed += 1
+            return
+        fields["time"] = time.time()
+        fields["match"] = self.match
+        fields["event"] = event
+        self.buffer.append(fields)
+
+    def begin_match(self, game, **info):
+        # 开始新的一局，之后的事件都带上这一局的编号
+        self.match = uuid.uuid4().hex[:12]
+        self.emit("match_start", game=game, **info)
+
+    def end_match(self, **summary):
+        self.emit("match_end", **summary)
+
+    @property
+    def dropped(self):
+        # 累计丢弃的事件数
+        return self.overflowed + self.lost
+
+    def _drain(self, writer):
+        # 返回之后使用的写入器；写盘失败时关闭它并返回 None，下次再重新打开
+        records = []
+        buffer = self.buffer
+        while buffer:
+            records.append(buffer.popleft())
+        events = len(records)
+        reported = self._reported_drops
+        dropped = self.dropped
+        if dropped != reported:
+            records.append({"time": time.time(), "match": self.match, "event": "telemetry_dropped",
+                            "count": dropped - reported})
+            self._reported_drops = dropped
+        if not records:
+            return writer
+        try:
+            if writer is None:
+                writer = make_writer(self.path, self.max_bytes, self.backups)
+            failed = writer.write(records)
+        except Exception as error:
+            self._error = error
+            self.errors.append((None, error))
+            self.lost += events
+            # 丢弃记录没有写出去，连同这一批一起在下次补写
+            self._reported_drops = reported
+            if writer is not None:
+                try:
+                    writer.close()
+                except Exception:
+                    pass
+            return None
+        # 写盘成功，之前的写盘错误已经恢复
+        self._error = None
+        for record, error in failed:
+            self.errors.append((record.get("event"), error))
+        # 无法序列化的事件在下一批的 telemetry_dropped 里报告
+        self.lost += len(failed)
+        self.written += len(records) - len(failed)
+        return writer
+
+    def _run(self):
+        try:
+            writer = make_writer(self.path, self.max_bytes, self.backups)
+        except Exception as error:
+            self._error = error
+            self._ready.set()
+            return
+        self._ready.set()
+        try:
+            while not self._stop.wait(self.flush_interval):
+                writer = self._drain(writer)
+            writer = self._drain(writer)
+            # 最后一批里有无法序列化的事件时，再补写一条 telemetry_dropped
+            writer = self._drain(writer)
+        finally:
+            if writer is not None:
+                try:
+                    writer.close()
+                except Exception as error:
+                    self._error = error
+                    self.errors.append((None, error))
+
+    def close(self):
+        # 写完缓冲区里剩下的事件后返回；最后一次写盘失败、之后没能恢复时抛出这个错误
+        self._stop.set()
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+
+
+def read_events(path):
+    # 读取 JSONL 或 SQLite 里的全部事件（不包括轮转出去的旧文件）
+    if os.path.splitext(path)[1].lower() in (".db", ".sqlite", ".sqlite3"):
+        connection = sqlite3.connect(path)
+        try:
+            for time_, match, event, data in connection.execute(
+                    "SELECT time, match, event, data FROM events ORDER BY rowid"):
+                yield {"time": time_, "match": match, "event": event, **json.loads(data)}
+        finally:
+            connection.close()
+        return
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def summarize(events):
+    # 按对局汇总：各类事件数、各类型子弹的射击数、自射恢复的san值、Boss受到的伤害等
+    matches = defaultdict(lambda: defaultdict(int))
+    for record in events:
+        stats = matches[record.get("match")]
+        event = record["event"]
+        stats[event] += 1
+        if event == "shot":
+            stats[f"shot:{record['bullet_type']}:{record['target']}"] += 1
+            if record["target"] == "self" and record.get("san_change", 0) > 0:
+                stats["san_recovered"] += record["san_change"]
+        elif event == "boss_damage":
+            stats["boss_damage_total"] += record["damage"]
+        elif event == "note_pickup":
+            stats["note_energy_total"] += record["value"]
+    return matches
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="汇总对局数据（JSONL 或 SQLite）")
+    parser.add_argument("path")
+    args = parser.parse_args()
+    for match, stats in summarize(read_events(args.path)).items():
+        print(f"match {match}")
+        for key in sorted(stats):
+            print(f"  {key:<28}{stats[key]}")
@@ -0,0 +1,61 @@
+import gc
+
+from alloc_monitor import AllocationMonitor
+
+
+def run_frames(monitor, frames, body):
+    monitor.start()
+    try:
+        for _ in range(frames):
+            monitor.begin_frame()
+            body(monitor)
+            monitor.end_frame()
+    finally:
+        monitor.stop()
+
+
+def test_idle_frames_allocate_nothing_even_when_sampled():
+    def body(monitor):
+        monitor.lap("a")
+        monitor.lap("b")
+
+    monitor = AllocationMonitor(snapshot_every=2, warmup=2)
+    run_frames(monitor, 10, body)
+    report = monitor.report()
+    assert report["alloc_bytes_max"] == 0
+    assert report["sampled_frames"] == 4
+
+
+def test_phase_allocations_are_attributed_to_call_sites():
+    kept = []
+
+    def body(monitor):
+        kept.append([bytearray(1000) for _ in range(10)])  # 分配在 make 阶段
+        monitor.lap("make")
+        kept.clear()
+        monitor.lap("drop")
+
+    monitor = AllocationMonitor(snapshot_every=1)
+    run_frames(monitor, 3, body)
+    sites = monitor.report()["phases"]
+    make = sites["make"]["sites"][0]
+    assert make["site"].startswith("test_alloc_monitor.py:")
+    assert make["bytes"] >= 3 * 10 * 1000
+    assert sum(site["freed_bytes"] for site in sites["drop"]["sites"]) == 0
+    assert any(freed >= 10 * 1000 for (phase, _), (_, _, freed) in monitor.phase_sites.items()
+               if phase == "drop")
+
+
+def test_gc_is_recorded_in_the_phase_it_ran_in():
+    def body(monitor):
+        monitor.lap("quiet")
+        gc.collect()
+        monitor.lap("busy")
+
+    monitor = AllocationMonitor(snapshot_every=0)
+    run_frames(monitor, 2, body)
+    report = monitor.report()
+    assert report["phases"]["busy"]["gc_collections"] >= 2
+    assert report["phases"]["quiet"]["gc_collections"] == 0
+    assert {event["phase"] for event in report["gc_events"]} == {"busy"}
+    assert [event["frame"] for event in report["gc_events"]][:1] == [0]
@@ -0,0 +1,21 @@
+import ddg
+
+
+def test_chunk_freeze_appends_batches_without_rewriting():
+    game = ddg.Game(enemy_count=0, seed=0, world_size=(8000, 8000))
+    chunks = game.chunks
+    chunk = (15, 15)
+    x, y = chunk[0] * chunks.chunk_size + 10, chunk[1] * chunks.chunk_size + 10
+    for i in range(50):
+        chunks.freeze(chunk, [ddg.Enemy(x + i, y, game.get_ticks)])
+        chunks.flush()
+        if i == 0:
+            first_batch = chunks.frozen[chunk][1][0]
+    count, batches = chunks.frozen[chunk]
+    assert count == chunks.frozen_count == 50
+    assert len(batches) == 50 and batches[0] is first_batch
+    # 同一次 stream() 里冻结的还没压缩，也能直接恢复
+    chunks.freeze(chunk, [ddg.Enemy(x + 50, y, game.get_ticks)])
+    enemies = chunks.thaw(chunk, game)
+    assert [enemy.x for enemy in enemies] == [x + i for i in range(51)]
+    assert chunks.frozen_count == 0 and not chunks.frozen and not chunks.pending
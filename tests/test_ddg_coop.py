@@ -0,0 +1,159 @@
+import socket
+import threading
+import time
+
+import pytest
+
+import ddg
+import ddg_coop
+from ddg_coop import BitReader, BitWriter, Command, RELOAD, SHOOT
+
+
+def test_bits_round_trip_across_byte_boundaries():
+    values = [(1, 1), (5, 3), (0x1FF, 9), (-3 & 0xFF, 8), (0xABCD, 16), (0, 2), (1, 1)]
+    writer = BitWriter()
+    for value, width in values:
+        writer.write(value, width)
+    data = writer.getvalue()
+    assert len(data) == (sum(width for _, width in values) + 7) // 8
+    reader = BitReader(data)
+    assert reader.read(1) == 1
+    assert reader.read(3) == 5
+    assert reader.read(9) == 0x1FF
+    assert reader.read_signed(8) == -3
+    assert reader.read(16) == 0xABCD
+    assert reader.read(2) == 0
+    assert reader.read(1) == 1
+
+
+def play(game, ticks):
+    # 1号玩家先装填，然后边向右走边朝左上角射击，2号玩家不动，记下每一帧的状态
+    states = []
+    for seq in range(1, ticks + 1):
+        buttons = RELOAD if seq == 1 else SHOOT if seq % 20 == 0 else 0
+        game.step([[Command(seq, dx=1, buttons=buttons, aim_x=0, aim_y=0)], []])
+        states.append((game.frame, ddg_coop.snapshot_state(game)))
+    return states
+
+
+def test_snapshot_deltas_rebuild_server_state():
+    game = ddg_coop.CoopGame(seed=7)
+    states = play(game, 600)
+    assert any(state["bullets"] for _, state in states)
+    bases = {}
+    base_tick = None
+    sizes = [0, 0]
+    for tick, state in states:
+        base = bases.get(base_tick)
+        data = ddg_coop.encode_snapshot(tick, state, base_tick or 0, base, input_seq=tick)
+        decoded_tick, decoded_base, decoded, matched, input_seq = ddg_coop.decode_snapshot(data, bases)
+        assert (decoded_tick, decoded_base, input_seq) == (tick, base_tick or 0, tick)
+        assert matched and decoded == state
+        if base is not None:
+            sizes[0] += len(data)
+            sizes[1] += len(ddg_coop.encode_snapshot(tick, state))
+        bases[tick] = decoded
+        base_tick = tick
+    # 大部分实体每帧只移动一点，增量快照平均不到同一帧完整快照的六成
+    assert sizes[0] < 0.6 * sizes[1]
+
+
+def test_snapshot_crc_mismatch_and_missing_base():
+    game = ddg_coop.CoopGame(seed=3)
+    (tick, base), (next_tick, state) = play(game, 2)
+    bases = {tick: base}
+    data = ddg_coop.encode_snapshot(next_tick, state, tick, base)
+    # 客户端的基准和服务端不一致时，还原出的状态校验失败
+    wrong = {name: dict(records) for name, records in base.items()}
+    key = next(iter(wrong["players"]))
+    wrong["players"][key] = (0,) + wrong["players"][key][1:]
+    _, _, decoded, matched, _ = ddg_coop.decode_snapshot(data, {tick: wrong})
+    assert decoded is not None and not matched
+    # 基准快照已经丢掉时不还原
+    assert ddg_coop.decode_snapshot(data, {}) == (next_tick, tick, None, False, 0)
+    assert ddg_coop.decode_snapshot(data, bases)[3]
+
+
+def test_server_drops_malformed_packets():
+    server = ddg_coop.CoopServer(port=0, seed=0)
+    try:
+        addr = ("127.0.0.1", 40000)
+        server.handle(ddg_coop.HELLO + bytes((ddg_coop.PROTOCOL_VERSION,)), addr)
+        good = ddg_coop.encode_input(0, [Command(1, dx=1), Command(2, dx=1)])
+        for bad in (ddg_coop.INPUT, good[:-1], good + b"\0", good[:5] + bytes((9,)) + good[6:]):
+            with pytest.raises(ValueError):
+                server.handle(bad, addr)
+        server.handle(good, addr)
+        assert [command.seq for command in server.clients[addr].commands] == [1, 2]
+        # 通过 socket 收到的坏包被丢弃，之后的包照常处理
+        sender = udp_socket()
+        try:
+            target = ("127.0.0.1", server.port)
+            sender.sendto(ddg_coop.INPUT + b"\1\2", target)
+            sender.sendto(ddg_coop.HELLO + bytes((ddg_coop.PROTOCOL_VERSION,)), target)
+            deadline = time.perf_counter() + 2
+            while len(server.clients) < 2 and time.perf_counter() < deadline:
+                server.poll()
+                time.sleep(0.01)
+        finally:
+            sender.close()
+        assert len(server.clients) == 2
+    finally:
+        server.sock.close()
+
+
+def udp_socket():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    sock.settimeout(2)
+    return sock
+
+
+def test_server_rejects_other_protocol_versions():
+    server = ddg_coop.CoopServer(port=0, seed=0)
+    sock = udp_socket()
+    try:
+        sock.sendto(ddg_coop.HELLO + bytes((ddg_coop.PROTOCOL_VERSION + 1,)), ("127.0.0.1", server.port))
+        time.sleep(0.05)
+        server.poll()
+        server.link.flush()
+        assert sock.recvfrom(64)[0] == ddg_coop.VERSION + bytes((ddg_coop.PROTOCOL_VERSION,))
+        assert not server.clients
+    finally:
+        sock.close()
+        server.sock.close()
+
+
+def test_client_reports_version_mismatch():
+    # 假的服务端对 HELLO 回一个不同的协议版本
+    sock = udp_socket()
+
+    def answer():
+        _, addr = sock.recvfrom(64)
+        sock.sendto(ddg_coop.VERSION + bytes((ddg_coop.PROTOCOL_VERSION + 1,)), addr)
+
+    thread = threading.Thread(target=answer)
+    thread.start()
+    client = ddg_coop.CoopClient(port=sock.getsockname()[1])
+    try:
+        with pytest.raises(ConnectionError, match="protocol version"):
+            client.connect(timeout=2)
+    finally:
+        thread.join()
+        client.sock.close()
+        sock.close()
+
+
+def test_ids_wrap_around_live_entities():
+    game = ddg_coop.CoopGame(seed=0)
+    live = [enemy.id for enemy in game.enemies]
+    assert live == [1, 2, 3]
+    game.next_id = 0xFFFF
+    entities = [ddg.Enemy(0, 0, game.get_ticks) for _ in range(3)]
+    for enemy in entities:
+        game._assign_id(enemy)
+        game.enemies.append(enemy)
+    # 0xFFFF 之后回到 1，跳过仍在场上的 1、2、3
+    assert [enemy.id for enemy in entities] == [0xFFFF, 4, 5]
+    ids = [enemy.id for enemy in game.enemies]
+    assert len(set(ids)) == len(ids)
@@ -0,0 +1,52 @@
+import pygame
+
+from san_effect import SanEffect
+
+
+def test_bands_are_built_once_and_reused():
+    effect = SanEffect()
+    surface = pygame.Surface((80, 60), depth=32)
+    assert SanEffect.band_of(60) is None
+    assert SanEffect.band_of(59.9) == 5 and SanEffect.band_of(50) == 5
+    assert SanEffect.band_of(49) == 4 and SanEffect.band_of(-5) == 0
+
+    surface.fill((255, 0, 0))
+    effect.apply(surface, 80, 0)
+    assert surface.get_at((40, 30))[:3] == (255, 0, 0)
+    assert effect.builds == 0
+
+    for san, now in ((55, 0), (52, 700), (59, 1400)):
+        effect.apply(surface, san, now)
+    assert effect.builds == 1
+    effect.apply(surface, 45, 0)
+    effect.apply(surface, 55, 0)
+    assert effect.builds == 2 and set(effect.bands) == {4, 5}
+
+    # 画面尺寸变化后缓存作废，重新生成
+    effect.apply(pygame.Surface((40, 30), depth=32), 55, 0)
+    assert effect.builds == 3 and set(effect.bands) == {5}
+
+
+def test_lowest_band_desaturates_toward_gray():
+    effect = SanEffect()
+    surface = pygame.Surface((80, 60), depth=32)
+    surface.fill((255, 0, 0))
+    effect.apply(surface, 0, 0)
+    red, green, blue = surface.get_at((40, 30))[:3]
+    # 中心不受暗角影响，只剩一成的饱和度
+    assert abs(red - 94) <= 2 and abs(green - 69) <= 2 and abs(blue - 69) <= 2
+    corner = surface.get_at((0, 0))
+    assert corner[0] < red // 2
+
+
+def test_mildest_band_keeps_full_color_precision():
+    effect = SanEffect()
+    surface = pygame.Surface((80, 60), depth=32)
+    surface.fill((201, 77, 13))
+    effect.apply(surface, 55, 0)
+    # 最弱一档不查表，中心像素不经过5位量化，保持原色
+    assert effect.bands[5].lut is None
+    assert surface.get_at((40, 30))[:3] == (201, 77, 13)
+    effect.apply(surface, 45, 0)
+    assert effect.bands[4].lut is not None
+    assert surface.get_at((40, 30))[:3] != (201, 77, 13)
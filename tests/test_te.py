@@ -0,0 +1,200 @@
+import pygame
+import pytest
+
+import te
+
+te.DEBUG_LOG = False
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_event_driven_run_matches_step_by_step(seed):
+    stepped = te.World(seed=seed)
+    ticks, steps, _ = te.run_headless(stepped, 4000)
+    expected = stepped.state_digest()
+    skipped = te.World(seed=seed)
+    skipped_ticks, skipped_steps, _ = te.run_headless(skipped, 4000, event_driven=True)
+    assert skipped_ticks == ticks
+    assert skipped_steps < steps / 4
+    assert skipped.state_digest() == expected
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_event_driven_skips_missile_flight(seed):
+    # Boss 开火时大部分时间都有飞弹在飞，飞行途中同样要跳过
+    stepped = te.World(seed=seed, gunner=te.EchoGunner())
+    ticks, steps, _ = te.run_headless(stepped, 6000)
+    skipped = te.World(seed=seed, gunner=te.EchoGunner())
+    skipped_ticks, skipped_steps, _ = te.run_headless(skipped, 6000, event_driven=True)
+    assert stepped.gunner.volleys > 0
+    assert skipped_ticks == ticks
+    assert skipped_steps < steps / 5
+    assert skipped.state_digest() == stepped.state_digest()
+    assert skipped.gunner.volleys == stepped.gunner.volleys
+
+
+def test_snapshot_fork_copies_only_on_write():
+    world = te.World(seed=0)
+    te.run_headless(world, 600)
+    snapshot = te.WorldSnapshot.capture(world)
+    assert snapshot.arrays['rings'].tolist() == [e.ring_index for e in world.enemies]
+    rings = snapshot.arrays['rings'].copy()
+    energies = snapshot.arrays['energies'].copy()
+    child = snapshot.fork()
+    assert child.arrays['rings'] is snapshot.arrays['rings']
+    child.step_wave()
+    assert child.wave_id == snapshot.wave_id + 1
+    assert (child.arrays['energies'] == energies + 2).all()
+    # 父快照不受子快照写入的影响
+    assert (snapshot.arrays['rings'] == rings).all()
+    assert (snapshot.arrays['energies'] == energies).all()
+
+
+def test_planner_leaves_snapshot_untouched():
+    world = te.World(seed=1)
+    te.run_headless(world, 600)
+    snapshot = te.WorldSnapshot.capture(world)
+    arrays = {name: array.copy() for name, array in snapshot.arrays.items()}
+    planner = te.LookaheadPlanner(depth=2)
+    ring, _ = planner.plan(snapshot, 0)
+    assert 0 <= ring < world.geometry.ring_count
+    assert planner.branches > 0
+    for name, array in arrays.items():
+        assert (snapshot.arrays[name] == array).all()
+
+
+def test_ring_lookups_at_band_edges():
+    geometry = te.ArenaGeometry((0, 0), (50, 100, 150), 15)
+    assert geometry.ring_at(42.5) == 0 and geometry.ring_at(57.5) == 0
+    assert geometry.ring_at(42.4) is None and geometry.ring_at(57.6) is None
+    assert geometry.ring_at(150) == 2 and geometry.ring_at(200) is None
+    # 跨过的圆环含终点、不含起点，两个方向都一样
+    assert list(geometry.rings_crossed(50, 100)) == [1]
+    assert list(geometry.rings_crossed(49.9, 100)) == [0, 1]
+    assert list(geometry.rings_crossed(100, 50)) == [0]
+    assert list(geometry.rings_crossed(100, 100)) == []
+    assert list(geometry.bands_entered(42.4, 92.5)) == [0, 1]
+    assert list(geometry.bands_entered(42.5, 92.4)) == []
+    assert geometry.next_band_low(42.5) == 92.5
+    assert geometry.next_band_low(142.5) is None
+    assert geometry.prev_band_high(57.5) is None
+    assert geometry.prev_band_high(57.6) == 57.5
+    assert geometry.prev_ring_radius(100) == 50
+    assert geometry.prev_ring_radius(50) is None
+    assert list(geometry.rings_near(100, 50)) == [1]
+    with pytest.raises(ValueError):
+        te.ArenaGeometry((0, 0), (50, 60), 15)
+
+
+
+def test_large_arena_event_driven_matches_step_by_step():
+    geometry = te.make_arena(24, ring_spacing=20)
+    stepped = te.World(geometry, seed=2)
+    te.run_headless(stepped, 3000)
+    expected = stepped.state_digest()
+    skipped = te.World(geometry, seed=2)
+    te.run_headless(skipped, 3000, event_driven=True)
+    assert {e.ring_index for e in stepped.enemies} <= set(range(24))
+    assert skipped.state_digest() == expected
+
+
+def test_restored_world_continues_identically():
+    world = te.World(seed=3)
+    te.run_headless(world, 1500)
+    data = world.save_state()
+    digest = world.state_digest()
+    te.run_headless(world, 1500)
+    expected = world.state_digest()
+    restored = te.World.restore_state(data)
+    assert restored.tick == 1500 and restored.state_digest() == digest
+    te.run_headless(restored, 1500)
+    assert restored.state_digest() == expected
+
+
+def test_replay_seek_matches_recorded_ticks():
+    world = te.World(seed=5)
+    world.start_recording(te.Replay('te', keyframe_interval=250))
+    digests = {}
+    while world.tick < 1200 and not world.game_over:
+        if world.tick % 97 == 0:
+            world.fire_volley(world.tick * 0.01)
+        world.step()
+        digests[world.tick] = world.state_digest()
+    replay = world.finish_recording()
+    assert len(replay.keyframe_ticks) > 3 and replay.input_ticks
+    for tick in (1, 249, 250, 613, world.tick):
+        seeked = te.replay_seek(replay, tick)
+        assert seeked.tick == tick
+        assert seeked.state_digest() == digests[tick]
+    # 同一个关键帧可以反复跳转，恢复出的世界互不影响
+    assert te.replay_seek(replay, 613).state_digest() == digests[613]
+    assert te.verify_replay(replay)[0]
+
+
+def test_melody_rider_hit_by_missile_gets_bonus_on_new_ring():
+    world = te.World(seed=0)
+    warrior = world.enemies[0]
+    warrior.ring_index = 2
+    melody_wave = te.MelodyWave(world.boss, world.enemies, world.geometry)
+    melody_wave.add_warrior(warrior)
+
+    # 冲击波还在外圈时，飞弹把搭乘者打到外面一环
+    points = world.warrior_projector.project_objects(world.enemies)
+    world.sector_index.rebuild(world.enemies)
+    missile = te.Missile(0, world.geometry)
+    missile.x, missile.y = points[0]
+    assert missile.check_enemy_collision(world.enemies, world.sector_index, points)
+    assert warrior.ring_index == 3
+
+    energy = warrior.note_energy
+    ring_radii = world.geometry.ring_radii
+    while melody_wave.radius > ring_radii[3]:
+        melody_wave.update({})
+    assert warrior.note_energy == energy + 10
+    health = world.boss.health
+    while melody_wave.active:
+        melody_wave.update({})
+    # 不会再在加入时的圆环上多拿一次
+    assert world.boss.health == health - (energy + 10)
+    assert warrior.melody_wave is None
+
+
+def test_gunner_fires_volleys_in_headless_match():
+    world = te.World(seed=1, gunner=te.EchoGunner())
+    te.run_headless(world, 20000, event_driven=True)
+    assert world.gunner.volleys > 0
+    assert any(enemy.health < 100 for enemy in world.enemies) or world.winner == 'boss'
+
+
+@pytest.fixture
+def mixer():
+    pygame.mixer.quit()
+    yield
+    pygame.mixer.quit()
+    pygame.mixer.pre_init(44100, -16, 2, 512)
+
+
+def test_sound_cache_follows_pre_init(mixer):
+    pygame.mixer.pre_init(22050, -16, 1, 1024)
+    cache = te.SoundCache(6)
+    assert pygame.mixer.get_init() == (22050, -16, 1)
+    assert set(cache.sounds) == ({('beat',), ('melody',), ('hit',)} |
+                                 {('collect', i) for i in range(6)})
+    lengths = {key: pygame.sndarray.array(sound).shape[0] for key, sound in cache.sounds.items()}
+    assert lengths[('beat',)] == int(22050 * 0.03)
+    assert lengths[('collect', 0)] == int(22050 * 0.25)
+    assert lengths[('melody',)] == int(22050 * 0.6)
+    assert lengths[('hit',)] == int(22050 * 0.08)
+    cache.play_events([('beat',), ('beat',)])
+    assert pygame.mixer.get_busy()
+
+
+def test_sound_cache_keeps_compatible_mixer(mixer):
+    pygame.mixer.init(48000, -16, 2)
+    cache = te.SoundCache(3)
+    assert pygame.mixer.get_init() == (48000, -16, 2)
+    assert pygame.sndarray.array(cache.sounds[('hit',)]).shape == (int(48000 * 0.08), 2)
+    # 其他采样格式会按原来的采样率和声道数重新初始化
+    pygame.mixer.quit()
+    pygame.mixer.init(48000, 8, 2)
+    te.SoundCache(3)
+    assert pygame.mixer.get_init() == (48000, -16, 2)
@@ -0,0 +1,41 @@
+import numpy as np
+
+import te
+from te_vec_env import ToneEvolutionVecEnv
+
+
+def test_melody_waves_overlap_and_keep_their_riders():
+    env = ToneEvolutionVecEnv(1, seed=0, auto_reset=False)
+    full = te.NoteWarrior.COLLECTIVE_ENERGY_MAX
+    env.warrior_ring[:] = 4
+    env.warrior_energy[:] = 100
+    env.collective[:] = full
+    env.step()
+    while env.melody_radius[0, 0] > env.ring_radii[4]:
+        env.step()
+    # 第一道冲击波已经经过战士所在的圆环，所有战士都搭了上去
+    assert (env.rider_wave == 0).all()
+    env.collective[:] = full
+    env.step()
+    assert env.melody_active[0].sum() == 2
+    assert env.melody_count[0] == 2
+
+    health = env.boss_health[0]
+    while env.melody_active[0, 0]:
+        env.step()
+    # 第一道冲击波带着全部能量到达中心，第二道经过圆环4时战士都已搭乘，没有人加入
+    assert env.boss_health[0] == health - 400
+    assert env.melody_active[0, 1]
+    assert (env.rider_wave == -1).all() and not env.riding.any()
+    while env.melody_active[0].any():
+        env.step()
+    assert env.boss_health[0] == health - 400
+
+
+def test_random_actions_run():
+    env = ToneEvolutionVecEnv(16, seed=1)
+    rng = np.random.default_rng(1)
+    for _ in range(2000):
+        env.step(rng.integers(0, env.NUM_ACTIONS, size=(env.num_envs, env.num_warriors)))
+    assert (env.melody_active.sum(axis=1) <= env.max_waves).all()
+    assert ((env.rider_wave >= 0) == env.riding).all()
@@ -0,0 +1,82 @@
+import time
+
+import pytest
+
+import telemetry
+from telemetry import Telemetry, read_events
+
+
+class FlakyWriter(telemetry.JsonlWriter):
+    # 前 failures 次写盘时报错，模拟磁盘写满之类的临时故障
+    failures = 1
+
+    def write(self, records):
+        if FlakyWriter.failures:
+            FlakyWriter.failures -= 1
+            raise OSError("disk full")
+        return super().write(records)
+
+
+@pytest.fixture
+def flaky(monkeypatch):
+    opened = []
+
+    def make_writer(path, max_bytes, backups):
+        opened.append(path)
+        return FlakyWriter(path, max_bytes, backups)
+
+    monkeypatch.setattr(telemetry, "make_writer", make_writer)
+    return opened
+
+
+def wait_until(condition):
+    deadline = time.monotonic() + 5
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_write_error_counts_lost_batch_and_reopens(tmp_path, flaky):
+    FlakyWriter.failures = 1
+    path = str(tmp_path / "events.jsonl")
+    sink = Telemetry(path, flush_interval=0.01)
+    for i in range(3):
+        sink.emit("lost", index=i)
+    wait_until(lambda: sink.lost == 3)
+    assert sink.dropped == 3 and sink.lost == 3
+    sink.emit("kept")
+    # 之后的写盘成功了，错误已经恢复，close() 不再抛出
+    sink.close()
+    assert [type(error) for _, error in sink.errors] == [OSError]
+    events = list(read_events(path))
+    assert [e["event"] for e in events] == ["kept", "telemetry_dropped"]
+    assert events[1]["count"] == 3
+    assert sink.written == 2
+    assert len(flaky) == 2  # 写盘失败后重新打开了文件
+
+
+def test_close_raises_unresolved_write_error(tmp_path, flaky):
+    FlakyWriter.failures = 100
+    sink = Telemetry(str(tmp_path / "events.jsonl"), flush_interval=0.01)
+    sink.emit("lost")
+    with pytest.raises(OSError, match="disk full"):
+        sink.close()
+    assert sink.lost == 1
+
+
+@pytest.mark.parametrize("name", ["events.jsonl", "events.db"])
+def test_unserializable_event_is_dropped_alone(tmp_path, name):
+    path = str(tmp_path / name)
+    sink = Telemetry(path, flush_interval=0.01)
+    sink.emit("before")
+    sink.emit("bad", value=object())
+    sink.emit("after")
+    wait_until(lambda: sink.written == 2)
+    # 写入线程还在工作
+    sink.emit("later")
+    sink.close()
+    assert sink.lost == 1 and sink.written == 4
+    assert [event for event, _ in sink.errors] == ["bad"]
+    assert isinstance(sink.errors[0][1], TypeError)
+    events = list(read_events(path))
+    assert [e["event"] for e in events] == ["before", "after", "later", "telemetry_dropped"]
+    assert events[3]["count"] == 1